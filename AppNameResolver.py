@@ -0,0 +1,118 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Callable
+
+import psutil
+from loguru import logger
+
+
+class AppNameResolver:
+    """
+    Resolves human-readable application names (FileDescription from executable's version resource) off the
+    session-created callback path.
+    Names are cached by executable path and its mtime, so every new session of the same app (browser tabs, games)
+    doesn't read version resource again; the cache is persisted to `cache_path` across restarts.
+    `resolve` returns immediately: the cached name or the process name as placeholder, in the latter case the real
+    name gets resolved in worker pool and passed to `on_resolved(pid, process, name)` if it differs from the placeholder.
+    """
+
+    def __init__(
+            self,
+            on_resolved: Callable[[int, psutil.Process, str], None],
+            cache_path: str | None = None,
+            describe: Callable[[str], str] | None = None,
+            workers: int = 2
+    ):
+        """
+        :param on_resolved: Gets called from a worker thread when a name got resolved
+        :param cache_path: json file to persist the cache to, None to keep it in memory only
+        :param describe: Reads description of an executable by its path, `get_app_name.get_file_description` if None
+        :param workers: Size of worker pool
+        """
+        if describe is None:
+            from get_app_name import get_file_description
+            describe = get_file_description
+
+        self._describe = describe
+        self._on_resolved = on_resolved
+        self._cache_path = cache_path
+        self._lock = Lock()
+        self._cache: dict[str, tuple[int, str]] = self._load()  # exe path : (mtime ns, name)
+        self._in_flight: dict[str, list[tuple[int, psutil.Process]]] = dict()  # exe path : sessions waiting for it
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='AppNameResolver')
+
+    def resolve(self, pid: int, process: psutil.Process) -> str:
+        try:
+            exe = process.exe()
+            mtime = os.stat(exe).st_mtime_ns
+
+        except (psutil.Error, OSError):
+            logger.opt(exception=True).debug(f"Couldn't get executable of {process}")
+            return process.name()
+
+        with self._lock:
+            cached = self._cache.get(exe)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+
+            if exe in self._in_flight:
+                self._in_flight[exe].append((pid, process))
+
+            else:
+                self._in_flight[exe] = [(pid, process)]
+                self._pool.submit(self._resolve, exe, mtime)
+
+        return process.name()
+
+    def _resolve(self, exe: str, mtime: int):
+        try:
+            name = self._describe(exe)
+
+        except Exception:
+            logger.opt(exception=True).debug(f"Couldn't get description of {exe}")
+            name = os.path.basename(exe)  # The same as process name, cached so we don't try again
+
+        with self._lock:
+            self._cache[exe] = (mtime, name)
+            self._save()
+            waiting = self._in_flight.pop(exe)
+
+        for pid, process in waiting:
+            try:
+                if name != process.name():
+                    self._on_resolved(pid, process, name)
+
+            except Exception:
+                logger.opt(exception=True).warning(f'on_resolved failed for {pid} {name}')
+
+    def _load(self) -> dict[str, tuple[int, str]]:
+        if self._cache_path is None or not os.path.exists(self._cache_path):
+            return dict()
+
+        try:
+            with open(self._cache_path, 'r', encoding='utf-8') as file:
+                return {exe: (mtime, name) for exe, (mtime, name) in json.load(file).items()}
+
+        except Exception:
+            logger.opt(exception=True).warning(f'Failed to load app names cache {self._cache_path}, starting empty')
+            return dict()
+
+    def _save(self):
+        """Should be called under self._lock"""
+        if self._cache_path is None:
+            return
+
+        tmp_path = self._cache_path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(self._cache, file, ensure_ascii=False)
+
+            os.replace(tmp_path, self._cache_path)
+
+        except OSError:
+            logger.opt(exception=True).warning(f'Failed to save app names cache {self._cache_path}')
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
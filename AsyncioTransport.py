@@ -0,0 +1,280 @@
+import asyncio
+import itertools
+import selectors
+import time
+from threading import Thread, Lock
+from typing import Callable
+
+from loguru import logger
+
+import Events
+from TransportABC import TransportABC
+from Metrics import metrics
+
+_device_events = (Events.DeviceAdded, Events.DeviceRemoved, Events.EndpointVolumeChanged, Events.EndpointMuteChanged)
+
+
+def _pending_key(msg: Events.ServerToClientEvent) -> tuple[int | str, ...]:
+    """
+    Key of `_Client.pending`: the event supersedes a pending one of the same kind of the same process, device or,
+    for `SessionAdded` and `SessionRemoved`, session of the process
+    """
+    if isinstance(msg, _device_events):  # They all have PID -1
+        return msg.device_id, msg.event
+
+    if isinstance(msg, (Events.SessionAdded, Events.SessionRemoved)):
+        return msg.PID, msg.event, msg.session_id
+
+    return msg.PID, msg.event
+
+
+class _Client:
+    """Per connection state of `AsyncioTransport`"""
+
+    def __init__(self, client_id: int, writer: asyncio.StreamWriter):
+        self.client_id = client_id
+        self.writer = writer
+        self.peername = writer.get_extra_info('peername')
+        # Events the client didn't manage to receive while its buffer was full, `_pending_key` -> encoded event.
+        # Only the last value of every kind of event is kept, so it's bounded by sessions and devices count
+        self.pending: dict[tuple[int | str, ...], bytes] = dict()
+        self.flusher: asyncio.Task | None = None
+        self.handler: asyncio.Task | None = None
+        self.sent_bytes, self.sends, self.send_seconds = (
+            counter.labels(str(client_id))
+            for counter in (metrics.client_sent_bytes, metrics.client_sends, metrics.client_send_seconds)
+        )
+
+    def write(self, data: bytes):
+        started = time.perf_counter()
+        self.writer.write(data)
+        self.send_seconds.inc(time.perf_counter() - started)
+        self.sends.inc()
+        self.sent_bytes.inc(len(data))
+
+
+class AsyncioTransport(TransportABC):
+    """
+    TCP json lines transport (the same protocol as `NetworkTransport`) on asyncio streams.
+    Every client has a bounded outbound buffer, so one slow client doesn't hold up broadcasts to others:
+    if a client's buffer overflows, it is either disconnected or further events to it get coalesced
+    (see `overflow_policy`) until the client reads out its buffer.
+    Events sent between two iterations of the loop are written to every client with one write.
+    Broadcasts skip filtered clients (see `set_filtered`) as they were at the moment of `send`.
+    asyncio loop runs in its own thread, so `selector` of `ServerSideView` isn't used.
+    """
+
+    host = 'localhost'
+    port = 54683
+    max_buffer_bytes = 64 * 1024  # Per client
+    overflow_policy = 'coalesce'  # or 'disconnect'
+    shutdown_timeout = 2.0  # Seconds to wait for handlers of clients to finish on shutdown
+
+    def __init__(self, rcv_callback: Callable[[Events.ClientToServerEvent], None], selector: selectors.BaseSelector):
+        self.view_rcv_callback = rcv_callback
+        self._clients: dict[int, _Client] = dict()  # client_id : client
+
+        # Encoded events which `send` and `send_to` pass to the loop thread as (client_id or, for broadcasts, ids of
+        # filtered clients, event, encoded event), `_broadcast` is scheduled when it becomes non-empty
+        self._outbox: list[tuple[int | frozenset[int], Events.ServerToClientEvent, bytes]] = list()
+        self._outbox_lock = Lock()
+        self._filtered: frozenset[int] = frozenset()  # Replaced, not modified, as entries of `_outbox` refer to it
+
+        self._loop = asyncio.new_event_loop()
+        self._server: asyncio.Server = self._loop.run_until_complete(
+            asyncio.start_server(self._on_client_connected, self.host, self.port, backlog=100)
+        )
+        self._thread = Thread(target=self._loop.run_forever, name='AsyncioTransport', daemon=True)
+        self._thread.start()
+
+    def send(self, msg: Events.ServerToClientEvent):
+        """This method gets called by `ServerSideView` when it wants to send a message to the client"""
+        self._put_to_outbox([(self._filtered, msg, Events.encode_event(msg))])
+
+    def send_to(self, client_id: int, msgs: list[Events.ServerToClientEvent], is_state: bool = False) -> bool:
+        if client_id not in self._clients:
+            return False
+
+        self._put_to_outbox([(client_id, msg, Events.encode_event(msg)) for msg in msgs])
+        return True
+
+    def set_filtered(self, client_id: int, is_filtered: bool) -> bool:
+        with self._outbox_lock:  # `_close_client` replaces it from the loop thread
+            if is_filtered and client_id not in self._clients:
+                return False
+
+            self._filtered = self._filtered | {client_id} if is_filtered else self._filtered - {client_id}
+
+        return True
+
+    def _put_to_outbox(self, entries: list[tuple[int | frozenset[int], Events.ServerToClientEvent, bytes]]):
+        with self._outbox_lock:
+            was_empty = len(self._outbox) == 0
+            self._outbox.extend(entries)
+            if was_empty:
+                self._loop.call_soon_threadsafe(self._broadcast)
+
+    def tick(self):
+        pass
+
+    def client_count(self) -> int:
+        return len(self._clients)
+
+    def shutdown(self):
+        logger.debug(f'AsyncioNet: Shutting down')
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        logger.trace(f'AsyncioNet: Shutdown completed, clients disconnected')
+
+    async def _shutdown(self):
+        self._server.close()
+        handlers = [client.handler for client in self._clients.values()]
+        for client in tuple(self._clients.values()):
+            self._close_client(client, abort=True)  # What a stalled client hasn't read would never be flushed
+
+        try:
+            await asyncio.wait_for(asyncio.gather(*handlers, return_exceptions=True), self.shutdown_timeout)
+
+        except asyncio.TimeoutError:
+            logger.warning(f'AsyncioNet: Handlers of clients have not finished in {self.shutdown_timeout} s')
+
+        await self._server.wait_closed()
+
+    def _broadcast(self):
+        with self._outbox_lock:
+            outbox = self._outbox
+            self._outbox = list()
+
+        # Consecutive entries for the same recipients get written at once
+        for client_id, entries in itertools.groupby(outbox, key=lambda entry: entry[0]):
+            if isinstance(client_id, frozenset):
+                clients = tuple(self._clients.values())
+                if len(client_id) > 0:
+                    clients = tuple(client for client in clients if client.client_id not in client_id)
+
+            elif client_id in self._clients:
+                clients = (self._clients[client_id],)
+
+            else:
+                continue
+
+            self._write([(msg, data) for _, msg, data in entries], clients)
+
+    def _write(self, batch: list[tuple[Events.ServerToClientEvent, bytes]], clients: tuple[_Client, ...]):
+        data = b''.join(encoded for _, encoded in batch)
+        for client in clients:
+            if len(client.pending) > 0:
+                self._coalesce(client, batch)
+
+            elif client.writer.transport.get_write_buffer_size() > self.max_buffer_bytes:
+                if self.overflow_policy == 'disconnect':
+                    logger.warning(f'AsyncioNet: {client.peername} buffer overflow, disconnecting')
+                    self._close_client(client, abort=True)
+
+                else:
+                    logger.debug(f'AsyncioNet: {client.peername} buffer overflow, coalescing')
+                    self._coalesce(client, batch)
+                    client.flusher = asyncio.create_task(self._flush_pending(client))
+
+            else:
+                client.write(data)
+
+    @staticmethod
+    def _coalesce(client: _Client, batch: list[tuple[Events.ServerToClientEvent, bytes]]):
+        """
+        Keep only the latest event of every kind per PID or device. NewSession and SessionClosed supersede everything
+        pending for the PID, DeviceAdded and DeviceRemoved for the device, re-inserting moves an event to the end, so
+        relative order of a PID's or a device's events is preserved
+        """
+        for msg, data in batch:
+            key = _pending_key(msg)
+            if isinstance(msg, (Events.NewSession, Events.SessionClosed, Events.DeviceAdded, Events.DeviceRemoved)):
+                for pending_key in [pending_key for pending_key in client.pending if pending_key[0] == key[0]]:
+                    del client.pending[pending_key]
+
+            client.pending.pop(key, None)
+            client.pending[key] = data
+
+    async def _flush_pending(self, client: _Client):
+        try:
+            while len(client.pending) > 0:
+                await client.writer.drain()
+                data = b''.join(client.pending.values())
+                client.pending.clear()
+                client.write(data)
+
+        except ConnectionError:
+            self._close_client(client)
+
+        finally:
+            client.flusher = None
+
+    async def _on_client_connected(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        client = _Client(next(self._client_id_counter), writer)
+        client.handler = asyncio.current_task()
+        logger.debug(f'AsyncioNet: Accepted {client.peername}')
+        writer.transport.set_write_buffer_limits(high=self.max_buffer_bytes)
+        self._clients[client.client_id] = client
+        self.view_rcv_callback(Events.NewClient(-1, client.client_id))
+
+        try:
+            async for line in reader:
+                line = line.strip()
+                if len(line) == 0:
+                    continue
+
+                try:
+                    event = Events.decode_client_event(line)
+                    if isinstance(event, Events.SetProtocol):
+                        logger.warning(f'AsyncioNet: {client.peername} requested {event.protocol}, only json is supported')
+                        continue
+
+                    if isinstance(event, Events.Subscribe):
+                        event = Events.Subscribe(-1, event.pids, event.names, event.events, client.client_id)
+
+                    elif isinstance(event, Events.NewClient):  # The client asks for full state again
+                        event = Events.NewClient(-1, client.client_id)
+
+                    elif isinstance(event, Events.Resync):  # The client asks for events it has missed
+                        event = Events.Resync(-1, event.last_seq, event.epoch, client.client_id)
+
+                    logger.trace('Passing msg {} from client {}', event, client.peername)
+                    self.view_rcv_callback(event)
+
+                except Exception:
+                    logger.opt(colors=False, exception=True).warning(f"Couldn't parse message from client: {line}")
+
+        except ConnectionError as e:
+            logger.debug(f'AsyncioNet: Connection to {client.peername} lost: {e}')
+
+        except ValueError:  # Raised by reader on too long line
+            logger.opt(exception=True).warning(f'AsyncioNet: Closing connection to {client.peername} due to error')
+
+        finally:
+            self._close_client(client)
+
+    def _close_client(self, client: _Client, abort: bool = False):
+        """
+        :param abort: Drop what is buffered for the client instead of waiting for it to be written, as `close` does,
+        for a client which doesn't read
+        """
+        if self._clients.pop(client.client_id, None) is None:
+            return
+
+        with self._outbox_lock:
+            self._filtered = self._filtered - {client.client_id}
+
+        logger.debug(f'AsyncioNet: Closing connection to {client.peername}')
+        if client.flusher is not None:
+            client.flusher.cancel()
+
+        if abort:
+            client.writer.transport.abort()
+
+        else:
+            client.writer.close()
+
+        for counter in (metrics.client_sent_bytes, metrics.client_sends, metrics.client_send_seconds):
+            counter.remove(str(client.client_id))
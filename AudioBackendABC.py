@@ -0,0 +1,94 @@
+from abc import ABC, abstractmethod
+from typing import Any
+
+# Backend specific session object, it has to have `ProcessId` (int), `Process` (`psutil.Process` or an object
+# with the same `name()`, `exe()` and `is_running()`, None for system sounds), `State` (int, 0 - inactive,
+# 1 - active, 2 - expired) and `InstanceIdentifier` (str, unique among sessions of a device) attributes, as pycaw's
+# `AudioSession` does
+Session = Any
+
+# Backend specific output device object, it has to have `id` (str) and `FriendlyName` (str) attributes
+Device = Any
+
+# (device id, session instance identifier), identifies a session among sessions of all devices
+SessionKey = tuple[str, str]
+
+
+class AudioBackendABC(ABC):
+    """
+    Source of output devices, their audio sessions and notifications for `AudioController`.
+    Volume is in percents (0 - 100). Notifications can be called from any thread.
+    """
+
+    @abstractmethod
+    def start(self, listener: 'AudioController.AudioController'):
+        """Subscribe to devices changes, the backend should call `listener.on_devices_changed()` when an output
+        device gets added, removed, enabled or disabled"""
+
+    @abstractmethod
+    def stop(self):
+        """Unsubscribe from devices changes, gets called on shutdown"""
+
+    @abstractmethod
+    def get_devices(self) -> list[Device]:
+        """Enumerate currently active output devices"""
+
+    @abstractmethod
+    def get_sessions(self, device: Device) -> list[Session]:
+        """Enumerate currently existing sessions of the device"""
+
+    @abstractmethod
+    def register_device(self, device: Device, listener: 'AudioController.AudioController'):
+        """Subscribe to notifications of the device, the backend should call `listener.on_session_created(device_id,
+        session)` for every new session of the device and `listener.on_endpoint_volume_changed(device_id, new_volume,
+        is_muted)` when the device's master volume or mute changes"""
+
+    @abstractmethod
+    def unregister_device(self, device: Device):
+        """Unsubscribe from notifications of the device"""
+
+    @abstractmethod
+    def register(self, key: SessionKey, session: Session, listener: 'AudioController.AudioController'):
+        """Subscribe to notifications of the session, the backend should call `listener.on_volume_changed(key,
+        new_volume)`, `listener.on_mute_changed(key, new_mute)`, `listener.on_state_changed(key, new_state,
+        new_state_id)` and `listener.on_session_disconnected(key, disconnect_reason, disconnect_reason_id)`"""
+
+    @abstractmethod
+    def unregister(self, session: Session):
+        """Unsubscribe from notifications of the session"""
+
+    @abstractmethod
+    def get_volume(self, session: Session) -> int:
+        pass
+
+    @abstractmethod
+    def set_volume(self, session: Session, volume: int):
+        pass
+
+    @abstractmethod
+    def is_muted(self, session: Session) -> bool:
+        pass
+
+    @abstractmethod
+    def set_mute(self, session: Session, is_muted: bool):
+        pass
+
+    @abstractmethod
+    def get_endpoint_volume(self, device: Device) -> int:
+        """Master volume of the device"""
+
+    @abstractmethod
+    def set_endpoint_volume(self, device: Device, volume: int):
+        pass
+
+    @abstractmethod
+    def is_endpoint_muted(self, device: Device) -> bool:
+        pass
+
+    @abstractmethod
+    def set_endpoint_mute(self, device: Device, is_muted: bool):
+        pass
+
+    @abstractmethod
+    def describe_executable(self, exe: str) -> str:
+        """Human-readable name of an application by path to its executable, may be slow, raise on failure"""
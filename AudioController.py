@@ -1,53 +1,110 @@
-import queue
+import itertools
+import os
+import sys
+import time
+from dataclasses import dataclass
+from typing import Iterable, Sequence
 
-import comtypes
 import psutil
-from pycaw.utils import AudioSession
-from pycaw.callbacks import AudioSessionEvents, AudioSessionNotification
-from pycaw.pycaw import AudioUtilities
 
 import Events
+from AudioBackendABC import AudioBackendABC, Device, Session, SessionKey
 from ServerSideView import ServerSideView
-from queue import Queue, Empty
+from TransportABC import TransportABC
+from NetworkTransport import NetworkTransport
+from queue import Empty
+from threading import Lock
+from BoundedQueue import BoundedQueue
+from WakeupQueue import WakeupQueue
 
 from loguru import logger
-from get_app_name import get_app_name
+from AppNameResolver import AppNameResolver
+from Metrics import metrics, MetricsServer
+from RampScheduler import RampScheduler
+import SharedStateTable
 
 
-class PerSessionCallbacks(AudioSessionEvents):
-    """Passing callbacks calls to AudioController and includes pid to calls"""
+@dataclass
+class SessionCreated:
+    """Internal message, sent by `on_session_created` to main thread via `AudioController.inbound_q`"""
+    device_id: str
+    session: Session
 
-    def __init__(self, pid: int, audio_controller: 'AudioController'):
-        self.pid = pid
-        self.audio_controller = audio_controller
-        self._is_muted: bool | None = None
-        self._volume: int | None = None
 
-    def on_simple_volume_changed(self, new_volume, new_mute, event_context):
-        new_mute = bool(new_mute)
-        new_volume = int(new_volume * 100)
+@dataclass
+class SessionStateChange:
+    """Internal message, sent by `on_state_changed` to main thread via `AudioController.inbound_q`"""
+    key: SessionKey
+    new_state_id: int
 
-        if new_mute != self._is_muted:
-            self._is_muted = new_mute
-            self.audio_controller.on_mute_changed(self.pid, self._is_muted)
 
-        if new_volume != self._volume:
-            self._volume = new_volume
-            self.audio_controller.on_volume_changed(self.pid, self._volume, event_context)
+@dataclass
+class SessionDisconnect:
+    """Internal message, sent by `on_session_disconnected` to main thread via `AudioController.inbound_q`"""
+    key: SessionKey
 
-    def on_state_changed(self, new_state, new_state_id):
-        self.audio_controller.on_state_changed(self.pid, new_state, new_state_id)
 
-    def on_session_disconnected(self, disconnect_reason, disconnect_reason_id):
-        self.audio_controller.on_session_disconnected(self.pid, disconnect_reason, disconnect_reason_id)
+@dataclass
+class DevicesChanged:
+    """Internal message, sent by `on_devices_changed` to main thread via `AudioController.inbound_q`, makes it
+    discover devices and sessions"""
 
 
-class SessionCreateCallback(AudioSessionNotification):
-    def __init__(self, audio_controller: 'AudioController'):
-        self.audio_controller = audio_controller
+@dataclass
+class AppNameResolved:
+    """Internal message, sent by `AppNameResolver` worker to main thread via `AudioController.inbound_q`"""
+    pid: int
+    process: psutil.Process
+    name: str
 
-    def on_session_created(self, new_session):
-        self.audio_controller.on_session_created(new_session)
+
+def outbound_overload_key(msg: Events.Event):
+    """`BoundedQueue.overload_key` for `AudioController.outbound_q`: sessions and devices appearance and disappearance
+    and full state, resync and subscription requests are never dropped, the latest state event of a kind supersedes
+    previous ones"""
+    if isinstance(msg, (Events.NewSession, Events.SessionClosed, Events.SessionAdded, Events.SessionRemoved,
+                        Events.NewClient, Events.Resync, Events.Subscribe, Events.DeviceAdded, Events.DeviceRemoved)):
+        return None
+
+    if isinstance(msg, (Events.EndpointVolumeChanged, Events.EndpointMuteChanged)):
+        return msg.device_id, type(msg)
+
+    return msg.PID, type(msg)
+
+
+def inbound_overload_key(msg: Events.ClientToServerEvent | SessionCreated | SessionStateChange | SessionDisconnect |
+                         DevicesChanged | AppNameResolved):
+    """`BoundedQueue.overload_key` for `AudioController.inbound_q`: sessions creation and expiration, devices changes
+    and batches of PIDs are never dropped, relative commands (increments, toggles) are droppable but don't supersede
+    each other, a set-all command supersedes the previous one"""
+    if isinstance(msg, (SessionCreated, SessionDisconnect, DevicesChanged)):
+        return None
+
+    if isinstance(msg, SessionStateChange) and msg.new_state_id == 2:
+        return None
+
+    if isinstance(msg, (Events.SetVolumes, Events.SetMutes)):
+        return None
+
+    if isinstance(msg, (Events.SetAllVolume, Events.SetAllMute)):
+        return -1, type(msg)
+
+    if isinstance(msg, SessionStateChange):
+        return msg.key, type(msg)
+
+    if isinstance(msg, AppNameResolved):
+        return msg.pid, type(msg)
+
+    if isinstance(msg, Events.SetEndpointVolume):
+        return msg.device_id, type(msg)
+
+    if isinstance(msg, Events.SetEndpointMute):
+        return msg.device_id, None
+
+    if isinstance(msg, (Events.SetVolume, Events.VolumeRamp)):
+        return msg.PID, type(msg)
+
+    return msg.PID, None
 
 
 class AudioController:
@@ -56,18 +113,91 @@ class AudioController:
     vie ServerSideView
     """
 
-    def __init__(self):
-        self.running = True
-        self.per_session_callbacks_class = PerSessionCallbacks
-        self._sessions: dict[int, AudioSession] = dict()  # Mapping pid to session
-
-        self.outbound_q = Queue()  # from AudioController to ServerSideView
-        self.inbound_q = Queue()  # from ServerSideView to AudioController
+    shutdown_check_interval = 1  # Seconds, how long main thread blocks on inbound_q before checking self.running
+    # Next to the executable of a frozen build or next to the sources, not in whatever directory the server is run from
+    app_names_cache_path = os.path.join(
+        os.path.dirname(sys.executable if getattr(sys, 'frozen', False) else os.path.abspath(__file__)),
+        'app_names_cache.json'
+    )
+    queue_size = 4096  # Max items in each of queues between AudioController and ServerSideView
+    queue_policy = 'coalesce'  # What to do when a queue is full, see `BoundedQueue`
+    queue_block_timeout = 0.1  # Seconds, the longest a producer may wait for room in a queue
+    metrics_port: int | None = 54684  # Prometheus text format metrics are served on localhost, None to disable
+    # State of sessions is mirrored to shared memory for local readers, see `SharedStateTable`, None to disable
+    state_table_path: str | None = SharedStateTable.default_path
+    state_table_capacity = 1024  # Processes the state table has slots for, the ones beyond are left out of it
+    ramp_tick = 0.02  # Seconds, how often running volume ramps are stepped
+    reconcile_interval = 10  # Seconds, how often cached volume and mute state are checked against the backend
+
+    def __init__(
+            self,
+            transport_cls: type[TransportABC] | Sequence[type[TransportABC]] = NetworkTransport,
+            coalesce_window: float = 0.005,
+            backend: AudioBackendABC | None = None
+    ):
+        """
+        :param transport_cls: `TransportABC` implementation to serve clients with, or several of them to serve at once
+        :param backend: Source of devices and sessions, `PycawBackend` if None
+        """
+        if backend is None:
+            from PycawBackend import PycawBackend
+            backend = PycawBackend()
 
-        self._state_change_q = Queue()  # A queue for handling state changes as it seems to
-        # work bad with all this logic in callback handler
+        self.running = True
+        self.backend = backend
+        # Sessions of all devices and their indexes, changed by main thread only
+        self._devices: dict[str, Device] = dict()  # Mapping device id to device
+        self._sessions: dict[SessionKey, Session] = dict()
+        self._device_sessions: dict[str, set[SessionKey]] = dict()  # Mapping device id to keys of its sessions
+        # Clients address sessions by PID, a process can have many sessions, its first one goes first
+        self._keys_by_pid: dict[int, list[SessionKey]] = dict()
+        self._session_ids: dict[SessionKey, int] = dict()  # Sessions are told apart on the wire by these ids
+        self._session_id_counter = itertools.count(1)
+        self.ramps = RampScheduler(self.ramp_tick)  # Stepped by main thread, keyed by PID
+        # Volume and mute state of sessions, filled on session creation and kept current by sessions callbacks and own
+        # writes, so reads don't go to the backend. Reconciled with the backend every `reconcile_interval` seconds in
+        # case a notification got lost
+        self._volumes: dict[SessionKey, int] = dict()
+        self._mutes: dict[SessionKey, bool] = dict()
+        self._states: dict[SessionKey, bool] = dict()  # Whether a session is active
+        # Sessions callbacks check the session is still there and write its volume or mute under it, and
+        # `_remove_session` removes the session with its entries under it, so a late callback doesn't bring them back
+        self._cache_lock = Lock()
+        self._next_reconcile = time.monotonic() + self.reconcile_interval
+
+        # from AudioController to ServerSideView
+        self.outbound_q = WakeupQueue(
+            self.queue_size, policy=self.queue_policy, block_timeout=self.queue_block_timeout,
+            overload_key=outbound_overload_key, name='outbound_q', track_dropped=True
+        )
+        # from ServerSideView and from sessions callbacks to AudioController
+        self.inbound_q = BoundedQueue(
+            self.queue_size, policy=self.queue_policy, block_timeout=self.queue_block_timeout,
+            overload_key=inbound_overload_key, name='inbound_q'
+        )
+        # Handling state changes in callback handler seems to work bad, so callbacks put them to inbound_q too,
+        # as `SessionCreated`, `SessionStateChange`, `SessionDisconnect` and `DevicesChanged`
+
+        self.app_name_resolver = AppNameResolver(
+            lambda pid, process, name: self.inbound_q.put(AppNameResolved(pid, process, name)),
+            self.app_names_cache_path,
+            self.backend.describe_executable
+        )
+
+        self.view = ServerSideView(
+            self.outbound_q, self.inbound_q, transport_cls, coalesce_window, self.state_table_path,
+            self.state_table_capacity
+        )
+
+        metrics.add_queue('outbound_q', self.outbound_q)
+        metrics.add_queue('inbound_q', self.inbound_q)
+        self.metrics_server: MetricsServer | None = None
+        if self.metrics_port is not None:
+            try:
+                self.metrics_server = MetricsServer(metrics, 'localhost', self.metrics_port)
 
-        self.view = ServerSideView(self.outbound_q, self.inbound_q)
+            except OSError:
+                logger.opt(exception=True).warning(f'Failed to serve metrics on port {self.metrics_port}')
 
     def shutdown_callback(self, sig, frame):
         """Gets called by signal module as handler"""
@@ -75,78 +205,170 @@ class AudioController:
         self.running = False
 
     def get_process(self, pid: int) -> psutil.Process:
-        return self._sessions[pid].Process
+        return self._sessions[self._keys_by_pid[pid][0]].Process
 
     def perform_discover(self):
+        """
+        Incremental: devices and sessions which have appeared since the previous discovery get registered, ones which
+        have gone get removed, known ones are not touched. Gets called by main thread on start and on devices changes
+        """
         logger.trace('Performing discovering')
-        for session in AudioUtilities.GetAllSessions():
-            logger.trace(f'Checking session {session.Process}')
-            if session.Process is not None:
-                # if session.ProcessId not in self._sessions:
-                logger.debug(f'Discovered session {session.Process}')
-                self.on_session_created(session)
+        devices = {device.id: device for device in self.backend.get_devices()}
+        for device_id in self._devices.keys() - devices.keys():
+            self._remove_device(device_id)
+
+        for device_id, device in devices.items():
+            if device_id not in self._devices:
+                self._add_device(device)
+
+            present = set()
+            for session in self.backend.get_sessions(self._devices[device_id]):
+                logger.trace('Checking session {}', session.Process)
+                if session.Process is None:
+                    continue
+
+                key = (device_id, session.InstanceIdentifier)
+                present.add(key)
+                if key not in self._sessions:
+                    logger.debug('Discovered session {}', session.Process)
+                    self._add_session(device_id, session)
+
+            for key in self._device_sessions[device_id] - present:
+                logger.debug('Session {} has gone', key)
+                self._generic_disconnect(key)
+
+    def on_devices_changed(self):
+        logger.debug('Devices changed')
+        self.inbound_q.put(DevicesChanged())
+
+    def _add_device(self, device: Device):
+        logger.debug('New device {} {}', device.id, device.FriendlyName)
+        self._devices[device.id] = device
+        self._device_sessions[device.id] = set()
+        self.backend.register_device(device, self)
 
-                # else:
-                #     logger.trace(f'Already have session {session.Process} in _sessions')
+        # Notifying
+        self.outbound_q.put(Events.DeviceAdded(-1, device.id, device.FriendlyName))
+        self.outbound_q.put(Events.EndpointVolumeChanged(-1, device.id, self.backend.get_endpoint_volume(device)))
+        self.outbound_q.put(Events.EndpointMuteChanged(-1, device.id, self.backend.is_endpoint_muted(device)))
 
-    def on_session_created(self, new_session: AudioSession):
-        if new_session.Process is not None:
-            logger.debug(f'New session {new_session.Process}')
+    def _remove_device(self, device_id: str):
+        logger.debug('Device {} has gone', device_id)
+        for key in tuple(self._device_sessions[device_id]):
+            self._generic_disconnect(key)
 
-            if new_session.ProcessId in self._sessions:
-                logger.warning(f'Already have session {new_session.Process}, removing it first')
-                self._remove_session_by_pid(new_session.ProcessId)
+        device = self._devices.pop(device_id)
+        del self._device_sessions[device_id]
+        try:
+            self.backend.unregister_device(device)
 
-            self._sessions[new_session.ProcessId] = new_session
-            new_session.register_notification(self.per_session_callbacks_class(new_session.ProcessId, self))
+        except Exception:
+            logger.opt(exception=True).warning(f'Failed to unregister device {device_id}')
 
-            # Notifying
+        # Notifying
+        self.outbound_q.put(Events.DeviceRemoved(-1, device_id))
+
+    def on_endpoint_volume_changed(self, device_id: str, new_volume: int, is_muted: bool):
+        logger.debug('Endpoint volume changed {}: new value: {}, muted: {}', device_id, new_volume, is_muted)
+        # Both come with every notification, `ServerSideView` sends only the one which has changed
+        self.outbound_q.put(Events.EndpointVolumeChanged(-1, device_id, new_volume))
+        self.outbound_q.put(Events.EndpointMuteChanged(-1, device_id, is_muted))
+
+    def on_session_created(self, device_id: str, new_session: Session):
+        """Gets called by the backend, the session is added by main thread"""
+        self.inbound_q.put(SessionCreated(device_id, new_session))
+
+    def _add_session(self, device_id: str, new_session: Session):
+        if new_session.Process is not None:
+            key = (device_id, new_session.InstanceIdentifier)
+            if key in self._sessions:  # Both discovery and notification can bring the same session
+                logger.trace('Already have session {}', key)
+                return
+
+            if device_id not in self._devices:
+                logger.debug('Session {} of unknown device', key)
+                return
+
+            logger.debug('New session {}', new_session.Process)
             pid = new_session.ProcessId
-            self.outbound_q.put(Events.NewSession(pid))
+            session_id = next(self._session_id_counter)
+            self._sessions[key] = new_session
+            self._device_sessions[device_id].add(key)
+            self._session_ids[key] = session_id
+            is_new_process = pid not in self._keys_by_pid
+            self._keys_by_pid.setdefault(pid, list()).append(key)
+            # Notifying before registration, so clients don't get notifications of a session they don't know yet
+            if is_new_process:
+                self.outbound_q.put(Events.NewSession(pid))
+
+            self.outbound_q.put(Events.SessionAdded(pid, session_id, device_id))
+            self.backend.register(key, new_session, self)
+
+            # Read after registration, so a change can't slip between the read and the first notification
+            self._volumes[key] = self.backend.get_volume(new_session)
+            self._mutes[key] = self.backend.is_muted(new_session)
+            self._states[key] = bool(new_session.State)
+
+            # Another session of a known process changes the process' state at most, unchanged state doesn't reach
+            # clients, see `ServerSideView._update_state`
             self.outbound_q.put(Events.VolumeChanged(pid, self.get_volume(pid)))
-            self.outbound_q.put(Events.SetName(pid, get_app_name(new_session.Process)))
+            if is_new_process:
+                self.outbound_q.put(Events.SetName(pid, self.app_name_resolver.resolve(pid, new_session.Process)))
+
             self.outbound_q.put(Events.MuteStateChanged(pid, self.is_muted(pid)))
-            self.outbound_q.put(Events.StateChanged(pid, bool(self._sessions[pid].State)))
+            self.outbound_q.put(Events.StateChanged(pid, self.is_active(pid)))
 
         else:
             logger.debug("None's process session", new_session, new_session.ProcessId)
 
-    def on_volume_changed(self, pid: int, new_volume: int, event_context: 'comtypes.LP_GUID'):
-        logger.debug(f'Volume changed {self.get_process(pid)}: new value: {new_volume}')
-        self.outbound_q.put(Events.VolumeChanged(pid, new_volume))
+    def on_volume_changed(self, key: SessionKey, new_volume: int):
+        logger.debug('Volume changed {}: new value: {}', key, new_volume)
+        with self._cache_lock:
+            session = self._sessions.get(key)
+            if session is None:  # Removed meanwhile
+                return
+
+            self._volumes[key] = new_volume
+
+        pid = session.ProcessId
+        if pid in self.ramps:  # An echo of a ramp step, the volume is reported once the ramp ends
+            return
+
+        self.outbound_q.put(Events.VolumeChanged(pid, self.get_volume(pid)))
+
+    def on_mute_changed(self, key: SessionKey, new_mute: bool):
+        logger.debug('Mute changed {}: new value: {}', key, new_mute)
+        with self._cache_lock:
+            session = self._sessions.get(key)
+            if session is None:
+                return
+
+            self._mutes[key] = new_mute
 
-    def on_mute_changed(self, pid, new_mute: bool):
-        logger.debug(f'Mute changed {self.get_process(pid)}: new value: {new_mute}')
-        self.outbound_q.put(Events.MuteStateChanged(pid, new_mute))
+        self.outbound_q.put(Events.MuteStateChanged(session.ProcessId, self.is_muted(session.ProcessId)))
 
-    def on_state_changed(self, pid: int, new_state: str, new_state_id: int):
+    def on_state_changed(self, key: SessionKey, new_state: str, new_state_id: int):
         """
         There have been some problems with executing some amount of code on callbacks so took it out to main thread and
         in callbacks it only put messages to queue
         """
 
-        logger.debug(f'State changed {self.get_process(pid).name()} {pid} new state: {new_state} {new_state_id}')
-        self._state_change_q.put((pid, new_state_id))
+        logger.debug('State changed {} new state: {} {}', key, new_state, new_state_id)
+        self.inbound_q.put(SessionStateChange(key, new_state_id))
 
-    def _state_change_tick(self):
-        try:
-            msg = self._state_change_q.get_nowait()
-            logger.trace(f'New state message {msg}')
-
-        except Empty:
-            return
+    def _handle_state_change(self, msg: SessionStateChange):
+        logger.trace('New state message {}', msg)
+        if msg.new_state_id == 2:
+            self._generic_disconnect(msg.key)
+            logger.trace('_generic_disconnect call done for {}', msg.key)
 
-        else:
-            pid, new_state_id = msg
-            if new_state_id == 2:
-                self._generic_disconnect(pid)
-                logger.trace(f'_generic_disconnect call done for {pid}')
-
-            else:
-                # Notifying
-                self.outbound_q.put(Events.StateChanged(pid, bool(new_state_id)))
+        elif msg.key in self._sessions:
+            self._states[msg.key] = bool(msg.new_state_id)
+            pid = self._sessions[msg.key].ProcessId
+            # Notifying
+            self.outbound_q.put(Events.StateChanged(pid, self.is_active(pid)))
 
-    def on_session_disconnected(self, pid: int, disconnect_reason, disconnect_reason_id):
+    def on_session_disconnected(self, key: SessionKey, disconnect_reason, disconnect_reason_id):
         """
         Is fired, when the audio session disconnected "hard".
         Mostly on_state_changed == "Expired" is what you are looking for.
@@ -155,109 +377,380 @@ class AudioController:
         NB: expired state id = 2
         """
 
-        logger.info(f'Session disconnected {self.get_process(pid).name()} {pid} {disconnect_reason} {disconnect_reason_id}')
-        self._generic_disconnect(pid)
+        logger.info(f'Session disconnected {key} {disconnect_reason} {disconnect_reason_id}')
+        self.inbound_q.put(SessionDisconnect(key))
 
-    def _generic_disconnect(self, pid: int):
+    def _generic_disconnect(self, key: SessionKey):
         """
-        Session can be disconnected by on_session_disconnected event and by state = expired, this method gets called
-        by both of them.
+        Session can be disconnected by on_session_disconnected event, by state = expired and by its device removal, this
+        method gets called by all of them.
 
-        :param pid:
+        :param key:
         :return:
         """
 
-        process = self.get_process(pid)
-        if process.is_running():
-            logger.warning(f'Process disconnected but still running {process}')
+        session = self._sessions.get(key)
+        if session is None:  # Both events can arrive for the same session
+            logger.trace('Session {} already removed', key)
+            return
 
-        # Notifying
-        self.outbound_q.put(Events.SessionClosed(pid))
-        logger.debug(f'Generic disconnect done')
+        pid = session.ProcessId
+        if session.Process.is_running() and key[0] in self._devices and len(self._keys_by_pid[pid]) == 1:
+            logger.warning(f'Process disconnected but still running {session.Process}')
 
-        self._remove_session_by_pid(pid)
+        session_id = self._session_ids[key]
+        self._remove_session(key)
         logger.debug(f'Removing call done')
 
-    def _remove_session_by_pid(self, pid: int):
-        session = self._sessions[pid]
-        session.unregister_notification()
-        logger.trace(f'Successfully unregistered notification for {session._process}')
-        del self._sessions[pid]
-        logger.trace(f'Removing {pid} done')
-        # print_stack()
-        # return
+        # Notifying
+        self.outbound_q.put(Events.SessionRemoved(pid, session_id))
+        if pid in self._keys_by_pid:  # Other sessions of the process remain
+            self._notify_process(pid)
+
+        else:
+            self.outbound_q.put(Events.SessionClosed(pid))
+
+        logger.debug(f'Generic disconnect done')
+
+    def _remove_session(self, key: SessionKey):
+        session = self._sessions[key]
+        pid = session.ProcessId
+        keys = self._keys_by_pid[pid]
+        keys.remove(key)
+        if len(keys) == 0:
+            del self._keys_by_pid[pid]
+            self.ramps.cancel(pid)
+
+        self.backend.unregister(session)
+        logger.trace('Successfully unregistered notification for {}', session.Process)
+        with self._cache_lock:
+            del self._sessions[key]
+            self._volumes.pop(key, None)
+            self._mutes.pop(key, None)
+
+        del self._session_ids[key]
+        self._device_sessions[key[0]].discard(key)
+        self._states.pop(key, None)
+        logger.trace('Removing {} done', key)
 
     def pre_shutdown(self):
         """Unregister callbacks"""
         logger.trace(f'Entering pre_shutdown')
-        for pid in tuple(self._sessions.keys()):
+        self.backend.stop()
+        for key in tuple(self._sessions.keys()):
             try:
-                self._remove_session_by_pid(pid)
+                self._remove_session(key)
 
             except Exception:
-                logger.opt(exception=True).warning(f'Failed to unregister_notification() for pid {pid}')
+                logger.opt(exception=True).warning(f'Failed to unregister_notification() for session {key}')
+
+        for device in self._devices.values():
+            try:
+                self.backend.unregister_device(device)
+
+            except Exception:
+                logger.opt(exception=True).warning(f'Failed to unregister device {device.id}')
+
+        self.app_name_resolver.shutdown()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
 
         # Notify ServerSideView to stop
-        self.view.running = False
+        self.view.stop()
         self.view.join(1)
         logger.trace(f'pre_shutdown completed')
 
     def set_mute(self, pid: int, is_muted: bool):
-        logger.trace(f'Set mute for {pid} {is_muted=}')
-        self._sessions[pid].SimpleAudioVolume.SetMute(int(is_muted), None)
+        """Sets mute state of every session of the process"""
+        logger.trace('Set mute for {} is_muted={}', pid, is_muted)
+        for key in self._keys_by_pid[pid]:
+            self.backend.set_mute(self._sessions[key], is_muted)
+            self._mutes[key] = is_muted
+
+    # Aggregates of the process' sessions from the cache, they don't call the backend. Can be called by sessions
+    # callbacks meanwhile a session gets added or removed by main thread, so a session without cached state counts as
+    # a silent one
 
     def is_muted(self, pid: int) -> bool:
-        return bool(self._sessions[pid].SimpleAudioVolume.GetMute())
+        """Whether all sessions of the process are muted"""
+        return all(self._mutes.get(key, True) for key in tuple(self._keys_by_pid.get(pid, ())))
+
+    def is_active(self, pid: int) -> bool:
+        """Whether any session of the process is active"""
+        return any(self._states.get(key, False) for key in tuple(self._keys_by_pid.get(pid, ())))
 
     def toggle_mute(self, pid: int):
-        logger.trace(f'Toggle mute for {pid}')
+        logger.trace('Toggle mute for {}', pid)
         is_muted = self.is_muted(pid)
         self.set_mute(pid, not is_muted)
 
     def get_volume(self, pid: int) -> int:
-        logger.trace(f'Get volume for {pid}')
-        return int(self._sessions[pid].SimpleAudioVolume.GetMasterVolume() * 100)
+        """Volume of the loudest session of the process"""
+        keys = tuple(self._keys_by_pid.get(pid, ()))
+        if len(keys) == 1:  # The usual case, called by every volume callback
+            return self._volumes.get(keys[0], 0)
+
+        return max((self._volumes.get(key, 0) for key in keys), default=0)
 
     def set_volume(self, pid: int, volume: int):
+        """Sets volume of every session of the process"""
         # only set volume in the range 0 to 100
         volume = min(100, max(0, volume))
-        volume = float(volume) / 100
-        self._sessions[pid].SimpleAudioVolume.SetMasterVolume(volume, None)
+        for key in self._keys_by_pid[pid]:
+            self.backend.set_volume(self._sessions[key], volume)
+            self._volumes[key] = volume
+
+    def _notify_process(self, pid: int):
+        """Reports aggregated volume, mute and activity of the process, unchanged ones don't reach clients"""
+        self.outbound_q.put(Events.VolumeChanged(pid, self.get_volume(pid)))
+        self.outbound_q.put(Events.MuteStateChanged(pid, self.is_muted(pid)))
+        self.outbound_q.put(Events.StateChanged(pid, self.is_active(pid)))
+
+    def _notify_dropped(self):
+        """
+        Reports current state of processes and devices whose state events `outbound_q` has dropped under overload,
+        once it has recovered, a dropped event may have been the only one to bring the latest state to clients
+        """
+        for pid in self.outbound_q.take_dropped():
+            if pid in self._keys_by_pid:
+                self._notify_process(pid)
+                process = self._sessions[self._keys_by_pid[pid][0]].Process
+                self.outbound_q.put(Events.SetName(pid, self.app_name_resolver.resolve(pid, process)))
+
+            elif pid in self._devices:  # Endpoint events are keyed by device id
+                device = self._devices[pid]
+                self.outbound_q.put(Events.EndpointVolumeChanged(-1, pid, self.backend.get_endpoint_volume(device)))
+                self.outbound_q.put(Events.EndpointMuteChanged(-1, pid, self.backend.is_endpoint_muted(device)))
+
+    def set_endpoint_volume(self, device_id: str, volume: int):
+        self.backend.set_endpoint_volume(self._devices[device_id], min(100, max(0, volume)))
+
+    def set_endpoint_mute(self, device_id: str, is_muted: bool):
+        self.backend.set_endpoint_mute(self._devices[device_id], is_muted)
 
     def increment_volume(self, pid: int, increment: int):
-        logger.trace(f'Increment volume for {pid}, {increment=}')
+        logger.trace('Increment volume for {}, increment={}', pid, increment)
         volume = increment + self.get_volume(pid)
         self.set_volume(pid, volume)
 
+    def set_volumes(self, volumes: Iterable[tuple[int, int]]):
+        """
+        Sets volume of many sessions in one pass, unknown PIDs are skipped. Resulting `VolumeChanged` events are put
+        to `outbound_q` back to back once all sessions are set, so clients get them as one update instead of one by one
+        from sessions callbacks, the callbacks echoes are then dropped by `ServerSideView` as unchanged state
+        """
+        changed = list()
+        for pid, volume in volumes:
+            if pid not in self._keys_by_pid:
+                logger.debug('Skipping unknown process {} in batch', pid)
+                continue
+
+            self._cancel_ramp(pid, report=False)  # The volume is reported below anyway
+            volume = min(100, max(0, volume))
+            self.set_volume(pid, volume)
+            changed.append(Events.VolumeChanged(pid, volume))
+
+        for event in changed:
+            self.outbound_q.put(event)
+
+    def set_mutes(self, mutes: Iterable[tuple[int, bool]]):
+        """The same as `set_volumes` for mute state"""
+        changed = list()
+        for pid, is_muted in mutes:
+            if pid not in self._keys_by_pid:
+                logger.debug('Skipping unknown process {} in batch', pid)
+                continue
+
+            self._cancel_ramp(pid)
+            is_muted = bool(is_muted)
+            self.set_mute(pid, is_muted)
+            changed.append(Events.MuteStateChanged(pid, is_muted))
+
+        for event in changed:
+            self.outbound_q.put(event)
+
+    def start_ramp(self, pid: int, volume: int, duration: float, curve: str):
+        """:param duration: Seconds"""
+        logger.trace('Ramp volume for {} to {} in {} s, curve {}', pid, volume, duration, curve)
+        self.ramps.start(pid, self.get_volume(pid), min(100, max(0, volume)), duration, curve, time.monotonic())
+
+    def _cancel_ramp(self, pid: int, report: bool = True):
+        """
+        Stops a running ramp of the PID and reports volume it has stopped at, as its echoes were suppressed, unless
+        the caller reports the volume it sets
+        """
+        if self.ramps.cancel(pid) and report:
+            self.outbound_q.put(Events.VolumeChanged(pid, self.get_volume(pid)))
+
+    def _step_ramps(self):
+        steps, finished = self.ramps.pop_due(time.monotonic())
+        for pid, volume in steps:
+            try:
+                self.set_volume(pid, volume)
+
+            except Exception:
+                logger.opt(exception=True).warning(f'Failed to step volume ramp of {pid}')
+                self.ramps.cancel(pid)
+
+        for pid in finished:
+            if pid in self._keys_by_pid:
+                self.outbound_q.put(Events.VolumeChanged(pid, self.get_volume(pid)))
+
+    def reconcile(self):
+        """
+        Checks cached volume and mute state of every session against the backend, corrects the cache and notifies
+        clients if they differ, i.e. a notification got lost. Volume of ramping sessions is left to their ramps.
+        State of processes with many sessions is reported again, as callbacks of different sessions can report it
+        out of order, unchanged one doesn't reach clients
+        """
+        changed = {pid for pid, keys in self._keys_by_pid.items() if len(keys) > 1}
+        for key, session in tuple(self._sessions.items()):
+            try:
+                volume = self.backend.get_volume(session)
+                is_muted = self.backend.is_muted(session)
+
+            except Exception:
+                logger.opt(exception=True).debug(f'Failed to reconcile {key}')
+                continue
+
+            pid = session.ProcessId
+            if pid not in self.ramps and volume != self._volumes.get(key, volume):
+                logger.info('Reconciled volume of {}: {} -> {}', key, self._volumes[key], volume)
+                metrics.reconciled.labels('volume').inc()
+                self._volumes[key] = volume
+                changed.add(pid)
+
+            if is_muted != self._mutes.get(key, is_muted):
+                logger.info('Reconciled mute of {}: {} -> {}', key, self._mutes[key], is_muted)
+                metrics.reconciled.labels('mute').inc()
+                self._mutes[key] = is_muted
+                changed.add(pid)
+
+        for pid in changed:
+            if pid in self.ramps:
+                self.outbound_q.put(Events.MuteStateChanged(pid, self.is_muted(pid)))
+
+            else:
+                self._notify_process(pid)
+
     def _inbound_q_tick(self):
+        """
+        Blocks until something arrives to `inbound_q` or the next tick of volume ramps and then handles everything
+        what is in the queue at once, steps ramps and reconciles the cache when it is time to
+        """
+        timeout = self.shutdown_check_interval
+        ramps_timeout = self.ramps.timeout(time.monotonic())
+        if ramps_timeout is not None:
+            timeout = min(timeout, ramps_timeout)
+
         try:
-            event: Events.ClientToServerEvent = self.inbound_q.get(timeout=0.1)
+            batch = [self.inbound_q.get(timeout=timeout)]
 
-        except queue.Empty:
-            return
+        except Empty:
+            batch = list()
 
-        else:
+        while True:
             try:
-                self.get_process(event.PID)
+                batch.append(self.inbound_q.get_nowait())
 
-            except KeyError:
-                logger.warning(f'Event for unknown process {event}')
-                return
+            except Empty:
+                break
+
+        for msg in batch:
+            try:
+                self._handle_inbound(msg)
+
+            except Exception:
+                logger.opt(exception=True).warning(f'Failed to handle {msg}')
+
+        self._step_ramps()
+        self._notify_dropped()
+        if time.monotonic() >= self._next_reconcile:
+            self.reconcile()
+            self._next_reconcile = time.monotonic() + self.reconcile_interval
+
+    def _handle_inbound(self, msg: Events.ClientToServerEvent | SessionCreated | SessionStateChange |
+                        SessionDisconnect | DevicesChanged | AppNameResolved):
+        if isinstance(msg, SessionCreated):
+            self._add_session(msg.device_id, msg.session)
+            return
+
+        if isinstance(msg, SessionStateChange):
+            self._handle_state_change(msg)
+            return
+
+        if isinstance(msg, SessionDisconnect):
+            self._generic_disconnect(msg.key)
+            return
+
+        if isinstance(msg, DevicesChanged):
+            self.perform_discover()
+            return
+
+        if isinstance(msg, AppNameResolved):
+            keys = self._keys_by_pid.get(msg.pid)
+            if keys is not None and self._sessions[keys[0]].Process == msg.process:  # Not closed or replaced meanwhile
+                self.outbound_q.put(Events.SetName(msg.pid, msg.name))
+
+            return
+
+        if isinstance(msg, (Events.SetEndpointVolume, Events.SetEndpointMute)):
+            if msg.device_id not in self._devices:
+                logger.warning(f'Event for unknown device {msg}')
+
+            elif isinstance(msg, Events.SetEndpointVolume):
+                self.set_endpoint_volume(msg.device_id, msg.volume)
+
+            else:
+                self.set_endpoint_mute(msg.device_id, msg.is_muted)
 
-            if isinstance(event, Events.VolumeIncrement):
-                self.increment_volume(event.PID, event.increment)
+            return
 
-            elif isinstance(event, Events.MuteToggle):
-                self.toggle_mute(event.PID)
+        if isinstance(msg, Events.SetVolumes):
+            self.set_volumes(msg.volumes)
+            return
 
-            elif isinstance(event, Events.SetVolume):
-                self.set_volume(event.PID, event.volume)
+        if isinstance(msg, Events.SetMutes):
+            self.set_mutes(msg.mutes)
+            return
+
+        if isinstance(msg, Events.SetAllVolume):
+            self.set_volumes((pid, msg.volume) for pid in tuple(self._keys_by_pid.keys()))
+            return
+
+        if isinstance(msg, Events.SetAllMute):
+            self.set_mutes((pid, msg.is_muted) for pid in tuple(self._keys_by_pid.keys()))
+            return
+
+        event = msg
+        try:
+            self.get_process(event.PID)
+
+        except KeyError:
+            logger.warning(f'Event for unknown process {event}')
+            return
+
+        if isinstance(event, Events.VolumeRamp):
+            self.start_ramp(event.PID, event.volume, event.duration / 1000, event.curve)
+            return
+
+        self._cancel_ramp(event.PID)
+        if isinstance(event, Events.VolumeIncrement):
+            self.increment_volume(event.PID, event.increment)
+
+        elif isinstance(event, Events.MuteToggle):
+            self.toggle_mute(event.PID)
+
+        elif isinstance(event, Events.SetVolume):
+            self.set_volume(event.PID, event.volume)
 
     def start_blocking(self):
-        # self.perform_discover()
         logger.debug(f'Starting blocking')
         self.view.start()
+        if self.metrics_server is not None:
+            self.metrics_server.start()
+
+        self.backend.start(self)
+        self.perform_discover()  # Registers devices, so their sessions notifications start to arrive
         while self.running:
-            # time.sleep(1)
-            self._state_change_tick()
             self._inbound_q_tick()
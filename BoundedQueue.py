@@ -0,0 +1,188 @@
+import time
+from collections import deque
+from queue import Queue
+from typing import Any, Callable, Hashable
+
+from loguru import logger
+
+
+class BoundedQueue(Queue):
+    """
+    `Queue` which never grows beyond `maxsize` and never blocks a producer for longer than `block_timeout`.
+    When it is full, `put` makes room according to `policy`:
+      'drop_oldest' - drops the oldest droppable item of the same PID, or the oldest droppable item at all
+      'coalesce' - drops an item superseded by the new one, if there is none waits up to `block_timeout` for the
+        consumer and then falls back to 'drop_oldest', so the latest state is lost only under sustained overload
+      'block' - waits up to `block_timeout` for the consumer
+    If there is still no room, the new item gets dropped.
+    `overload_key(item)` tells what can be dropped: None for items which the policy never drops (they make room by
+    dropping others or wait for `block_timeout`, i.e. new and closed sessions), `(PID, None)` for droppable items and
+    `(PID, kind)` for droppable items which supersede queued items with the same key.
+    `dropped`, `coalesced` and `high_water` count what happened since start.
+    With `track_dropped`, PIDs (first elements of keys) of dropped items are recorded, so the producer can put their
+    current state again by `take_dropped` once the queue has recovered, as nothing else would bring it.
+    """
+
+    policies = ('drop_oldest', 'coalesce', 'block')
+
+    def __init__(
+            self,
+            maxsize: int = 0,
+            policy: str = 'block',
+            block_timeout: float = 0.1,
+            overload_key: Callable[[Any], tuple[int, Hashable] | None] = lambda item: None,
+            name: str = 'queue',
+            track_dropped: bool = False
+    ):
+        if policy not in self.policies:
+            raise ValueError(f'Unknown overload policy {policy!r}, expected one of {self.policies}')
+
+        super().__init__(maxsize)
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.overload_key = overload_key
+        self.name = name
+
+        self.dropped = 0
+        self.coalesced = 0
+        self.high_water = 0
+        self._overloaded = False  # Warn once per overload, reset when the consumer empties the queue
+        self._dropped_pids: set[Hashable] | None = set() if track_dropped else None
+
+    def put(self, item, block: bool = True, timeout: float | None = None) -> None:
+        """Never raises `Full`, `block` and `timeout` are ignored in favour of `policy` and `block_timeout`"""
+        with self.not_full:
+            if 0 < self.maxsize <= self._qsize() and not self._make_room(item):
+                self.dropped += 1
+                self._on_overload(f'dropping new {item}')
+                key = self.overload_key(item)
+                if self._dropped_pids is not None and key is not None:
+                    self._dropped_pids.add(key[0])
+
+                return
+
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.high_water = max(self.high_water, self._qsize())
+            self.not_empty.notify()
+
+    def _make_room(self, item) -> bool:
+        """Called under self.mutex when the queue is full, returns whether there is room for `item` now"""
+        key = self.overload_key(item)
+        if self.policy == 'coalesce' and key is not None and key[1] is not None:
+            self._build_keys()
+            if self._remove_superseded(key):
+                self.coalesced += 1
+                return True
+
+        if self.policy == 'block':
+            return self._wait_for_room()
+
+        if self.policy == 'coalesce' and self._wait_for_room():
+            return True
+
+        self._build_keys()
+        if self._remove_oldest(None if key is None else key[0]):
+            self.dropped += 1
+            self._on_overload('dropping oldest items')
+            return True
+
+        return self.policy == 'drop_oldest' and self._wait_for_room()  # Only items which are never dropped are queued
+
+    def take_dropped(self) -> set[Hashable]:
+        """
+        PIDs of items dropped since the previous call, once the consumer has emptied the queue after the overload,
+        an empty set while it is still overloaded. Only with `track_dropped`
+        """
+        with self.mutex:
+            if self._overloaded or len(self._dropped_pids) == 0:
+                return set()
+
+            dropped = self._dropped_pids
+            self._dropped_pids = set()
+            return dropped
+
+    def _build_keys(self) -> None:
+        if self._keys is None:
+            self._keys = deque(self.overload_key(queued) for queued in self.queue)
+            self._pids = deque(None if queued_key is None else queued_key[0] for queued_key in self._keys)
+
+    def _wait_for_room(self) -> bool:
+        deadline = time.monotonic() + self.block_timeout
+        while self._qsize() >= self.maxsize:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+
+            self.not_full.wait(remaining)
+
+        return True
+
+    def _remove_superseded(self, key: tuple[int, Hashable]) -> bool:
+        try:
+            self._remove(self._keys.index(key))
+            return True
+
+        except ValueError:
+            return False
+
+    def _remove_oldest(self, pid: int | None) -> bool:
+        """Removes the oldest droppable item of `pid`, or the oldest droppable item if `pid` has none or is None"""
+        i = None
+        if pid is not None:
+            try:
+                i = self._pids.index(pid)
+
+            except ValueError:
+                pass
+
+        if i is None:
+            i = next((i for i, queued_pid in enumerate(self._pids) if queued_pid is not None), None)
+            if i is None:
+                return False
+
+        if self._dropped_pids is not None:
+            self._dropped_pids.add(self._pids[i])
+
+        self._remove(i)
+        return True
+
+    def _remove(self, i: int) -> None:
+        del self.queue[i]
+        del self._keys[i]
+        del self._pids[i]
+        self.unfinished_tasks -= 1
+
+    def _on_overload(self, what: str) -> None:
+        if not self._overloaded:
+            self._overloaded = True
+            logger.warning(f'{self.name} is full ({self.maxsize}), {what}, policy {self.policy}')
+
+    # While the queue is overloaded, overload keys of queued items are kept in deques parallel to self.queue, so
+    # lookups don't call `overload_key` for every queued item. They are built on the first overload and dropped once
+    # the consumer empties the queue, so there is no overhead in normal operation
+    def _init(self, maxsize: int) -> None:
+        super()._init(maxsize)
+        self._keys: deque[tuple[int, Hashable] | None] | None = None
+        self._pids: deque[int | None] | None = None
+
+    def _put(self, item) -> None:
+        super()._put(item)
+        if self._keys is not None:
+            key = self.overload_key(item)
+            self._keys.append(key)
+            self._pids.append(None if key is None else key[0])
+
+    def _get(self):
+        item = super()._get()
+        if self._keys is not None:
+            self._keys.popleft()
+            self._pids.popleft()
+
+        if len(self.queue) == 0:
+            self._keys = self._pids = None
+            if self._overloaded:
+                self._overloaded = False
+                logger.info(f'{self.name} recovered from overload: dropped {self.dropped}, coalesced {self.coalesced}')
+
+        return item
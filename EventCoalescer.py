@@ -0,0 +1,65 @@
+import Events
+
+
+class EventCoalescer:
+    """
+    Collapses bursts of superseding events (i.e. volume changes while a slider is dragged) per PID.
+    The first event of a burst passes immediately and opens a window of `window` seconds, events of the same kind for
+    the same PID arriving within the window replace each other and only the latest one is released when the window
+    ends, so the final value always arrives and at most one event per window is sent.
+    """
+
+    coalesced_events = (Events.VolumeChanged, Events.MuteStateChanged)
+
+    def __init__(self, window: float):
+        self.window = window
+        # (PID, event class) -> (window end, the latest event received within the window or None).
+        # Windows have the same length and get re-inserted when renewed, so the dict is ordered by window end
+        self._windows: dict[tuple[int, type], tuple[float, Events.ServerToClientEvent | None]] = dict()
+
+    def push(self, event: Events.ServerToClientEvent, now: float) -> list[Events.ServerToClientEvent]:
+        """Returns events to send right now"""
+        if self.window <= 0:
+            return [event]
+
+        if not isinstance(event, self.coalesced_events):
+            if isinstance(event, (Events.NewSession, Events.SessionClosed)):
+                self.discard_pid(event.PID)
+
+            return [event]
+
+        key = (event.PID, type(event))
+        if key in self._windows:
+            self._windows[key] = (self._windows[key][0], event)
+            return []
+
+        self._windows[key] = (now + self.window, None)
+        return [event]
+
+    def pop_due(self, now: float) -> list[Events.ServerToClientEvent]:
+        """Returns events which windows have ended, renewing windows for them"""
+        due = list()
+        while len(self._windows) > 0:
+            key, (window_end, pending) = next(iter(self._windows.items()))
+            if window_end > now:
+                break
+
+            del self._windows[key]
+            if pending is not None:
+                due.append(pending)
+                self._windows[key] = (now + self.window, None)
+
+        return due
+
+    def timeout(self, now: float) -> float | None:
+        """How long to wait until the next window ends, None if there are no open windows"""
+        if len(self._windows) == 0:
+            return None
+
+        window_end, _ = next(iter(self._windows.values()))
+        return max(0.0, window_end - now)
+
+    def discard_pid(self, pid: int) -> None:
+        """Pending events of a session which got closed or recreated are superseded"""
+        for key in [key for key in self._windows if key[0] == pid]:
+            del self._windows[key]
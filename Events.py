@@ -1,9 +1,16 @@
-from typing import TypeVar, Generator
-from dataclasses import dataclass, field
+import json
+import struct
+import time
+import typing
+from json.encoder import encode_basestring_ascii
+from typing import TypeVar, Generator, Callable, ClassVar
+from dataclasses import dataclass, field, fields
 from functools import lru_cache
 
 """
-Processes unique identifies by their PIDs.
+Processes unique identifies by their PIDs. A process can have many audio sessions (i.e. on different devices), events
+of a process describe all of them together: volume of the loudest one, muted if all of them are, active if any of them
+is. Commands for a process apply to all of its sessions.
 From server to client events:
 1. New session
     PID
@@ -27,6 +34,44 @@ From server to client events:
     PID
     Name
 
+7. Device added
+    PID (-1)
+    device_id
+    name
+    # An output device, its endpoint volume and mute state follow
+
+8. Device removed
+    PID (-1)
+    device_id
+
+9. Endpoint volume changed
+    PID (-1)
+    device_id
+    new_volume
+    # Master volume of the device
+
+10. Endpoint mute changed
+    PID (-1)
+    device_id
+    is_muted
+
+11. Session added
+    PID
+    session_id: stable for the session's lifetime, unique among existing sessions
+    device_id
+    # A session of the process, the process' first session follows `New session`
+
+12. Session removed
+    PID
+    session_id
+    # `Session closed` follows if it was the last session of the process
+
+13. Synced
+    PID (-1)
+    seq: sequence number of the latest state change the client has got
+    epoch: identifies the server run, sequence numbers of different runs are unrelated
+    # Ends every update and every full state, a client should remember the latest one to resync after a reconnect
+
 From client to server:
 1. Volume increment
     PID
@@ -40,14 +85,90 @@ From client to server:
     new_volume
 
 3. New client
-    *Literally nothing*
+    client_id
     # Set PID to any value
-    # On this event `ServerSideView` should send full state to clients
-    # Note: This event should be sent by Transport, not client itself
+    # On this event `ServerSideView` should send full state to the client
+    # Note: This event should be sent by Transport, not client itself. If a client sends it to get full state again,
+    # Transport replaces client_id with the client's one. A new client should send it (or `Resync`) right after
+    # connecting, otherwise it gets full state once `NetworkTransport.resync_window` passes
+
+4. Set protocol
+    PID (any value)
+    protocol: "json" or "binary"
+    # Handled by Transport itself, switches encoding of the connection in both directions, full state is sent again
+    # in the new encoding
+
+5. Set volumes
+    PID (any value)
+    volumes: list of [PID, new_volume] pairs
+
+6. Set mutes
+    PID (any value)
+    mutes: list of [PID, is_muted] pairs
+
+7. Set all volume
+    PID (any value)
+    volume
+    # Sets volume of every session
+
+8. Set all mute
+    PID (any value)
+    is_muted
+    # Mutes or unmutes every session
+
+9. Volume ramp
+    PID
+    volume: target volume
+    duration: milliseconds
+    curve: "linear", "ease_in", "ease_out" or "ease_in_out"
+    # Smooth fade performed by the server, the session's volume is reported when the ramp ends. Any other command
+    # for the PID cancels its ramp
+
+10. Set endpoint volume
+    PID (any value)
+    device_id
+    volume
+
+11. Set endpoint mute
+    PID (any value)
+    device_id
+    is_muted
+
+12. Resync
+    PID (any value)
+    last_seq: `seq` of the latest `Synced` event the client has got
+    epoch: `epoch` of that event
+    client_id
+    # Sends state changes the client has missed since `last_seq`, or full state as `New client` does if they are not
+    # known anymore or full state is shorter. A reconnecting client should send it right after connecting, see
+    # `NetworkTransport.resync_window`. client_id is set by Transport as for `New client`
+
+13. Subscribe
+    PID (any value)
+    pids: list of PIDs
+    names: list of app name patterns, as in `fnmatch`, case-insensitive
+    events: list of event names
+    client_id
+    # Limits events the client gets to processes with listed PIDs or names matching any of patterns and to listed
+    # events, an empty list doesn't limit. Devices events aren't limited by processes, `Synced` isn't limited at all,
+    # but a client gets it only with updates which have events for it. Replaces the previous subscription, empty
+    # lists subscribe to everything again. A process matched by name is sent as in `New Session` case when its name
+    # gets known. Takes effect for the following events, send it before `New client` or `Resync` to get state
+    # limited the same way. client_id is set by Transport as for `New client`
+
+Batched commands (5 - 8) are applied by `AudioController` in one pass and resulting changes are sent to clients
+together, unknown PIDs in a batch are skipped
 
 Cases:
+0. New device:
+    Send `Device added` event
+    Send `Endpoint volume changed` event
+    Send `Endpoint mute changed` event
+    # Sessions of the device follow as added sessions. When a device gets removed, its sessions get removed first
+
 1. New Session:
     Send `New Session` event
+    Send `Session added` event
     Send `Name Changed` event
     Send `Volume Changed` event
     Send `Mute State Changed` event
@@ -55,86 +176,231 @@ Cases:
     # This set of events fully describes state of a session
 
 2. Session closed:
+    Send `Session removed` event
     Send `Session closed` event
 
+A session of an already known process is announced by `Session added` event alone, followed by the process' volume,
+mute and state events if they change
+
 3. New client:
-    Send events as in `New Session` case
+    Send events as in `New device` case for every device and then as in `New Session` case for every session
+    Send `Synced` event
+
+4. Reconnected client:
+    Send missed events in order they were sent, if any
+    Send `Synced` event
 
 Volume and volume increment as int in range 0 to 100
+
+Wire formats:
+json: every event is a json dictionary of its fields terminated by a new line, it's the default.
+binary: every event is a little-endian struct: uint8 `binary_id` of the event, int32 PID, then fields in order of
+    definition: int as int32, bool as uint8, str as uint16 length of its utf-8 bytes, list as uint16 count of
+    items. Bytes of str fields and items of list fields (packed the same way, i.e. [PID, volume] as two int32, a str
+    as its length and bytes) follow the struct in the same order. Events without str and list fields have fixed size.
 """
 
 
-@dataclass
+@dataclass(slots=True)
 class Event:
     PID: int
     event: str = field(init=False)
+    _encoded: bytes | None = field(default=None, init=False, repr=False, compare=False)  # Cache of `encode_event`
+    _encoded_binary: bytes | None = field(default=None, init=False, repr=False, compare=False)
+    # When the event was created, for callback to wire latency metric
+    _created_at: float = field(default_factory=time.perf_counter, init=False, repr=False, compare=False)
+
+    binary_id: ClassVar[int]  # Identifies event in binary wire format, must never change for existing events
 
     def __post_init__(self):
         self.event = self.__class__.__name__
 
 
-@dataclass
+@dataclass(slots=True)
 class ServerToClientEvent(Event):
     ...
 
 
-@dataclass
+@dataclass(slots=True)
 class ClientToServerEvent(Event):
     ...
 
 
 # Server to Client Events
 
-@dataclass
+@dataclass(slots=True)
 class NewSession(ServerToClientEvent):
-    ...
+    binary_id = 1
 
 
-@dataclass
+@dataclass(slots=True)
 class SessionClosed(ServerToClientEvent):
-    ...
+    binary_id = 2
 
 
-@dataclass
+@dataclass(slots=True)
 class StateChanged(ServerToClientEvent):
+    binary_id = 3
     is_active: bool
 
 
-@dataclass
+@dataclass(slots=True)
 class VolumeChanged(ServerToClientEvent):
+    binary_id = 4
     new_volume: int
 
 
-@dataclass
+@dataclass(slots=True)
 class MuteStateChanged(ServerToClientEvent):
+    binary_id = 5
     is_muted: bool
 
 
-@dataclass
+@dataclass(slots=True)
 class SetName(ServerToClientEvent):
+    binary_id = 6
+    name: str
+
+
+@dataclass(slots=True)
+class DeviceAdded(ServerToClientEvent):
+    binary_id = 7
+    device_id: str
     name: str
 
 
+@dataclass(slots=True)
+class DeviceRemoved(ServerToClientEvent):
+    binary_id = 8
+    device_id: str
+
+
+@dataclass(slots=True)
+class EndpointVolumeChanged(ServerToClientEvent):
+    binary_id = 9
+    device_id: str
+    new_volume: int
+
+
+@dataclass(slots=True)
+class EndpointMuteChanged(ServerToClientEvent):
+    binary_id = 10
+    device_id: str
+    is_muted: bool
+
+
+@dataclass(slots=True)
+class SessionAdded(ServerToClientEvent):
+    binary_id = 11
+    session_id: int
+    device_id: str
+
+
+@dataclass(slots=True)
+class SessionRemoved(ServerToClientEvent):
+    binary_id = 12
+    session_id: int
+
+
+@dataclass(slots=True)
+class Synced(ServerToClientEvent):
+    binary_id = 13
+    seq: int
+    epoch: int
+
+
 # Client to Server Events
 
-@dataclass
+@dataclass(slots=True)
 class VolumeIncrement(ClientToServerEvent):
+    binary_id = 64
     increment: int
 
 
-@dataclass
+@dataclass(slots=True)
 class SetVolume(ClientToServerEvent):
+    binary_id = 65
     volume: int
 
 
-@dataclass
+@dataclass(slots=True)
 class MuteToggle(ClientToServerEvent):
-    ...
+    binary_id = 66
 
 
-@dataclass
+@dataclass(slots=True)
 class NewClient(ClientToServerEvent):
-    ...
+    binary_id = 67
+    client_id: int = -1  # Identifies the client in Transport
+
+
+@dataclass(slots=True)
+class SetProtocol(ClientToServerEvent):
+    binary_id = 68
+    protocol: str
+
+
+@dataclass(slots=True)
+class SetVolumes(ClientToServerEvent):
+    binary_id = 69
+    volumes: list[tuple[int, int]]  # [PID, volume] pairs
+
+
+@dataclass(slots=True)
+class SetMutes(ClientToServerEvent):
+    binary_id = 70
+    mutes: list[tuple[int, bool]]  # [PID, is_muted] pairs
+
+
+@dataclass(slots=True)
+class SetAllVolume(ClientToServerEvent):
+    binary_id = 71
+    volume: int
+
+
+@dataclass(slots=True)
+class SetAllMute(ClientToServerEvent):
+    binary_id = 72
+    is_muted: bool
+
+
+@dataclass(slots=True)
+class VolumeRamp(ClientToServerEvent):
+    binary_id = 73
+    volume: int
+    duration: int  # Milliseconds
+    curve: str = 'linear'
+
+
+@dataclass(slots=True)
+class SetEndpointVolume(ClientToServerEvent):
+    binary_id = 74
+    device_id: str
+    volume: int
+
+
+@dataclass(slots=True)
+class SetEndpointMute(ClientToServerEvent):
+    binary_id = 75
+    device_id: str
+    is_muted: bool
+
+
+@dataclass(slots=True)
+class Resync(ClientToServerEvent):
+    binary_id = 76
+    last_seq: int
+    epoch: int
+    client_id: int = -1  # Identifies the client in Transport
+
+
+@dataclass(slots=True)
+class Subscribe(ClientToServerEvent):
+    binary_id = 77
+    pids: list[int] = field(default_factory=list)
+    names: list[str] = field(default_factory=list)
+    events: list[str] = field(default_factory=list)
+    client_id: int = -1  # Identifies the client in Transport
 
 
 T = TypeVar('T')
@@ -154,5 +420,316 @@ def enumerate_subclasses(base: type[T]) -> Generator[T, None, None]:
     while len(to_handle) > 0:
         current_item = to_handle.pop()
         for subclass in current_item.__subclasses__():
+            if '__slots__' not in subclass.__dict__:
+                # `dataclass(slots=True)` replaces a class with a new one, the old one stays in `__subclasses__()`
+                # until gets collected
+                continue
+
             yield subclass
             to_handle.append(subclass)
+
+
+@lru_cache
+def payload_fields(cls: type[Event]) -> tuple[str, ...]:
+    """Names of fields which carry event's data, i.e. all except `event` and private ones"""
+    return tuple(f.name for f in fields(cls) if f.name != 'event' and not f.name.startswith('_'))
+
+
+def _json_bool(value: bool) -> str:
+    return 'true' if value else 'false'
+
+
+@lru_cache
+def _compile_encoder(cls: type[Event]) -> Callable[[Event], bytes]:
+    """
+    Generates a function which serializes `cls` instances to exactly what json.dumps of a dict of event's public fields
+    would give, but with a single %-formatting of a precomputed template
+    """
+    template_parts = list()
+    args = list()
+    for f in fields(cls):
+        if f.name.startswith('_'):
+            continue
+
+        key = encode_basestring_ascii(f.name)
+        if f.name == 'event':
+            template_parts.append(f'{key}: {encode_basestring_ascii(cls.__name__)}'.replace('%', '%%'))
+
+        elif f.type is int:
+            template_parts.append(f'{key}: %d')
+            args.append(f'event.{f.name}')
+
+        elif f.type is bool:
+            template_parts.append(f'{key}: %s')
+            args.append(f'_json_bool(event.{f.name})')
+
+        elif f.type is str:
+            template_parts.append(f'{key}: %s')
+            args.append(f'encode_basestring_ascii(event.{f.name})')
+
+        else:
+            template_parts.append(f'{key}: %s')
+            args.append(f'json.dumps(event.{f.name})')
+
+    template = '{' + ', '.join(template_parts) + '}\n'
+    source = f'def encode(event):\n    return ({template!r} % ({"".join(arg + ", " for arg in args)})).encode()\n'
+    namespace = {'_json_bool': _json_bool, 'encode_basestring_ascii': encode_basestring_ascii, 'json': json}
+    exec(source, namespace)
+    return namespace['encode']
+
+
+def encode_event(event: ServerToClientEvent) -> bytes:
+    """
+    Serialize event to a json line as it goes over the wire. The result is cached in the event, so an event gets
+    serialized once regardless of how many clients and transports it is sent to. Events must not be modified after
+    they were encoded
+    """
+    encoded = event._encoded
+    if encoded is None:
+        encoded = event._encoded = _compile_encoder(type(event))(event)
+
+    return encoded
+
+
+class EventBatch(list):
+    """
+    Events sent as one update. `encoded` joins encoded events once per wire format, so an update is serialized once
+    however many transports and clients it goes to. A batch must not be modified after it was encoded
+    """
+
+    def __init__(self, events: typing.Iterable[ServerToClientEvent] = ()):
+        super().__init__(events)
+        self._encoded: dict[Callable[[ServerToClientEvent], bytes], bytes] = dict()
+
+    def encoded(self, encode: Callable[[ServerToClientEvent], bytes]) -> bytes:
+        """Wire bytes of all events, `encode` is `encode_event` or `encode_event_binary`"""
+        data = self._encoded.get(encode)
+        if data is None:
+            data = self._encoded[encode] = b''.join([encode(event) for event in self])
+
+        return data
+
+
+def decode_client_event(data: bytes) -> ClientToServerEvent:
+    """Parse one json line received from a client"""
+    return _client_event_from_dict(json.loads(data))
+
+
+def decode_client_events(lines: list[bytes]) -> list[ClientToServerEvent]:
+    """
+    Parse many json lines received from a client with one `json.loads` call.
+    Raises if any of lines is malformed, so caller can fall back to `decode_client_event` per line
+    """
+    event_dicts = json.loads(b'[' + b','.join(lines) + b']')
+    if len(event_dicts) != len(lines):  # A line contained more than one value
+        raise ValueError('Lines and decoded values count mismatch')
+
+    return [_client_event_from_dict(event_dict) for event_dict in event_dicts]
+
+
+def _client_event_from_dict(event_dict: dict) -> ClientToServerEvent:
+    """Raises `ValueError` if a field isn't of its type, so malformed events never get to the server"""
+    event_cls = lookup_event(event_dict.pop('event'))
+    event = event_cls(**event_dict)  # noqa, raises on unknown fields, so every field below has a check
+    checks = _field_checks(event_cls)
+    for name, value in event_dict.items():
+        check = checks[name]
+        # json gives exactly int, bool and str, which are checked by identity of type as the cheapest
+        if type(value) is not check and (isinstance(check, type) or not check(value)):
+            raise ValueError(f'{event_cls.__name__}.{name} is of wrong type: {value!r}')
+
+    return event
+
+
+def _type_check(field_type) -> Callable[[typing.Any], bool]:
+    """Predicate telling whether a value decoded from json is of `field_type`, a tuple may come as a json array"""
+    if field_type in (bool, int, str):
+        return lambda value: type(value) is field_type
+
+    origin, args = typing.get_origin(field_type), typing.get_args(field_type)
+    if origin is list:
+        check_item = _type_check(args[0])
+        return lambda value: isinstance(value, list) and all(check_item(item) for item in value)
+
+    if origin is tuple:
+        checks = tuple(_type_check(arg) for arg in args)
+        return lambda value: (
+            isinstance(value, (list, tuple)) and len(value) == len(checks)
+            and all(check(item) for check, item in zip(checks, value))
+        )
+
+    raise TypeError(f"Can't check values of {field_type}")
+
+
+@lru_cache
+def _field_checks(cls: type[Event]) -> dict[str, type | Callable[[typing.Any], bool]]:
+    """Field : its type if it is a scalar one, a predicate from `_type_check` otherwise"""
+    types = {f.name: f.type for f in fields(cls)}
+    return {
+        name: types[name] if types[name] in (bool, int, str) else _type_check(types[name])
+        for name in payload_fields(cls)
+    }
+
+
+_binary_header = struct.Struct('<Bi')
+_binary_codes = {int: 'i', bool: '?', str: 'H'}  # For str it is length, bytes follow
+_binary_item_codes = {int: 'i', bool: '?', str: 'H'}
+
+
+def _binary_item_struct(field_type) -> tuple[struct.Struct, str] | None:
+    """
+    Struct of an item of a list field and how items are packed with it: 'tuple' for `list[tuple[int, int]]`, 'scalar'
+    for `list[int]`, 'str' for `list[str]` (the struct is of item's length, its bytes follow). None if the field is not
+    a list
+    """
+    if typing.get_origin(field_type) is not list:
+        return None
+
+    item_type, = typing.get_args(field_type)
+    if typing.get_origin(item_type) is tuple:
+        return struct.Struct('<' + ''.join(_binary_item_codes[t] for t in typing.get_args(item_type))), 'tuple'
+
+    return struct.Struct('<' + _binary_item_codes[item_type]), 'str' if item_type is str else 'scalar'
+
+
+@lru_cache
+def _binary_layout(
+        cls: type[Event]
+) -> tuple[struct.Struct, tuple[str, ...], tuple[tuple[str, tuple[struct.Struct, str] | None], ...]]:
+    """
+    Struct of the fixed part of a binary frame, names of payload fields and names of variable length fields, which
+    data follows the struct, along with structs of their items as `_binary_item_struct` gives (None for str fields)
+    """
+    names = payload_fields(cls)
+    types = {f.name: f.type for f in fields(cls)}
+    items = {name: _binary_item_struct(types[name]) for name in names}
+    fmt = '<Bi' + ''.join('H' if items[name] else _binary_codes[types[name]] for name in names if name != 'PID')
+    tails = tuple((name, items[name]) for name in names if types[name] is str or items[name] is not None)
+    return struct.Struct(fmt), names, tails
+
+
+@lru_cache
+def _compile_binary_encoder(cls: type[Event]) -> Callable[[Event], bytes]:
+    """Generates a function which packs `cls` instances with a single `struct.pack` call"""
+    layout, names, tails = _binary_layout(cls)
+    tail_names = [name for name, _ in tails]
+    args = [str(cls.binary_id)] + [f'len(v_{name})' if name in tail_names else f'event.{name}' for name in names]
+    source = 'def encode(event):\n'
+    namespace = {'_pack': layout.pack}
+    tail_bytes = ''
+    for name, item in tails:
+        if item is None:
+            source += f'    v_{name} = event.{name}.encode()\n'
+            tail_bytes += f' + v_{name}'
+            continue
+
+        item_struct, kind = item
+        namespace[f'_pack_{name}'] = item_struct.pack
+        if kind == 'str':
+            source += f'    v_{name} = [i.encode() for i in event.{name}]\n'
+            tail_bytes += f" + b''.join([_pack_{name}(len(i)) + i for i in v_{name}])"
+
+        else:
+            source += f'    v_{name} = event.{name}\n'
+            tail_bytes += f" + b''.join([_pack_{name}({'*' if kind == 'tuple' else ''}i) for i in v_{name}])"
+
+    source += f'    return _pack({", ".join(args)}){tail_bytes}\n'
+    exec(source, namespace)
+    return namespace['encode']
+
+
+@lru_cache
+def _compile_binary_decoder(cls: type[Event]) -> Callable[[bytes | bytearray, int], tuple[Event, int] | None]:
+    """
+    Generates a function which parses a `cls` frame starting at `offset`, returns the event and offset of the end
+    of the frame or None if the frame is incomplete
+    """
+    layout, names, tails = _binary_layout(cls)
+    source = (
+        'def decode(buffer, offset):\n'
+        f'    if len(buffer) - offset < {layout.size}:\n'
+        '        return None\n'
+        f'    _, {"".join(f"v_{name}, " for name in names)}= _unpack_from(buffer, offset)\n'
+        f'    offset += {layout.size}\n'
+    )
+    namespace = {'_unpack_from': layout.unpack_from, '_cls': cls}
+    for name, item in tails:
+        if item is None:
+            source += (
+                f'    if len(buffer) - offset < v_{name}:\n'
+                '        return None\n'
+                f'    v_{name}, offset = bytes(buffer[offset:offset + v_{name}]).decode(), offset + v_{name}\n'
+            )
+            continue
+
+        item_struct, kind = item
+        if kind == 'str':
+            namespace[f'_unpack_from_{name}'] = item_struct.unpack_from
+            source += (
+                '    items = list()\n'
+                f'    for _ in range(v_{name}):\n'
+                f'        if len(buffer) - offset < {item_struct.size}:\n'
+                '            return None\n'
+                f'        size, = _unpack_from_{name}(buffer, offset)\n'
+                f'        offset += {item_struct.size}\n'
+                '        if len(buffer) - offset < size:\n'
+                '            return None\n'
+                '        items.append(bytes(buffer[offset:offset + size]).decode())\n'
+                '        offset += size\n'
+                f'    v_{name} = items\n'
+            )
+            continue
+
+        namespace[f'_iter_unpack_{name}'] = item_struct.iter_unpack
+        items = f'_iter_unpack_{name}(bytes(buffer[offset:offset + size]))'
+        items = f'list({items})' if kind == 'tuple' else f'[i for i, in {items}]'
+        source += (
+            f'    size = v_{name} * {item_struct.size}\n'
+            '    if len(buffer) - offset < size:\n'
+            '        return None\n'
+            f'    v_{name}, offset = {items}, offset + size\n'
+        )
+
+    source += f'    return _cls({"".join(f"v_{name}, " for name in names)}), offset\n'
+    exec(source, namespace)
+    return namespace['decode']
+
+
+def encode_event_binary(event: ServerToClientEvent) -> bytes:
+    """Serialize event to binary wire format, the result is cached in the event as in `encode_event`"""
+    encoded = event._encoded_binary
+    if encoded is None:
+        encoded = event._encoded_binary = _compile_binary_encoder(type(event))(event)
+
+    return encoded
+
+
+@lru_cache
+def _binary_decoders(base: type[Event]) -> dict[int, Callable[[bytes | bytearray, int], tuple[Event, int] | None]]:
+    return {cls.binary_id: _compile_binary_decoder(cls) for cls in enumerate_subclasses(base) if hasattr(cls, 'binary_id')}
+
+
+def decode_events_binary(
+        buffer: bytes | bytearray,
+        base: type[T] = ClientToServerEvent
+) -> Generator[tuple[T, int], None, None]:
+    """
+    Parse complete binary frames in `buffer`, yields events along with offset of the end of their frames, so a caller
+    knows how many bytes are consumed. An incomplete frame at the end is left for the next call.
+    Raises `ValueError` on unknown event id
+    """
+    decoders = _binary_decoders(base)
+    offset = 0
+    while offset < len(buffer):
+        try:
+            decoder = decoders[buffer[offset]]
+
+        except KeyError:
+            raise ValueError(f'Unknown binary event id {buffer[offset]}')
+
+        decoded = decoder(buffer, offset)
+        if decoded is None:
+            return
+
+        offset = decoded[1]
+        yield decoded
@@ -0,0 +1,49 @@
+import os
+import socket
+import tempfile
+
+from loguru import logger
+
+from NetworkTransport import NetworkTransport
+
+
+class LocalTransport(NetworkTransport):
+    """
+    Serves clients on the same host (tray apps, scripts, overlays) over a Unix domain socket. Events, formats and
+    state requests are the same as of `NetworkTransport`, but a message doesn't go through loopback TCP: no segments,
+    acks and delayed sends, a round trip costs a few context switches.
+    Buffers of Unix sockets are small and don't grow as TCP's do, so a full state is mostly written as the socket gets
+    writable, by `NetworkTransport`'s buffering.
+    The socket file is accessible only to the user the server runs as. Python for Windows has no AF_UNIX,
+    there the transport isn't `available`
+    """
+
+    available = hasattr(socket, 'AF_UNIX')
+    path = os.path.join(tempfile.gettempdir(), 'audiocontrol.sock')
+
+    def _listen(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            os.unlink(self.path)  # Left by a server which hasn't shut down cleanly
+
+        except FileNotFoundError:
+            pass
+
+        umask = os.umask(0o177)  # The file is created by bind() already, don't let anyone else connect in between
+        try:
+            sock.bind(self.path)
+
+        finally:
+            os.umask(umask)
+
+        sock.listen(100)
+        logger.debug(f'Local: Listening on {self.path}')
+        return sock
+
+    def shutdown(self):
+        super().shutdown()
+        try:
+            os.unlink(self.path)
+
+        except FileNotFoundError:
+            pass
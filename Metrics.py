@@ -0,0 +1,258 @@
+import bisect
+import threading
+from abc import ABC, abstractmethod
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+from loguru import logger
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric(ABC):
+    """Family of metrics with the same name and different values of labels"""
+
+    type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._children: dict[tuple[str, ...], object] = dict()
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str):
+        """Child metric for the values of labels, cached, so hot paths may call it every time"""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+
+        return child
+
+    def remove(self, *values: str) -> None:
+        """Forget a child, i.e. of a disconnected client"""
+        with self._lock:
+            self._children.pop(values, None)
+
+    @abstractmethod
+    def _new_child(self):
+        """A child metric for a new combination of values of labels"""
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        with self._lock:
+            children = tuple(self._children.items())
+
+        for values, child in children:
+            lines.extend(self._render_child(values, child))
+
+        return lines
+
+    @abstractmethod
+    def _render_child(self, values: tuple[str, ...], child) -> list[str]:
+        """Lines of the exposition format for the child"""
+
+
+class _CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount  # Not atomic, a lost increment under contention is fine for metrics
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+    def _render_child(self, values: tuple[str, ...], child: _CounterChild) -> list[str]:
+        return [f'{self.name}{_format_labels(self.labelnames, values)} {child.value}']
+
+
+class _GaugeChild:
+    __slots__ = ('function',)
+
+    def __init__(self):
+        self.function: Callable[[], float] = lambda: 0
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self.function = function
+
+
+class Gauge(_Metric):
+    """Value is read by a function when metrics are rendered, so keeping it up to date costs nothing"""
+
+    type = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self.labels().set_function(function)
+
+    def _render_child(self, values: tuple[str, ...], child: _GaugeChild) -> list[str]:
+        try:
+            value = child.function()
+
+        except Exception:
+            logger.opt(exception=True).debug(f'Failed to read gauge {self.name}')
+            return list()
+
+        if value is None:
+            return list()
+
+        return [f'{self.name}{_format_labels(self.labelnames, values)} {value}']
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+    default_buckets = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = default_buckets):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def _render_child(self, values: tuple[str, ...], child: _HistogramChild) -> list[str]:
+        lines = list()
+        cumulative = 0
+        for bound, count in zip((*self.buckets, '+Inf'), child.counts):
+            cumulative += count
+            le = f'le="{bound}"'
+            lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}')
+
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f'{self.name}_sum{labels} {child.sum}')
+        lines.append(f'{self.name}_count{labels} {child.count}')
+        return lines
+
+
+class Metrics:
+    """
+    Registry of metrics, rendered in Prometheus text format. Metrics are created once, hot paths only
+    call `inc` or `observe` of their children, i.e. `metrics.events.labels('out', 'VolumeChanged').inc()`.
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = dict()
+        self._lock = threading.Lock()
+
+        self.events = self.counter('audiocontrol_events_total', 'Events passed by ServerSideView',
+                                   ('direction', 'type'))
+        self.callback_to_wire = self.histogram('audiocontrol_callback_to_wire_seconds',
+                                               'From creation of an event to its send by transport', ('type',))
+        self.client_sent_bytes = self.counter('audiocontrol_client_sent_bytes_total', 'Bytes sent to a client',
+                                              ('client',))
+        self.client_sends = self.counter('audiocontrol_client_sends_total', 'Sends to a client', ('client',))
+        self.client_send_seconds = self.counter('audiocontrol_client_send_seconds_total',
+                                                'Time spent in sends to a client', ('client',))
+        self.queue_depth = self.gauge('audiocontrol_queue_depth', 'Items in a queue', ('queue',))
+        self.queue_high_water = self.gauge('audiocontrol_queue_high_water', 'The most items a queue had', ('queue',))
+        self.queue_dropped = self.gauge('audiocontrol_queue_dropped', 'Items dropped by a queue', ('queue',))
+        self.queue_coalesced = self.gauge('audiocontrol_queue_coalesced', 'Items coalesced by a queue',
+                                          ('queue',))
+        self.sessions = self.gauge('audiocontrol_sessions', 'Processes with sessions known by ServerSideView')
+        self.clients = self.gauge('audiocontrol_clients', 'Connected clients')
+        self.subscribed_clients = self.gauge('audiocontrol_subscribed_clients',
+                                             'Clients which get only events they have subscribed to')
+        self.reconciled = self.counter('audiocontrol_reconciled_total',
+                                       'Cached session state corrected by reconciliation with the backend', ('field',))
+        self.resyncs = self.counter('audiocontrol_resyncs_total',
+                                    'Clients brought up to date by full state or by events they have missed', ('kind',))
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), **kwargs) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, **kwargs))
+
+    def _register(self, metric: _Metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'Metric {metric.name} is already registered')
+
+            self._metrics[metric.name] = metric
+
+        return metric
+
+    def add_queue(self, name: str, q: 'BoundedQueue.BoundedQueue') -> None:
+        self.queue_depth.labels(name).set_function(q.qsize)
+        self.queue_high_water.labels(name).set_function(lambda: q.high_water)
+        self.queue_dropped.labels(name).set_function(lambda: q.dropped)
+        self.queue_coalesced.labels(name).set_function(lambda: q.coalesced)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = tuple(self._metrics.values())
+
+        return '\n'.join(line for metric in metrics for line in metric.render()) + '\n'
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """Serves `Metrics.render()` over HTTP on GET of any path, from its own daemon thread"""
+
+    daemon_threads = True
+
+    def __init__(self, metrics: Metrics, host: str, port: int):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):  # noqa
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):  # noqa
+                logger.trace(f'Metrics: {self.address_string()} {format % args}')
+
+        super().__init__((host, port), Handler)
+        self._thread = threading.Thread(target=self.serve_forever, name='MetricsServer', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+metrics = Metrics()  # Process-wide registry
@@ -1,37 +1,210 @@
+import os
+import time
 from typing import Callable
 from loguru import logger
-from dataclasses import asdict
 import socket
 import selectors
 import Events
-import json
 from TransportABC import TransportABC
+from Metrics import metrics
+
+
+class LineFramer:
+    """Accumulates a stream of bytes and splits it to complete json lines, keeps incomplete tail until next feed"""
+
+    max_line_length = 64 * 1024
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> list[bytes]:
+        """Returns all lines completed by `data`, raises `ValueError` if incomplete line is longer than allowed"""
+        self._buffer += data
+        end = self._buffer.rfind(b'\n')
+        if end == -1:
+            if len(self._buffer) > self.max_line_length:
+                raise ValueError(f'Line is longer than {self.max_line_length} bytes')
+
+            return []
+
+        complete = bytes(self._buffer[:end])
+        del self._buffer[:end + 1]
+        return complete.split(b'\n')
+
+    def take_tail(self) -> bytes:
+        """Returns and forgets incomplete line"""
+        tail = bytes(self._buffer)
+        self._buffer.clear()
+        return tail
 
 
 class NetworkTransport(TransportABC):
-    def __init__(self, rcv_callback: Callable[[Events.ClientToServerEvent], None]):
-        self._selector = selectors.DefaultSelector()
+    """
+    Serves clients over TCP. A connection starts in json lines format, a client can switch it to compact binary format
+    (see `Events` module docstring) in both directions by `SetProtocol` event.
+    A new connection gets full state once it sends anything or `resync_window` passes, so a reconnecting client can ask
+    for the events it has missed by `Resync` instead. Broadcasts skip a connection until it has got its state and
+    connections of subscribed clients, `ServerSideView` sends to them one by one.
+    Sockets are non-blocking, what doesn't fit to a socket's buffer is kept and written when the socket gets writable,
+    so a client which doesn't read holds up nobody, it gets disconnected once it has `max_pending` bytes unread
+    """
+
+    host = 'localhost'
+    port = 54683
+    recv_size = 64 * 1024
+    max_binary_buffer = 128 * 1024
+    resync_window = 0.05  # Seconds
+    max_pending = 16 * 1024 * 1024  # Bytes per connection
+
+
+    def __init__(self, rcv_callback: Callable[[Events.ClientToServerEvent], None], selector: selectors.BaseSelector):
+        self._selector = selector
         self.view_rcv_callback = rcv_callback
 
-        self._sock = socket.socket()
-        self._sock.bind(('localhost', 54683))
-        self._sock.listen(100)
+        self._sock = self._listen()
         self._sock.setblocking(False)
         self._selector.register(self._sock, selectors.EVENT_READ, self._accept)
         self._running = True
 
-        self._connections: list[socket.socket] = list()
+        self._connections: list[socket.socket] = list()  # Connections which have got state and get broadcasts
+        self._filtered: set[socket.socket] = set()  # Connections which don't get broadcasts, see `set_filtered`
+        # Connections which haven't got state yet, mapped to end of their resync window or None if they have
+        # requested state already
+        self._joining: dict[socket.socket, float | None] = dict()
+        self._framers: dict[socket.socket, LineFramer] = dict()
+        self._binary_buffers: dict[socket.socket, bytearray] = dict()  # Only connections switched to binary format
+        self._client_ids: dict[socket.socket, int] = dict()
+        self._conns_by_client_id: dict[int, socket.socket] = dict()
+        self._client_metrics: dict[socket.socket, tuple] = dict()  # Sent bytes, sends and send seconds counters
+        self._pending: dict[socket.socket, bytearray] = dict()  # Only connections with unwritten data
+        self._overflowed: set[socket.socket] = set()  # Connections to close on next tick
+
+    def _listen(self) -> socket.socket:
+        """Creates the socket clients connect to, a transport over another kind of socket overrides it"""
+        sock = socket.socket()
+        # Bind while connections of a previous run linger, as asyncio does, on Windows it lets other processes bind too
+        if os.name == 'posix':
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+        sock.bind((self.host, self.port))
+        sock.listen(100)
+        return sock
 
     def send(self, msg: Events.ServerToClientEvent):
         """This method gets called by `ServerSideView` when it wants to send a message to the client"""
 
-        # logger.debug(f'Sending {asdict(msg)}')
-        msg = json.dumps(asdict(msg)).encode() + b'\n'  # TODO: Remove new line probably
-        self._send_to_all(msg)
+        # logger.debug(f'Sending {msg}')
+        for conn in self._connections:
+            if conn in self._binary_buffers:
+                self._sendall(conn, Events.encode_event_binary(msg))
+
+            else:
+                self._sendall(conn, Events.encode_event(msg))
 
-    def _send_to_all(self, msg: bytes):
+    def send_many(self, msgs: list[Events.ServerToClientEvent]):
+        """Events are joined once per wire format and written to every client with one `sendall`"""
+        batch = msgs if isinstance(msgs, Events.EventBatch) else Events.EventBatch(msgs)
         for conn in self._connections:
-            conn.sendall(msg)
+            self._sendall(conn, batch.encoded(
+                Events.encode_event_binary if conn in self._binary_buffers else Events.encode_event
+            ))
+
+    def send_to(self, client_id: int, msgs: list[Events.ServerToClientEvent], is_state: bool = False) -> bool:
+        conn = self._conns_by_client_id.get(client_id)
+        if conn is None:
+            return False
+
+        if not is_state and conn in self._joining:  # The state it waits for covers the update, as for broadcasts
+            return True
+
+        encode = Events.encode_event_binary if conn in self._binary_buffers else Events.encode_event
+        self._sendall(conn, b''.join([encode(msg) for msg in msgs]))
+        if is_state and conn in self._joining:  # It's the state the connection has been waiting for
+            del self._joining[conn]
+            if conn not in self._filtered:
+                self._connections.append(conn)
+
+        return True
+
+    def set_filtered(self, client_id: int, is_filtered: bool) -> bool:
+        conn = self._conns_by_client_id.get(client_id)
+        if conn is None:
+            return False
+
+        if is_filtered == (conn in self._filtered):
+            return True
+
+        if is_filtered:
+            self._filtered.add(conn)
+            if conn not in self._joining:
+                self._connections.remove(conn)
+
+        else:
+            self._filtered.discard(conn)
+            if conn not in self._joining:
+                self._connections.append(conn)
+
+        return True
+
+    def _sendall(self, conn: socket.socket, data: bytes):
+        started = time.perf_counter()
+        self._write(conn, data)
+        sent_bytes, sends, send_seconds = self._client_metrics[conn]
+        send_seconds.value += time.perf_counter() - started  # The same as `inc`, without a call per send
+        sends.value += 1
+        sent_bytes.value += len(data)
+
+    def _write(self, conn: socket.socket, data: bytes):
+        """Writes what the socket takes, the rest is kept until it gets writable, after what is kept already"""
+        pending = self._pending.get(conn)
+        if pending is not None:
+            if len(pending) + len(data) > self.max_pending:
+                self._overflowed.add(conn)  # Can't be closed here, `send_many` iterates over connections
+
+            else:
+                pending += data
+
+            return
+
+        try:
+            sent = conn.send(data)
+
+        except BlockingIOError:
+            sent = 0
+
+        except OSError:
+            return  # The connection is closed by the client, it gets closed here on its receive
+
+        if sent < len(data):
+            self._pending[conn] = bytearray(memoryview(data)[sent:])
+            self._selector.modify(conn, selectors.EVENT_READ | selectors.EVENT_WRITE, self._on_socket_ready)
+
+    def _on_socket_ready(self, conn: socket.socket, mask: int):
+        if mask & selectors.EVENT_WRITE:
+            self._flush(conn)
+
+        if mask & selectors.EVENT_READ and conn in self._client_ids:
+            self._on_socket_receive(conn, mask)
+
+    def _flush(self, conn: socket.socket):
+        pending = self._pending[conn]
+        try:
+            sent = conn.send(pending)
+
+        except BlockingIOError:
+            return
+
+        except OSError:
+            self._close_conn(conn)
+            return
+
+        del pending[:sent]
+        if len(pending) == 0:
+            del self._pending[conn]
+            self._selector.modify(conn, selectors.EVENT_READ, self._on_socket_receive)
+
+    def client_count(self) -> int:
+        return len(self._client_ids)
 
     def _accept(self, sock: socket.socket, mask: int):
         """Callback which get called when accepting new connection"""
@@ -42,19 +215,49 @@ class NetworkTransport(TransportABC):
         conn, addr = sock.accept()
         logger.debug(f'Net: Accepted {conn.getpeername()}')
         conn.setblocking(False)
+        self._add_connection(conn)
+
+    def _add_connection(self, conn: socket.socket):
+        """Makes an accepted connection a client"""
         self._selector.register(conn, selectors.EVENT_READ, self._on_socket_receive)
-        self._connections.append(conn)
-        self.view_rcv_callback(Events.NewClient(-1))
+        self._joining[conn] = time.monotonic() + self.resync_window
+        self._framers[conn] = LineFramer()
+        client_id = next(self._client_id_counter)
+        self._client_ids[conn] = client_id
+        self._conns_by_client_id[client_id] = conn
+        self._client_metrics[conn] = tuple(
+            counter.labels(str(client_id))
+            for counter in (metrics.client_sent_bytes, metrics.client_sends, metrics.client_send_seconds)
+        )
+
+    def _request_state(self, conn: socket.socket, event: Events.NewClient | Events.Resync):
+        self._joining[conn] = None
+        self.view_rcv_callback(event)
 
     def _close_conn(self, conn: socket.socket):
-        logger.debug(f'Net: Closing connection to {conn.getpeername()}')
+        # getpeername() would raise if the connection was reset
+        logger.debug('Net: Closing connection to client {}', self._client_ids[conn])
         self._selector.unregister(conn)
-        self._connections.remove(conn)
+        if self._joining.pop(conn, False) is False and conn not in self._filtered:
+            self._connections.remove(conn)
+
+        self._filtered.discard(conn)
+        self._pending.pop(conn, None)
+        self._overflowed.discard(conn)
+
+        del self._framers[conn]
+        self._binary_buffers.pop(conn, None)
+        client_id = self._client_ids.pop(conn)
+        del self._conns_by_client_id[client_id]
+        del self._client_metrics[conn]
+        for counter in (metrics.client_sent_bytes, metrics.client_sends, metrics.client_send_seconds):
+            counter.remove(str(client_id))
+
         conn.close()
 
     def _on_socket_receive(self, conn: socket.socket, mask: int):
         try:
-            data = conn.recv(1000)
+            data = conn.recv(self.recv_size)
 
         except ConnectionResetError:
             logger.opt(exception=True).warning(f'Closing connection due to RST?')
@@ -65,33 +268,160 @@ class NetworkTransport(TransportABC):
                 self._close_conn(conn)
                 return
 
-            for data_part in data.split(b'\n'):
-                if len(data_part) != 0:
-                    self._handle_received_event(data_part, conn)
+            self._on_data(conn, data)
+
+    def _on_data(self, conn: socket.socket, data: bytes):
+        """Bytes as they come from the socket, a transport with its own framing of events unwraps them here"""
+        self._feed(conn, data)
+
+    def _feed(self, conn: socket.socket, data: bytes):
+        try:
+            if conn in self._binary_buffers:
+                self._feed_binary(conn, data)
+
+            else:
+                self._feed_json(conn, data)
+
+        except ValueError:
+            logger.opt(exception=True).warning(f'Closing connection to {conn.getpeername()}')
+            self._close_conn(conn)
+
+    def _feed_json(self, conn: socket.socket, data: bytes):
+        lines = self._framers[conn].feed(data)
+        if len(lines) == 0:
+            return
+
+        try:
+            events = Events.decode_client_events([line for line in lines if len(line.strip()) != 0])
+
+        except Exception:  # Some of lines are malformed, let's find out which
+            pass
+
+        else:
+            if not any(isinstance(event, Events.SetProtocol) for event in events):
+                logger.opt(lazy=True).trace('Passing {} msgs from client {}', lambda: len(events), conn.getpeername)
+                for event in events:
+                    self._dispatch(conn, event)
+
+                return
+
+        # Slow path, there are malformed lines or format of the following lines changes
+        for i, line in enumerate(lines):
+            if len(line.strip()) == 0:
+                continue
+
+            event = self._decode_line(line)
+            if isinstance(event, Events.SetProtocol):
+                rest = b''.join(line + b'\n' for line in lines[i + 1:]) + self._framers[conn].take_tail()
+                self._set_protocol(conn, event.protocol, rest)
+                return
+
+            elif event is not None:
+                logger.opt(lazy=True).trace('Passing msg {} from client {}', lambda: event, conn.getpeername)
+                self._dispatch(conn, event)
+
+    def _feed_binary(self, conn: socket.socket, data: bytes):
+        buffer = self._binary_buffers[conn]
+        buffer += data
+        consumed = 0
+        for event, consumed in Events.decode_events_binary(buffer):
+            if isinstance(event, Events.SetProtocol):
+                rest = bytes(buffer[consumed:])
+                buffer.clear()
+                self._set_protocol(conn, event.protocol, rest)
+                return
+
+            self._dispatch(conn, event)
 
-    def _handle_received_event(self, data: bytes, conn: socket.socket):
+        del buffer[:consumed]
+        if len(buffer) > self.max_binary_buffer:
+            raise ValueError(f'Incomplete binary frame is longer than {self.max_binary_buffer} bytes')
+
+    def _set_protocol(self, conn: socket.socket, protocol: str, rest: bytes):
+        """Switches format of the connection, `rest` is what was received after `SetProtocol` event"""
+        if protocol == 'binary':
+            self._binary_buffers[conn] = bytearray()
+
+        elif protocol == 'json':
+            self._binary_buffers.pop(conn, None)
+            self._framers[conn] = LineFramer()
+
+        else:
+            logger.warning(f'Unknown protocol {protocol!r} requested by {conn.getpeername()}')
+            if len(rest) != 0:
+                self._feed(conn, rest)
+
+            return
+
+        logger.debug(f'Net: {conn.getpeername()} switched to {protocol}')
+        if conn not in self._joining:  # Otherwise state is yet to be sent and it will be in the new format
+            self.view_rcv_callback(Events.NewClient(-1, self._client_ids[conn]))  # Resend full state in the new format
+
+        if len(rest) != 0:
+            self._feed(conn, rest)
+
+    def _dispatch(self, conn: socket.socket, event: Events.ClientToServerEvent):
+        client_id = self._client_ids[conn]
+        if isinstance(event, Events.Subscribe):  # Goes before a state request, so it doesn't end the resync window
+            event = Events.Subscribe(-1, event.pids, event.names, event.events, client_id)
+
+        elif isinstance(event, (Events.NewClient, Events.Resync)):  # A client asks for full state or missed events
+            if isinstance(event, Events.NewClient):
+                event = Events.NewClient(-1, client_id)
+
+            else:
+                event = Events.Resync(-1, event.last_seq, event.epoch, client_id)
+
+            if conn in self._joining:
+                self._request_state(conn, event)
+                return
+
+        elif self._joining.get(conn) is not None:  # A new client which doesn't resync
+            self._request_state(conn, Events.NewClient(-1, client_id))
+
+        self.view_rcv_callback(event)
+
+    @staticmethod
+    def _decode_line(line: bytes) -> Events.ClientToServerEvent | None:
         try:
-            event_dict = json.loads(data)
-            event_name = event_dict['event']
-            event_cls = Events.lookup_event(event_name)
-            del event_dict['event']
-            logger.trace(f'Passing msg {event_dict} from client {conn.getpeername()}')
-            event = event_cls(**event_dict)  # noqa
-            self.view_rcv_callback(event)
+            return Events.decode_client_event(line)
 
         except Exception:
-            logger.opt(colors=False, exception=True).warning(f"Couldn't parse message from client: {data}")
+            logger.opt(colors=False, exception=True).warning(f"Couldn't parse message from client: {line}")
+            return None
 
     def tick(self):
-        events = self._selector.select(timeout=0.1)
-        for key, mask in events:
-            callback = key.data
-            callback(key.fileobj, mask)
+        """
+        Connections which haven't read what they were sent get closed, new connections which haven't sent anything
+        within their resync window get full state
+        """
+        for conn in tuple(self._overflowed):
+            logger.warning(f'Net: Closing connection to client {self._client_ids[conn]}, it has '
+                           f'{len(self._pending[conn])} bytes unread')
+            self._close_conn(conn)
+
+        if len(self._joining) == 0:
+            return
+
+        now = time.monotonic()
+        for conn, window_end in tuple(self._joining.items()):
+            if window_end is not None and window_end <= now:
+                self._request_state(conn, Events.NewClient(-1, self._client_ids[conn]))
+
+    def timeout(self, now: float) -> float | None:
+        window_end = min((window_end for window_end in self._joining.values() if window_end is not None), default=None)
+        if window_end is None:
+            return None
+
+        return max(0.0, window_end - now)
 
     def shutdown(self):
         logger.debug(f'Net: Shutting down')
         self._running = False
-        while len(self._connections) > 0:
-            self._close_conn(self._connections[0])
+        for conn in tuple(self._client_ids.keys()):
+            self._close_conn(conn)
+
+        self._selector.unregister(self._sock)
+        self._sock.close()
 
         logger.trace(f'Net: Shutdown completed, clients disconnected')
@@ -0,0 +1,183 @@
+from ctypes import POINTER, cast
+from functools import cached_property
+from typing import Callable
+
+from comtypes import CLSCTX_ALL
+from pycaw.utils import AudioSession
+from pycaw.callbacks import AudioSessionEvents, AudioSessionNotification, AudioEndpointVolumeCallback, \
+    MMNotificationClient
+from pycaw.constants import DEVICE_STATE, EDataFlow
+from pycaw.pycaw import AudioUtilities, IAudioEndpointVolume, IAudioSessionControl2, IAudioSessionManager2
+
+from AudioBackendABC import AudioBackendABC, SessionKey
+from get_app_name import get_file_description
+
+
+class PerSessionCallbacks(AudioSessionEvents):
+    """Passing callbacks calls to AudioController and includes session key to calls"""
+
+    def __init__(self, key: SessionKey, audio_controller: 'AudioController.AudioController'):
+        self.key = key
+        self.audio_controller = audio_controller
+        self._is_muted: bool | None = None
+        self._volume: int | None = None
+
+    def on_simple_volume_changed(self, new_volume, new_mute, event_context):
+        new_mute = bool(new_mute)
+        new_volume = int(new_volume * 100)
+
+        if new_mute != self._is_muted:
+            self._is_muted = new_mute
+            self.audio_controller.on_mute_changed(self.key, self._is_muted)
+
+        if new_volume != self._volume:
+            self._volume = new_volume
+            self.audio_controller.on_volume_changed(self.key, self._volume)
+
+    def on_state_changed(self, new_state, new_state_id):
+        self.audio_controller.on_state_changed(self.key, new_state, new_state_id)
+
+    def on_session_disconnected(self, disconnect_reason, disconnect_reason_id):
+        self.audio_controller.on_session_disconnected(self.key, disconnect_reason, disconnect_reason_id)
+
+
+class SessionCreateCallback(AudioSessionNotification):
+    def __init__(self, on_session_created: Callable[[AudioSession], None]):
+        self.on_session_created_callback = on_session_created
+
+    def on_session_created(self, new_session):
+        self.on_session_created_callback(new_session)
+
+
+class EndpointVolumeCallback(AudioEndpointVolumeCallback):
+    def __init__(self, device_id: str, audio_controller: 'AudioController.AudioController'):
+        self.device_id = device_id
+        self.audio_controller = audio_controller
+
+    def on_notify(self, new_volume, new_mute, event_context, channels, channel_volumes):
+        self.audio_controller.on_endpoint_volume_changed(self.device_id, round(new_volume * 100), bool(new_mute))
+
+
+class DevicesCallback(MMNotificationClient):
+    def __init__(self, on_devices_changed: Callable[[], None]):
+        self.on_devices_changed = on_devices_changed
+
+    def on_device_added(self, added_device_id):
+        self.on_devices_changed()
+
+    def on_device_removed(self, removed_device_id):
+        self.on_devices_changed()
+
+    def on_device_state_changed(self, device_id, new_state, new_state_id):
+        self.on_devices_changed()
+
+
+class PycawDevice:
+    """
+    Output device with its session manager and endpoint volume interfaces. The interfaces get activated on first use,
+    so enumerating already known devices on discovery stays cheap
+    """
+
+    def __init__(self, dev):
+        self._dev = dev
+        self.id: str = dev.GetId()
+        self.session_create_callback: SessionCreateCallback | None = None
+        self.endpoint_volume_callback: EndpointVolumeCallback | None = None
+
+    @cached_property
+    def FriendlyName(self) -> str:
+        return AudioUtilities.CreateDevice(self._dev).FriendlyName
+
+    @cached_property
+    def session_manager(self):
+        return self._dev.Activate(IAudioSessionManager2._iid_, CLSCTX_ALL, None).QueryInterface(IAudioSessionManager2)
+
+    @cached_property
+    def endpoint_volume(self):
+        return cast(self._dev.Activate(IAudioEndpointVolume._iid_, CLSCTX_ALL, None), POINTER(IAudioEndpointVolume))
+
+
+class PycawBackend(AudioBackendABC):
+    """Windows mixer sessions of every active output device via pycaw"""
+
+    def __init__(self):
+        self._enumerator = AudioUtilities.GetDeviceEnumerator()
+        self._devices_callback: DevicesCallback | None = None
+
+    def start(self, listener: 'AudioController.AudioController'):
+        self._devices_callback = DevicesCallback(listener.on_devices_changed)
+        self._enumerator.RegisterEndpointNotificationCallback(self._devices_callback)
+
+    def stop(self):
+        if self._devices_callback is not None:
+            self._enumerator.UnregisterEndpointNotificationCallback(self._devices_callback)
+            self._devices_callback = None
+
+    def get_devices(self) -> list[PycawDevice]:
+        collection = self._enumerator.EnumAudioEndpoints(EDataFlow.eRender.value, DEVICE_STATE.ACTIVE.value)
+        return [PycawDevice(collection.Item(i)) for i in range(collection.GetCount())]
+
+    def get_sessions(self, device: PycawDevice) -> list[AudioSession]:
+        sessions = list()
+        enumerator = device.session_manager.GetSessionEnumerator()
+        for i in range(enumerator.GetCount()):
+            ctl = enumerator.GetSession(i)
+            if ctl is None:
+                continue
+
+            ctl2 = ctl.QueryInterface(IAudioSessionControl2)
+            if ctl2 is not None:
+                sessions.append(AudioSession(ctl2))
+
+        return sessions
+
+    def register_device(self, device: PycawDevice, listener: 'AudioController.AudioController'):
+        device.session_create_callback = SessionCreateCallback(
+            lambda session: listener.on_session_created(device.id, session)
+        )
+        device.session_manager.RegisterSessionNotification(device.session_create_callback)
+        device.session_manager.GetSessionEnumerator()  # Notifications don't arrive until sessions got enumerated once
+        device.endpoint_volume_callback = EndpointVolumeCallback(device.id, listener)
+        device.endpoint_volume.RegisterControlChangeNotify(device.endpoint_volume_callback)
+
+    def unregister_device(self, device: PycawDevice):
+        if device.session_create_callback is not None:
+            device.session_manager.UnregisterSessionNotification(device.session_create_callback)
+            device.session_create_callback = None
+
+        if device.endpoint_volume_callback is not None:
+            device.endpoint_volume.UnregisterControlChangeNotify(device.endpoint_volume_callback)
+            device.endpoint_volume_callback = None
+
+    def register(self, key: SessionKey, session: AudioSession, listener: 'AudioController.AudioController'):
+        session.register_notification(PerSessionCallbacks(key, listener))
+
+    def unregister(self, session: AudioSession):
+        session.unregister_notification()
+
+    def get_volume(self, session: AudioSession) -> int:
+        return int(session.SimpleAudioVolume.GetMasterVolume() * 100)
+
+    def set_volume(self, session: AudioSession, volume: int):
+        session.SimpleAudioVolume.SetMasterVolume(float(volume) / 100, None)
+
+    def is_muted(self, session: AudioSession) -> bool:
+        return bool(session.SimpleAudioVolume.GetMute())
+
+    def set_mute(self, session: AudioSession, is_muted: bool):
+        session.SimpleAudioVolume.SetMute(int(is_muted), None)
+
+    def get_endpoint_volume(self, device: PycawDevice) -> int:
+        return round(device.endpoint_volume.GetMasterVolumeLevelScalar() * 100)
+
+    def set_endpoint_volume(self, device: PycawDevice, volume: int):
+        device.endpoint_volume.SetMasterVolumeLevelScalar(float(volume) / 100, None)
+
+    def is_endpoint_muted(self, device: PycawDevice) -> bool:
+        return bool(device.endpoint_volume.GetMute())
+
+    def set_endpoint_mute(self, device: PycawDevice, is_muted: bool):
+        device.endpoint_volume.SetMute(int(is_muted), None)
+
+    def describe_executable(self, exe: str) -> str:
+        return get_file_description(exe)
@@ -0,0 +1,93 @@
+from dataclasses import dataclass
+from typing import Callable
+
+
+@dataclass(slots=True)
+class Ramp:
+    start_volume: int
+    target: int
+    started_at: float
+    duration: float
+    curve: Callable[[float], float]
+    volume: int  # The latest volume set by the ramp
+
+
+class RampScheduler:
+    """
+    Volume ramps of many sessions stepped together on a fixed tick. A ramp goes from the volume it has started at to
+    the target along a curve, a new ramp of a PID replaces the running one.
+    Like `EventCoalescer` it doesn't keep time itself, the owner passes `now` and sleeps no longer than `timeout()`.
+    """
+
+    curves: dict[str, Callable[[float], float]] = {
+        'linear': lambda x: x,
+        'ease_in': lambda x: x * x,
+        'ease_out': lambda x: x * (2 - x),
+        'ease_in_out': lambda x: x * x * (3 - 2 * x),
+    }
+
+    def __init__(self, tick: float):
+        self.tick = tick
+        self._ramps: dict[int, Ramp] = dict()  # PID -> ramp
+        self._next_tick: float | None = None  # None if there are no ramps
+
+    def __contains__(self, pid: int) -> bool:
+        """Thread safe, so sessions callbacks can check whether a volume change is an echo of a ramp step"""
+        return pid in self._ramps
+
+    def __len__(self) -> int:
+        return len(self._ramps)
+
+    def start(self, pid: int, start_volume: int, target: int, duration: float, curve: str, now: float) -> None:
+        """:param duration: Seconds, the ramp ends on the first tick after it"""
+        if curve not in self.curves:
+            raise ValueError(f'Unknown curve {curve!r}, expected one of {tuple(self.curves)}')
+
+        self._ramps[pid] = Ramp(start_volume, target, now, duration, self.curves[curve], start_volume)
+        if self._next_tick is None:
+            self._next_tick = now + self.tick
+
+    def cancel(self, pid: int) -> bool:
+        """Returns whether the PID had a running ramp"""
+        cancelled = self._ramps.pop(pid, None) is not None
+        if len(self._ramps) == 0:
+            self._next_tick = None
+
+        return cancelled
+
+    def timeout(self, now: float) -> float | None:
+        """How long to wait until the next tick, None if there are no ramps"""
+        if self._next_tick is None:
+            return None
+
+        return max(0.0, self._next_tick - now)
+
+    def pop_due(self, now: float) -> tuple[list[tuple[int, int]], list[int]]:
+        """
+        Steps every ramp if a tick is due. Returns (PID, volume) to set for ramps which volume has changed since the
+        previous tick and PIDs of ramps which have finished with this step, they are forgotten
+        """
+        if self._next_tick is None or now < self._next_tick:
+            return list(), list()
+
+        # Ticks missed by a busy owner are skipped rather than caught up with
+        self._next_tick += self.tick
+        if self._next_tick <= now:
+            self._next_tick = now + self.tick
+
+        steps = list()
+        finished = list()
+        for pid, ramp in self._ramps.items():
+            progress = 1.0 if ramp.duration <= 0 else min(1.0, (now - ramp.started_at) / ramp.duration)
+            volume = round(ramp.start_volume + (ramp.target - ramp.start_volume) * ramp.curve(progress))
+            if volume != ramp.volume:
+                ramp.volume = volume
+                steps.append((pid, volume))
+
+            if progress >= 1.0:
+                finished.append(pid)
+
+        for pid in finished:
+            self.cancel(pid)
+
+        return steps, finished
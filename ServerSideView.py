@@ -1,21 +1,23 @@
+import itertools
 import queue
+import random
+import selectors
+import time
+from collections import deque
 from queue import Queue
 from threading import Thread
+from typing import Sequence
 from loguru import logger
 import Events
-# from typing import TypedDict
-from dataclasses import asdict
 
 from TransportABC import TransportABC
 from NetworkTransport import NetworkTransport
-
-
-# class SessionState(TypedDict):
-#     pid: int
-#     volume: float
-#     is_muted: bool
-#     is_active: bool
-#     name: str
+from WakeupQueue import WakeupQueue
+from EventCoalescer import EventCoalescer
+from SubscriptionIndex import SubscriptionIndex
+from SharedStateTable import SharedStateTable
+from SessionState import SessionState
+from Metrics import metrics
 
 
 class ServerSideView(Thread):
@@ -31,27 +33,77 @@ class ServerSideView(Thread):
     `AudioController`'s work with queues performs in main thread.
     Callback calls by pycaw performs in pycaw's internal threads.
     `ServerSideView` executing in its own thread.
+    `ServerSideView` sleeps in its selector until either a transport's socket gets ready or `AudioController` puts
+    a message to `inbound_q` (which is a `WakeupQueue` registered in the same selector), so there is no polling.
+    Several transports can be served at once, they share the selector and every update as one `Events.EventBatch`,
+    which is serialized once per wire format for all of them.
     """
 
     daemon = True
     running = True
+    history_size = 4096  # How many latest sent events are kept for clients to resync from
+    max_seq = 2 ** 31 - 1  # Sequence numbers fit int32 of binary wire format, a new epoch starts when they run out
 
-    def __init__(self, inbound_q: Queue, outbound_q: Queue):
+    def __init__(
+            self,
+            inbound_q: WakeupQueue,
+            outbound_q: Queue,
+            transport_cls: type[TransportABC] | Sequence[type[TransportABC]] = NetworkTransport,
+            coalesce_window: float = 0.005,
+            state_table_path: str | None = None,
+            state_table_capacity: int = 1024
+    ):
         """
         :param inbound_q: Queue from AudioController to ServerSideView
         :param outbound_q: Queue from ServerSideView to AudioController
+        :param transport_cls: `TransportABC` implementation to serve clients with, or several of them
+        :param coalesce_window: Seconds, volume and mute changes of a session within the window are collapsed to the
+        latest one, see `EventCoalescer`. 0 to send every event
+        :param state_table_path: File to keep `SharedStateTable` in for local readers, None to not keep it
+        :param state_table_capacity: Processes the state table has slots for
         """
         super().__init__()
         self.inbound_q = inbound_q
         self.outbound_q = outbound_q
 
-        self.transport: TransportABC = NetworkTransport(self.rcv_callback)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self.inbound_q, selectors.EVENT_READ, self._on_inbound_q_ready)
+
+        transport_classes = (transport_cls,) if isinstance(transport_cls, type) else tuple(transport_cls)
+        self.transports: list[TransportABC] = [cls(self.rcv_callback, self._selector) for cls in transport_classes]
+        self._coalescer = EventCoalescer(coalesce_window)
+
+        # Holds current state of processes received from AudioController, PID : state of all its sessions
+        self._state: dict[int, SessionState] = dict()
+        # The same for devices, device id : {event class : event}, DeviceAdded goes first
+        self._devices: dict[str, dict[type[Events.ServerToClientEvent], Events.ServerToClientEvent]] = dict()
+        self._snapshot: list[Events.ServerToClientEvent] | None = None  # Flattened `_state`, None if outdated
+        self._snapshot_len = 0  # Length of the snapshot, kept up to date without building it
+
+        # Every sent event gets the next sequence number, the latest ones are kept for `Resync`
+        self._epoch = random.getrandbits(31)
+        self._seq = 0  # Sequence number of the latest sent event
+        self._history: deque[Events.ServerToClientEvent] = deque(maxlen=self.history_size)
+
+        # Clients which limited events they get by `Subscribe`, they are sent to one by one, others get broadcasts
+        self._subscriptions = SubscriptionIndex()
+
+        # `_state` of sessions mirrored to shared memory, written on every change
+        self._state_table: SharedStateTable | None = None
+        if state_table_path is not None:
+            try:
+                self._state_table = SharedStateTable(state_table_path, state_table_capacity)
+
+            except OSError:
+                logger.opt(exception=True).warning(f'Failed to create state table {state_table_path}')
 
-        self._state: dict[int, dict[str, int | str]] = dict()  # Holds current state of sessions received from AudioController
-        # PID : SessionState
+        metrics.sessions.set_function(lambda: len(self._state))
+        metrics.clients.set_function(self._client_count)
+        metrics.subscribed_clients.set_function(lambda: len(self._subscriptions))
 
     def rcv_callback(self, event: Events.ClientToServerEvent):
-        if isinstance(event, Events.NewClient):
+        metrics.events.labels('in', event.event).inc()
+        if isinstance(event, (Events.NewClient, Events.Resync, Events.Subscribe)):
             self.inbound_q.put(event)
 
         else:
@@ -59,62 +111,252 @@ class ServerSideView(Thread):
 
     def run(self) -> None:
         while self.running:
+            for key, mask in self._selector.select(self._select_timeout()):
+                callback = key.data
+                callback(key.fileobj, mask)
+
+            due = self._coalescer.pop_due(time.monotonic())
+            if len(due) > 0:
+                self._send(due)
+
+            for transport in self.transports:
+                transport.tick()
+
+        for transport in self.transports:
+            transport.shutdown()
+
+        if self._state_table is not None:
+            self._state_table.close()
+
+        self._selector.close()
+
+    def _select_timeout(self) -> float | None:
+        """The earliest of deadlines of the coalescer and of all transports"""
+        now = time.monotonic()
+        timeouts = [self._coalescer.timeout(now), *(transport.timeout(now) for transport in self.transports)]
+        return min((timeout for timeout in timeouts if timeout is not None), default=None)
+
+    def _client_count(self) -> int:
+        return sum(count for transport in self.transports if (count := transport.client_count()) is not None)
+
+    def stop(self) -> None:
+        """Thread safe, makes `run` to return"""
+        self.running = False
+        self.inbound_q.wakeup()
+
+    def _on_inbound_q_ready(self, inbound_q: WakeupQueue, mask: int) -> None:
+        """Everything what is in the queue goes to clients as one update, i.e. all changes of a batched command"""
+        inbound_q.drain_wakeup()
+        outgoing: list[Events.ServerToClientEvent] = list()
+        while True:
             try:
-                msg: Events.Event = self.inbound_q.get_nowait()
+                msg: Events.Event = inbound_q.get_nowait()
 
             except queue.Empty:
-                pass
+                break
 
-            else:
+            try:
                 # logger.debug(msg)
                 if isinstance(msg, Events.ServerToClientEvent):
-                    self._update_state(msg)
-                    self.transport.send(msg)
+                    if not self._update_state(msg):
+                        continue
+
+                    if self._state_table is not None:
+                        self._state_table.update(msg)
+
+                    outgoing.extend(self._coalescer.push(msg, time.monotonic()))
 
                 elif isinstance(msg, Events.NewClient):
-                    self._send_full_state()
+                    if len(outgoing) > 0:
+                        self._send(outgoing)
+                        outgoing = list()
+
+                    self._send_full_state(msg.client_id)
+
+                elif isinstance(msg, Events.Resync):
+                    if len(outgoing) > 0:
+                        self._send(outgoing)
+                        outgoing = list()
+
+                    self._resync(msg.client_id, msg.last_seq, msg.epoch)
+
+                elif isinstance(msg, Events.Subscribe):
+                    if len(outgoing) > 0:
+                        self._send(outgoing)
+                        outgoing = list()
+
+                    self._subscribe(msg)
 
                 else:
                     logger.warning(f'Unknown event {msg}')
 
-            self.transport.tick()
+            except Exception:  # A malformed message mustn't stop the view
+                logger.opt(exception=True).warning(f'Failed to handle {msg}')
+
+        if len(outgoing) > 0:
+            self._send(outgoing)
+
+    def _send(self, events: list[Events.ServerToClientEvent]) -> None:
+        """
+        Sends events to all clients as one update, numbered and followed by `Synced`. Subscribed clients get only
+        events they are subscribed to and nothing if there are none
+        """
+        if self._seq + len(events) > self.max_seq:
+            logger.info('Sequence numbers ran out, starting a new epoch')
+            self._epoch = random.getrandbits(31)
+            self._seq = 0
+            self._history.clear()
+
+        self._seq += len(events)
+        self._history.extend(events)
+        synced = self._synced()
+        batch = Events.EventBatch(events)
+        batch.append(synced)
+        for transport in self.transports:
+            transport.send_many(batch)
+
+        if len(self._subscriptions) > 0:
+            for client_id, routed in self._subscriptions.route(events, self._process_state).items():
+                if len(routed) > 0:
+                    routed.append(synced)
+                    self._send_to(client_id, routed)
 
-        self.transport.shutdown()
+        now = time.perf_counter()
+        for event in events:
+            metrics.events.labels('out', event.event).inc()
+            metrics.callback_to_wire.labels(event.event).observe(now - event._created_at)
+
+    def _update_state(self, event: Events.ServerToClientEvent) -> bool:
+        """
+        Returns False if the event is about unknown session, i.e. its NewSession got dropped by overloaded queue, or
+        if it doesn't change the state, i.e. it is a session callback echoing a change `AudioController` has already
+        reported
+        """
+        if isinstance(event, self.device_events):
+            return self._update_device_state(event)
 
-    def _update_state(self, event: Events.ServerToClientEvent) -> None:
         if isinstance(event, Events.NewSession):
-            self._state[event.PID] = dict()
+            replaced = self._state.get(event.PID)
+            if replaced is not None:
+                self._snapshot_len -= replaced.event_count()
+
+            self._state[event.PID] = SessionState(event.PID)
+            self._snapshot_len += 1
+
+        else:
+            state = self._state.get(event.PID)
+            if state is None:
+                logger.warning(f'Event for unknown session {event}')
+                return False
+
+            count = state.event_count()
+            if isinstance(event, Events.SessionClosed):
+                del self._state[event.PID]
+                self._snapshot_len -= count
+
+            elif not state.apply(event):
+                return False
 
-        elif isinstance(event, Events.SessionClosed):
-            del self._state[event.PID]
+            else:
+                self._snapshot_len += state.event_count() - count
+
+        self._snapshot = None
+
+        return True
+
+    device_events = (Events.DeviceAdded, Events.DeviceRemoved, Events.EndpointVolumeChanged, Events.EndpointMuteChanged)
+
+    def _update_device_state(self, event: Events.ServerToClientEvent) -> bool:
+        """`_update_state` for devices events"""
+        if not isinstance(event, Events.DeviceAdded) and event.device_id not in self._devices:
+            logger.warning(f'Event for unknown device {event}')
+            return False
+
+        if isinstance(event, Events.DeviceAdded):
+            self._snapshot_len += 1 - len(self._devices.get(event.device_id, ()))
+            self._devices[event.device_id] = {Events.DeviceAdded: event}
+
+        elif isinstance(event, Events.DeviceRemoved):
+            self._snapshot_len -= len(self._devices.pop(event.device_id))
 
         else:
-            dicted = asdict(event)
-            del dicted['event']
-
-            self._state[event.PID].update(dicted)
-
-        # logger.trace(f'state: {self._state}')
-
-    def _send_full_state(self):
-        """Send full state of sessions to clients"""
-        logger.trace(f'Sending full state')
-        subclasses = tuple(Events.enumerate_subclasses(Events.ServerToClientEvent))
-        for session in self._state.values():
-            for cls in subclasses:
-                if cls.__name__ == 'SessionClosed':
-                    continue
-
-                try:
-                    kwargs = dict()
-                    for field in cls.__dict__['__dataclass_fields__'].keys():
-                        if field != 'event':
-                            # args.append(session[field])
-                            kwargs[field] = session[field]
-
-                    event: Events.ServerToClientEvent = cls(**kwargs) # Noqa
-                    self.transport.send(event)
-
-                except KeyError:  # We don't have appropriate field in state for this kind of events
-                    # logger.debug(f'Passing {cls}')
-                    pass
+            device = self._devices[event.device_id]
+            if device.get(type(event)) == event:
+                return False
+
+            self._snapshot_len += type(event) not in device
+            device[type(event)] = event
+
+        self._snapshot = None
+        return True
+
+    def _synced(self) -> Events.Synced:
+        return Events.Synced(-1, self._seq, self._epoch)
+
+    def _get_snapshot(self) -> list[Events.ServerToClientEvent]:
+        if self._snapshot is None:
+            self._snapshot = [event for device in self._devices.values() for event in device.values()]
+            self._snapshot.extend(event for state in self._state.values() for event in state.events())
+
+        return self._snapshot
+
+    def _process_state(self, pid: int) -> list[Events.ServerToClientEvent]:
+        state = self._state.get(pid)
+        return [] if state is None else state.events()
+
+    def _send_to(self, client_id: int, events: list[Events.ServerToClientEvent], is_state: bool = False):
+        """Sends to the client by the transport it is connected to"""
+        if any(transport.send_to(client_id, events, is_state) for transport in self.transports):
+            return
+
+        logger.debug('No connection for client {}', client_id)
+        if client_id in self._subscriptions:
+            self._subscriptions.unsubscribe(client_id)  # The client has disconnected
+            for transport in self.transports:
+                transport.set_filtered(client_id, False)
+
+    def _send_full_state(self, client_id: int):
+        """Send full state of devices and sessions to the new client as one message"""
+        events = self._get_snapshot()
+        if client_id in self._subscriptions:
+            events = self._subscriptions.filter(client_id, events)
+
+        self._send_to(client_id, [*events, self._synced()], is_state=True)
+        metrics.resyncs.labels('full').inc()
+
+    def _resync(self, client_id: int, last_seq: int, epoch: int):
+        """Send events the client has missed since `last_seq`, full state if they aren't kept or it is shorter"""
+        if type(last_seq) is not int or type(epoch) is not int:  # Whatever a transport has let through
+            logger.debug('Client {} sent malformed resync, sending full state', client_id)
+            self._send_full_state(client_id)
+            return
+
+        missed = self._seq - last_seq
+        if epoch != self._epoch or not 0 <= missed <= len(self._history) or missed > self._snapshot_len:
+            logger.debug('Client {} missed {} events of epoch {}, sending full state', client_id, missed, epoch)
+            self._send_full_state(client_id)
+            return
+
+        logger.trace('Sending {} missed events to {}', missed, client_id)
+        events = list(itertools.islice(reversed(self._history), missed))
+        events.reverse()
+        if client_id in self._subscriptions:
+            events = self._subscriptions.filter(client_id, events)
+
+        events.append(self._synced())
+        self._send_to(client_id, events, is_state=True)
+        metrics.resyncs.labels('delta').inc()
+
+    def _subscribe(self, event: Events.Subscribe):
+        names = ((pid, state.name) for pid, state in self._state.items() if state.name is not None)
+        is_filtered = self._subscriptions.subscribe(event, names)
+        if not is_filtered:
+            for transport in self.transports:
+                transport.set_filtered(event.client_id, False)
+
+        elif not any(transport.set_filtered(event.client_id, True) for transport in self.transports):
+            logger.warning("Transport of client {} can't filter events or the client has disconnected, "
+                           "ignoring subscription", event.client_id)
+            self._subscriptions.unsubscribe(event.client_id)
+
+        logger.debug('Client {} subscribed to {}', event.client_id, event)
@@ -0,0 +1,93 @@
+from dataclasses import dataclass, field
+
+from loguru import logger
+
+import Events
+
+
+@dataclass(slots=True)
+class SessionState:
+    """
+    Current state of a process' sessions as `ServerSideView` keeps it: values of the latest events instead of
+    the events, None for what hasn't been reported yet. Events for full state are built from the values when asked,
+    and kept until the state changes
+    """
+
+    pid: int
+    volume: int | None = None
+    is_muted: bool | None = None
+    is_active: bool | None = None
+    name: str | None = None
+    sessions: dict[int, str] = field(default_factory=dict)  # Session id : device id, see `SessionAdded`
+    _events: list[Events.ServerToClientEvent] | None = field(default=None, repr=False, compare=False)
+
+    def apply(self, event: Events.ServerToClientEvent) -> bool:
+        """Returns False if the event doesn't change the state, i.e. it is an echo of a change reported already"""
+        if isinstance(event, Events.VolumeChanged):
+            if event.new_volume == self.volume:
+                return False
+
+            self.volume = event.new_volume
+
+        elif isinstance(event, Events.MuteStateChanged):
+            if event.is_muted == self.is_muted:
+                return False
+
+            self.is_muted = event.is_muted
+
+        elif isinstance(event, Events.StateChanged):
+            if event.is_active == self.is_active:
+                return False
+
+            self.is_active = event.is_active
+
+        elif isinstance(event, Events.SetName):
+            if event.name == self.name:
+                return False
+
+            self.name = event.name
+
+        elif isinstance(event, Events.SessionAdded):
+            self.sessions[event.session_id] = event.device_id
+
+        elif isinstance(event, Events.SessionRemoved):
+            if self.sessions.pop(event.session_id, None) is None:
+                logger.warning(f'Event for unknown session {event}')
+                return False
+
+        else:
+            logger.warning(f'Event {event} is not a state of a session')
+            return False
+
+        self._events = None
+        return True
+
+    def events(self) -> list[Events.ServerToClientEvent]:
+        """The state as events which would make it, `NewSession` goes first"""
+        events = self._events
+        if events is None:
+            pid = self.pid
+            events = [Events.NewSession(pid)]
+            events.extend(
+                Events.SessionAdded(pid, session_id, device_id) for session_id, device_id in self.sessions.items()
+            )
+            if self.name is not None:
+                events.append(Events.SetName(pid, self.name))
+
+            if self.volume is not None:
+                events.append(Events.VolumeChanged(pid, self.volume))
+
+            if self.is_muted is not None:
+                events.append(Events.MuteStateChanged(pid, self.is_muted))
+
+            if self.is_active is not None:
+                events.append(Events.StateChanged(pid, self.is_active))
+
+            self._events = events
+
+        return events
+
+    def event_count(self) -> int:
+        """Length of `events()` without building them"""
+        known = (self.name, self.volume, self.is_muted, self.is_active)
+        return 1 + len(self.sessions) + len(known) - known.count(None)
@@ -0,0 +1,293 @@
+"""
+Memory-mapped table of current state of sessions, for local readers (overlays, stream deck plugins) which want
+the mixer's state without a connection, syscalls and parsing: `ServerSideView` writes it on every change of state,
+`SharedStateReader` reads it. Only the standard library is needed on both sides.
+
+Layout, little-endian, all offsets are from the start of the file:
+header, `HEADER_SIZE` bytes:
+    magic b'ACST', layout version uint16, slot size uint16, name size uint16, padding uint16,
+    capacity uint32 (slots in the table), used uint32 (slots below this index may hold a process),
+    updates uint32 (incremented after every change, so a reader may skip reading an unchanged table),
+    writer PID uint32 (0 when the server isn't running, the table is stale then), epoch uint32 (random, changes
+    when the server restarts), flags uint32 (`FLAG_OVERFLOW`: there were more processes than slots)
+then `capacity` slots of `slot size` bytes:
+    version uint32 (seqlock: odd while the slot is being written), PID int32 (0 for a free slot),
+    volume int16, is muted int8, is active int8 (-1 for these three while not known yet),
+    name offset uint32, name length uint16 (UTF-8 bytes at name offset, truncated to name size)
+then `capacity` name areas of `name size` bytes, name of slot `i` is in area `i`.
+
+One slot is kept per process, as clients address sessions by PID. A reader copies a slot and its name and takes
+the copy if the version was even and the same before and after. Python can't issue memory barriers, so this relies
+on stores of the writer getting visible to other processes in program order, as they do on x86 and x64.
+The file never shrinks, so a reader which has mapped it never reads beyond its end.
+"""
+import itertools
+import mmap
+import os
+import random
+import struct
+import tempfile
+import time
+from dataclasses import dataclass
+
+from loguru import logger
+
+import Events
+
+MAGIC = b'ACST'
+LAYOUT_VERSION = 1
+HEADER = struct.Struct('<4sHHHHIIIIII')
+HEADER_SIZE = 64
+SLOT = struct.Struct('<IihbbIH')
+SLOT_SIZE = 32
+NAME_SIZE = 64
+FLAG_OVERFLOW = 1
+
+VERSION = struct.Struct('<I')
+UINT32 = struct.Struct('<I')
+PID = struct.Struct('<i')
+VOLUME = struct.Struct('<h')
+FLAG = struct.Struct('<b')
+NAME = struct.Struct('<IH')
+# Offsets of fields within the header and a slot
+CAPACITY_OFFSET, USED_OFFSET, UPDATES_OFFSET, WRITER_PID_OFFSET, EPOCH_OFFSET, FLAGS_OFFSET = 12, 16, 20, 24, 28, 32
+PID_OFFSET, VOLUME_OFFSET, MUTED_OFFSET, ACTIVE_OFFSET, NAME_OFFSET = 4, 8, 10, 11, 12
+
+default_path = os.path.join('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'audiocontrol.state')
+
+
+class SharedStateTable:
+    """The writing side, used by `ServerSideView` from its thread only"""
+
+    def __init__(self, path: str = default_path, capacity: int = 1024):
+        self.path = path
+        self.capacity = capacity
+        size = HEADER_SIZE + capacity * (SLOT_SIZE + NAME_SIZE)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o600)
+        try:
+            size = max(size, os.fstat(fd).st_size)  # Readers may have mapped a bigger table of a previous run
+            os.ftruncate(fd, size)
+            self._mmap = mmap.mmap(fd, size)
+
+        finally:
+            os.close(fd)
+
+        self._mmap[:] = bytes(size)
+        self._slots: dict[int, int] = dict()  # PID : index of its slot
+        self._versions = [0] * capacity  # Versions of slots, so they aren't read back to be incremented
+        self._free: list[int] = list()  # Freed slots below `_used`, to be reused first
+        self._used = 0
+        self._updates = 0
+        self._overflow_logged = False
+        HEADER.pack_into(
+            self._mmap, 0, MAGIC, LAYOUT_VERSION, SLOT_SIZE, NAME_SIZE, 0, capacity, 0, 0, os.getpid(),
+            random.getrandbits(32), 0
+        )
+
+    def update(self, event: Events.ServerToClientEvent) -> None:
+        """Applies a state event which has changed the state, events of devices and of unknown processes are ignored"""
+        if isinstance(event, Events.NewSession):
+            self._add(event.PID)
+            return
+
+        index = self._slots.get(event.PID)
+        if index is None:
+            return
+
+        if isinstance(event, Events.VolumeChanged):
+            self._write(index, VOLUME, VOLUME_OFFSET, event.new_volume)
+
+        elif isinstance(event, Events.MuteStateChanged):
+            self._write(index, FLAG, MUTED_OFFSET, event.is_muted)
+
+        elif isinstance(event, Events.StateChanged):
+            self._write(index, FLAG, ACTIVE_OFFSET, event.is_active)
+
+        elif isinstance(event, Events.SetName):
+            self._write_name(index, event.name)
+
+        elif isinstance(event, Events.SessionClosed):
+            del self._slots[event.PID]
+            self._write(index, PID, PID_OFFSET, 0)
+            self._free.append(index)
+
+        else:
+            return
+
+        self._updated()
+
+    def _add(self, pid: int) -> None:
+        index = self._slots.get(pid)  # Never the case unless a process' closing got dropped, it gets reset then
+        if index is None:
+            if len(self._free) > 0:
+                index = self._free.pop()
+
+            elif self._used < self.capacity:
+                index = self._used
+                self._used += 1
+                UINT32.pack_into(self._mmap, USED_OFFSET, self._used)
+
+            else:
+                if not self._overflow_logged:
+                    logger.warning(f'State table is full, {self.capacity} processes, process {pid} is left out')
+                    self._overflow_logged = True
+                    UINT32.pack_into(self._mmap, FLAGS_OFFSET, FLAG_OVERFLOW)
+
+                return
+
+            self._slots[pid] = index
+
+        offset = HEADER_SIZE + index * SLOT_SIZE
+        version = self._versions[index] + 1
+        VERSION.pack_into(self._mmap, offset, version)
+        SLOT.pack_into(
+            self._mmap, offset, version, pid, -1, -1, -1, HEADER_SIZE + self.capacity * SLOT_SIZE + index * NAME_SIZE, 0
+        )
+        VERSION.pack_into(self._mmap, offset, version + 1)
+        self._versions[index] = version + 1
+        self._updated()
+
+    def _write(self, index: int, field: struct.Struct, field_offset: int, value: int) -> None:
+        offset = HEADER_SIZE + index * SLOT_SIZE
+        version = self._versions[index] + 1
+        VERSION.pack_into(self._mmap, offset, version)
+        field.pack_into(self._mmap, offset + field_offset, value)
+        VERSION.pack_into(self._mmap, offset, version + 1)
+        self._versions[index] = version + 1
+
+    def _write_name(self, index: int, name: str) -> None:
+        encoded = name.encode()
+        if len(encoded) > NAME_SIZE:
+            encoded = encoded[:NAME_SIZE].decode(errors='ignore').encode()  # Not cut in the middle of a character
+
+        offset = HEADER_SIZE + index * SLOT_SIZE
+        name_offset = HEADER_SIZE + self.capacity * SLOT_SIZE + index * NAME_SIZE
+        version = self._versions[index] + 1
+        VERSION.pack_into(self._mmap, offset, version)
+        self._mmap[name_offset:name_offset + len(encoded)] = encoded
+        NAME.pack_into(self._mmap, offset + NAME_OFFSET, name_offset, len(encoded))
+        VERSION.pack_into(self._mmap, offset, version + 1)
+        self._versions[index] = version + 1
+
+    def _updated(self) -> None:
+        self._updates = (self._updates + 1) & 0xFFFFFFFF
+        UINT32.pack_into(self._mmap, UPDATES_OFFSET, self._updates)
+
+    def close(self) -> None:
+        """Marks the table stale, readers keep their mapping, the next run of the server reuses the file"""
+        UINT32.pack_into(self._mmap, WRITER_PID_OFFSET, 0)
+        self._mmap.close()
+
+
+@dataclass(slots=True)
+class SessionRecord:
+    pid: int
+    volume: int  # -1 while not known yet, as `is_muted` and `is_active` are
+    is_muted: int
+    is_active: int
+    name: str
+
+
+class SharedStateReader:
+    """
+    The reading side, for local tools. Reads go to the mapped memory, the file is reopened only if the server has
+    made it bigger. Not thread safe
+    """
+
+    spins = 100  # Attempts to read a slot which is being written before yielding to let the writer finish
+    max_wait = 1.0  # Seconds, a slot left odd for longer means the writer has died in the middle of writing it
+
+    def __init__(self, path: str = default_path):
+        self.path = path
+        self.retries = 0  # Times a slot was read again because the writer was changing it, for diagnostics
+        self._indexes: dict[int, int] = dict()  # PID : slot where it was found last time
+        self._mmap: mmap.mmap | None = None
+        self._open()
+
+    def _open(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+
+        with open(self.path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, layout_version, slot_size, name_size, _, capacity, *_ = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or layout_version != LAYOUT_VERSION or slot_size != SLOT_SIZE or name_size != NAME_SIZE:
+            raise ValueError(f'{self.path} is not a state table of layout version {LAYOUT_VERSION}')
+
+        self._capacity = capacity
+        self._indexes.clear()
+
+    def _check_capacity(self) -> None:
+        if UINT32.unpack_from(self._mmap, CAPACITY_OFFSET)[0] != self._capacity:  # A restarted server has resized it
+            self._open()
+
+    @property
+    def updates(self) -> int:
+        """Changes with every update of the table, cheap to poll"""
+        return UINT32.unpack_from(self._mmap, UPDATES_OFFSET)[0]
+
+    @property
+    def is_running(self) -> bool:
+        """False if the server has stopped and the table is stale"""
+        return UINT32.unpack_from(self._mmap, WRITER_PID_OFFSET)[0] != 0
+
+    @property
+    def epoch(self) -> int:
+        return UINT32.unpack_from(self._mmap, EPOCH_OFFSET)[0]
+
+    @property
+    def is_complete(self) -> bool:
+        """False if there were more processes than the table has slots"""
+        return not UINT32.unpack_from(self._mmap, FLAGS_OFFSET)[0] & FLAG_OVERFLOW
+
+    def _read_slot(self, index: int) -> SessionRecord | None:
+        """Consistent copy of the slot, None if it is free"""
+        buffer = self._mmap
+        offset = HEADER_SIZE + index * SLOT_SIZE
+        deadline = None
+        for attempt in itertools.count():
+            version, pid, volume, is_muted, is_active, name_offset, name_length = SLOT.unpack_from(buffer, offset)
+            if version & 1 == 0:
+                name = buffer[name_offset:name_offset + name_length]
+                if VERSION.unpack_from(buffer, offset)[0] == version:
+                    if pid == 0:
+                        return None
+
+                    return SessionRecord(pid, volume, is_muted, is_active, name.decode(errors='replace'))
+
+            self.retries += 1
+            if attempt >= self.spins:
+                if deadline is None:
+                    deadline = time.monotonic() + self.max_wait
+
+                elif time.monotonic() > deadline:
+                    raise TimeoutError(f'Slot {index} keeps being written')
+
+                time.sleep(0)  # On a busy CPU the writer may be preempted in the middle of the slot
+
+    def sessions(self) -> list[SessionRecord]:
+        """All processes, every record is consistent on its own"""
+        self._check_capacity()
+        records = list()
+        self._indexes.clear()
+        for index in range(UINT32.unpack_from(self._mmap, USED_OFFSET)[0]):
+            record = self._read_slot(index)
+            if record is not None:
+                records.append(record)
+                self._indexes[record.pid] = index
+
+        return records
+
+    def session(self, pid: int) -> SessionRecord | None:
+        """The process' record, looked up in the slot it was found in last time first"""
+        index = self._indexes.get(pid)
+        if index is not None:
+            record = self._read_slot(index)
+            if record is not None and record.pid == pid:
+                return record
+
+        return next((record for record in self.sessions() if record.pid == pid), None)
+
+    def close(self) -> None:
+        self._mmap.close()
@@ -0,0 +1,296 @@
+import itertools
+import os
+import random
+import threading
+from loguru import logger
+
+from AudioBackendABC import AudioBackendABC, SessionKey
+
+
+class SimulatedProcess:
+    """Part of `psutil.Process` which is used for sessions"""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.running = True
+
+    def name(self) -> str:
+        return f'simulated-{self.pid % 100}.exe'  # Many sessions share an executable, as browser tabs do
+
+    def exe(self) -> str:
+        return os.path.join('simulated', self.name())
+
+    def is_running(self) -> bool:
+        return self.running
+
+    def __repr__(self):
+        return f'SimulatedProcess(pid={self.pid}, name={self.name()!r})'
+
+
+class SimulatedSession:
+    """Part of pycaw's `AudioSession` which is used by `AudioController`"""
+
+    def __init__(self, process: SimulatedProcess, device_id: str, instance: int):
+        """:param instance: Tells apart sessions of the same process on the same device"""
+        self.ProcessId = process.pid
+        self.Process = process
+        self.State = 1
+        self.InstanceIdentifier = f'{device_id}|simulated-{process.pid}|{instance}'
+        self.device_id = device_id
+        self.volume = 100
+        self.is_muted = False
+        self.key: SessionKey | None = None  # Given on registration, notifications identify the session by it
+        self.listener: 'AudioController.AudioController | None' = None
+        self.lock = threading.Lock()  # Changes of a session and their notifications are ordered, as in Windows
+
+
+class SimulatedDevice:
+    """Output device with master volume"""
+
+    def __init__(self, device_id: str):
+        self.id = device_id
+        self.FriendlyName = f'Simulated speakers {device_id}'
+        self.volume = 100
+        self.is_muted = False
+        self.listener: 'AudioController.AudioController | None' = None
+        self.lock = threading.Lock()
+
+
+class SimulatedBackend(AudioBackendABC):
+    """
+    Pure python backend for load testing on any OS: sessions live in memory, notifications get called synchronously
+    from the thread which caused them, i.e. `storm` threads, as COM calls them from its own threads.
+    """
+
+    def __init__(self, sessions: int = 0, devices: int = 1):
+        """
+        :param sessions: How many sessions exist before start, they are spread over devices
+        :param devices: How many output devices exist before start
+        """
+        self._lock = threading.Lock()
+        self._devices: dict[str, SimulatedDevice] = dict()
+        self._sessions: dict[str, SimulatedSession] = dict()  # Mapping InstanceIdentifier to session
+        self._sessions_list: list[SimulatedSession] | None = None  # Cached `get_sessions`, None if outdated
+        self._pid_counter = itertools.count(1)
+        self._instance_counter = itertools.count()
+        self._device_counter = itertools.count()
+        self._listener: 'AudioController.AudioController | None' = None
+        for _ in range(devices):
+            self.add_device()
+
+        for _ in range(sessions):
+            self.add_session()
+
+    def start(self, listener: 'AudioController.AudioController'):
+        self._listener = listener
+
+    def stop(self):
+        self._listener = None
+
+    def get_devices(self) -> list[SimulatedDevice]:
+        with self._lock:
+            return list(self._devices.values())
+
+    def get_sessions(self, device: SimulatedDevice | None = None) -> list[SimulatedSession]:
+        """Sessions of all devices if `device` is None"""
+        with self._lock:
+            if self._sessions_list is None:
+                self._sessions_list = list(self._sessions.values())
+
+            sessions = self._sessions_list
+
+        if device is None:
+            return sessions
+
+        return [session for session in sessions if session.device_id == device.id]
+
+    def register_device(self, device: SimulatedDevice, listener: 'AudioController.AudioController'):
+        device.listener = listener
+
+    def unregister_device(self, device: SimulatedDevice):
+        device.listener = None
+
+    def register(self, key: SessionKey, session: SimulatedSession, listener: 'AudioController.AudioController'):
+        session.key = key
+        session.listener = listener
+
+    def unregister(self, session: SimulatedSession):
+        session.listener = None
+
+    def get_volume(self, session: SimulatedSession) -> int:
+        return session.volume
+
+    def set_volume(self, session: SimulatedSession, volume: int):
+        self.change_volume(session, volume)
+
+    def is_muted(self, session: SimulatedSession) -> bool:
+        return session.is_muted
+
+    def set_mute(self, session: SimulatedSession, is_muted: bool):
+        self.change_mute(session, is_muted)
+
+    def get_endpoint_volume(self, device: SimulatedDevice) -> int:
+        return device.volume
+
+    def set_endpoint_volume(self, device: SimulatedDevice, volume: int):
+        self.change_endpoint(device, volume, device.is_muted)
+
+    def is_endpoint_muted(self, device: SimulatedDevice) -> bool:
+        return device.is_muted
+
+    def set_endpoint_mute(self, device: SimulatedDevice, is_muted: bool):
+        self.change_endpoint(device, device.volume, is_muted)
+
+    def describe_executable(self, exe: str) -> str:
+        return f'Simulated application {os.path.basename(exe)}'
+
+    # The methods below simulate what happens in the system, notifying a registered listener as Windows would do
+
+    def add_device(self) -> SimulatedDevice:
+        device = SimulatedDevice(f'simulated-{next(self._device_counter)}')
+        with self._lock:
+            self._devices[device.id] = device
+
+        listener = self._listener
+        if listener is not None:
+            listener.on_devices_changed()
+
+        return device
+
+    def remove_device(self, device: SimulatedDevice):
+        """Sessions of the device get disconnected, as Windows does"""
+        with self._lock:
+            if self._devices.pop(device.id, None) is None:
+                return
+
+            sessions = [session for session in self._sessions.values() if session.device_id == device.id]
+            for session in sessions:
+                del self._sessions[session.InstanceIdentifier]
+
+            self._sessions_list = None
+
+        for session in sessions:
+            with session.lock:
+                session.State = 2
+                self._notify(session, 'on_session_disconnected', 'DeviceRemoval', 0)
+
+        listener = self._listener
+        if listener is not None:
+            listener.on_devices_changed()
+
+    def change_endpoint(self, device: SimulatedDevice, volume: int, is_muted: bool):
+        with device.lock:
+            if (volume, is_muted) != (device.volume, device.is_muted):
+                device.volume, device.is_muted = volume, is_muted
+                listener = device.listener
+                if listener is not None:
+                    listener.on_endpoint_volume_changed(device.id, volume, is_muted)
+
+    def add_session(self, device: SimulatedDevice | None = None,
+                    process: SimulatedProcess | None = None) -> SimulatedSession:
+        """
+        :param device: Devices take new sessions in turn if None
+        :param process: Process of another session to add one more session to, as browsers and games do, a new process
+        if None
+        """
+        if process is None:
+            process = SimulatedProcess(next(self._pid_counter))
+
+        with self._lock:
+            if device is None:
+                devices = tuple(self._devices.values())
+                device = devices[process.pid % len(devices)]
+
+            session = SimulatedSession(process, device.id, next(self._instance_counter))
+            self._sessions[session.InstanceIdentifier] = session
+            self._sessions_list = None
+
+        listener = device.listener
+        if listener is not None:
+            listener.on_session_created(device.id, session)
+
+        return session
+
+    def expire_session(self, session: SimulatedSession):
+        """The process exits with its last session"""
+        with self._lock:
+            if self._sessions.pop(session.InstanceIdentifier, None) is None:
+                return
+
+            self._sessions_list = None
+            is_last = all(other.Process is not session.Process for other in self._sessions.values())
+
+        with session.lock:
+            session.State = 2
+            if is_last:
+                session.Process.running = False
+
+            self._notify(session, 'on_state_changed', 'Expired', 2)
+
+    def change_volume(self, session: SimulatedSession, volume: int):
+        with session.lock:
+            if volume != session.volume:
+                session.volume = volume
+                self._notify(session, 'on_volume_changed', volume)
+
+    def change_mute(self, session: SimulatedSession, is_muted: bool):
+        with session.lock:
+            if is_muted != session.is_muted:
+                session.is_muted = is_muted
+                self._notify(session, 'on_mute_changed', is_muted)
+
+    def change_state(self, session: SimulatedSession, is_active: bool):
+        with session.lock:
+            if session.State != 2:
+                session.State = int(is_active)
+                self._notify(session, 'on_state_changed', 'Active' if is_active else 'Inactive', int(is_active))
+
+    @staticmethod
+    def _notify(session: SimulatedSession, method: str, *args):
+        """Exceptions of a listener get logged and swallowed, as comtypes does for COM callbacks"""
+        listener = session.listener
+        if listener is None:
+            return
+
+        try:
+            getattr(listener, method)(session.key, *args)
+
+        except Exception:
+            logger.opt(exception=True).warning(f'Listener {method} failed for {session.key}')
+
+    def storm(self, threads: int = 4, events_per_thread: int = 10000, churn: float = 0.01, seed: int = 0):
+        """
+        Fire notifications from `threads` threads at once and wait until they are done.
+        Every thread changes volume, mute and activity of random sessions, `churn` is a share of events
+        which create a new session or expire an existing one instead.
+        """
+        def worker(rnd: random.Random):
+            for _ in range(events_per_thread):
+                sessions = self.get_sessions()
+                kind = rnd.random()
+                if kind < churn / 2 or len(sessions) == 0:
+                    self.add_session()
+                    continue
+
+                session = rnd.choice(sessions)
+                if kind < churn:
+                    self.expire_session(session)
+
+                elif kind < 0.8:
+                    self.change_volume(session, rnd.randint(0, 100))
+
+                elif kind < 0.95:
+                    self.change_mute(session, not session.is_muted)
+
+                else:
+                    self.change_state(session, not bool(session.State))
+
+        workers = [
+            threading.Thread(target=worker, args=(random.Random(seed + i),), name=f'SimulatedBackend-{i}')
+            for i in range(threads)
+        ]
+        for thread in workers:
+            thread.start()
+
+        for thread in workers:
+            thread.join()
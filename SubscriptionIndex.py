@@ -0,0 +1,157 @@
+import itertools
+from dataclasses import dataclass, field
+from fnmatch import fnmatchcase
+from typing import Callable, Iterable
+
+import Events
+
+
+@dataclass(slots=True)
+class Subscription:
+    pids: frozenset[int]
+    names: tuple[str, ...]  # Lowercase `fnmatch` patterns
+    events: frozenset[str] | None  # Event names, None for every event
+    matched: set[int] = field(default_factory=set)  # PIDs of running processes matched by names
+
+    def match_name(self, name: str) -> bool:
+        name = name.lower()
+        return any(fnmatchcase(name, pattern) for pattern in self.names)
+
+
+class SubscriptionIndex:
+    """
+    Subscriptions of clients which limit events they get (see `Subscribe` event), indexed by PID, so routing an event
+    costs a lookup and a check per client interested in its process only.
+    Clients without a subscription get broadcasts and aren't known here.
+    """
+
+    def __init__(self):
+        self._subscriptions: dict[int, Subscription] = dict()  # client_id : subscription
+        self._by_pid: dict[int, set[int]] = dict()  # PID : ids of clients subscribed to the process by PID or name
+        self._any_pid: set[int] = set()  # Ids of clients which don't limit processes
+        self._by_name: set[int] = set()  # Ids of clients which have name patterns
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    def __contains__(self, client_id: int) -> bool:
+        return client_id in self._subscriptions
+
+    def subscribe(self, event: Events.Subscribe, names: Iterable[tuple[int, str]]) -> bool:
+        """
+        Replaces subscription of `event.client_id`, `names` are (PID, name) of processes which names are known.
+        Returns False if the subscription doesn't limit anything, so the client is unsubscribed
+        """
+        client_id = event.client_id
+        self.unsubscribe(client_id)
+        if len(event.pids) == 0 and len(event.names) == 0 and len(event.events) == 0:
+            return False
+
+        subscription = Subscription(
+            frozenset(event.pids), tuple(pattern.lower() for pattern in event.names), frozenset(event.events) or None
+        )
+        self._subscriptions[client_id] = subscription
+        if len(subscription.pids) == 0 and len(subscription.names) == 0:
+            self._any_pid.add(client_id)
+
+        for pid in subscription.pids:
+            self._by_pid.setdefault(pid, set()).add(client_id)
+
+        if len(subscription.names) > 0:
+            self._by_name.add(client_id)
+            for pid, name in names:
+                if subscription.match_name(name):
+                    subscription.matched.add(pid)
+                    self._by_pid.setdefault(pid, set()).add(client_id)
+
+        return True
+
+    def unsubscribe(self, client_id: int) -> None:
+        subscription = self._subscriptions.pop(client_id, None)
+        if subscription is None:
+            return
+
+        for pid in subscription.pids | subscription.matched:
+            self._discard(pid, client_id)
+
+        self._any_pid.discard(client_id)
+        self._by_name.discard(client_id)
+
+    def filter(self, client_id: int, events: list[Events.ServerToClientEvent]) -> list[Events.ServerToClientEvent]:
+        """Events of `events` the client is subscribed to"""
+        subscription = self._subscriptions[client_id]
+        any_pid = client_id in self._any_pid
+        return [
+            event for event in events
+            if (subscription.events is None or event.event in subscription.events)
+            and (event.PID == -1 or any_pid or event.PID in subscription.pids or event.PID in subscription.matched)
+        ]
+
+    def route(
+            self,
+            events: list[Events.ServerToClientEvent],
+            process_state: Callable[[int], Iterable[Events.ServerToClientEvent]]
+    ) -> dict[int, list[Events.ServerToClientEvent]]:
+        """
+        Splits events to lists for every subscribed client, order is preserved. A process which got matched by its
+        name goes along with its current state, `process_state(PID)` gives it. Events without a process (PID -1)
+        aren't limited by processes
+        """
+        routed = {client_id: list() for client_id in self._subscriptions}
+        for event in events:
+            pid = event.PID
+            if pid == -1:
+                recipients = self._subscriptions.keys()
+
+            else:
+                if len(self._by_name) > 0 and isinstance(event, Events.SetName):
+                    self._match(pid, event.name, routed, process_state)
+
+                recipients = itertools.chain(self._by_pid.get(pid, ()), self._any_pid)
+
+            for client_id in recipients:
+                subscribed_events = self._subscriptions[client_id].events
+                if subscribed_events is None or event.event in subscribed_events:
+                    routed[client_id].append(event)
+
+            if isinstance(event, Events.SessionClosed):
+                self._forget_matched(pid)
+
+        return routed
+
+    def _match(
+            self,
+            pid: int,
+            name: str,
+            routed: dict[int, list[Events.ServerToClientEvent]],
+            process_state: Callable[[int], Iterable[Events.ServerToClientEvent]]
+    ) -> None:
+        """Matches a process which name got known against patterns, newly matching clients get the process' state"""
+        for client_id in self._by_name:
+            subscription = self._subscriptions[client_id]
+            if pid in subscription.pids or pid in subscription.matched or not subscription.match_name(name):
+                continue
+
+            subscription.matched.add(pid)
+            self._by_pid.setdefault(pid, set()).add(client_id)
+            routed[client_id].extend(
+                event for event in process_state(pid)
+                if not isinstance(event, Events.SetName)  # Gets routed as the event itself
+                and (subscription.events is None or event.event in subscription.events)
+            )
+
+    def _forget_matched(self, pid: int) -> None:
+        """PIDs get reused, a closed process stays subscribed only if it was listed by PID"""
+        for client_id in tuple(self._by_pid.get(pid, ())):
+            subscription = self._subscriptions[client_id]
+            if pid in subscription.matched:
+                subscription.matched.discard(pid)
+                if pid not in subscription.pids:
+                    self._discard(pid, client_id)
+
+    def _discard(self, pid: int, client_id: int) -> None:
+        client_ids = self._by_pid.get(pid)
+        if client_ids is not None:
+            client_ids.discard(client_id)
+            if len(client_ids) == 0:
+                del self._by_pid[pid]
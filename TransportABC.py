@@ -1,3 +1,5 @@
+import itertools
+import selectors
 from abc import ABC, abstractmethod
 from typing import Callable
 
@@ -5,18 +7,53 @@ import Events
 
 
 class TransportABC(ABC):
+    # Client ids are unique among all transports, so `ServerSideView` serving several transports tells their clients
+    # apart. Transports take ids from here
+    _client_id_counter = itertools.count()
+
     @abstractmethod
-    def __init__(self, rcv_callback: Callable[[Events.ClientToServerEvent], None]):
-        """Should call rcv_callback in order to pass received from client event"""
+    def __init__(self, rcv_callback: Callable[[Events.ClientToServerEvent], None], selector: selectors.BaseSelector):
+        """Should call rcv_callback in order to pass received from client event.
+        `selector` is owned by `ServerSideView`, `Transport` should register its sockets in it with a callable
+        `callback(fileobj, mask)` as data, `ServerSideView` calls it when the fileobj is ready"""
 
     @abstractmethod
     def send(self, msg: Events.ServerToClientEvent):
         """This method gets called by `ServerSideView` when it has an event to send to client"""
 
+    def send_many(self, msgs: list[Events.ServerToClientEvent]):
+        """This method gets called by `ServerSideView` with all events it has at once as `Events.EventBatch`, a
+        transport may override it to write them to a client as one message"""
+        for msg in msgs:
+            self.send(msg)
+
+    @abstractmethod
+    def send_to(self, client_id: int, msgs: list[Events.ServerToClientEvent], is_state: bool = False) -> bool:
+        """This method gets called by `ServerSideView` to send full state or an update to one client, identified by
+        `client_id` of `NewClient` event, it should be written as one message. Unknown `client_id` (i.e. the client has
+        already disconnected or is a client of another transport) should be ignored and False returned.
+        `is_state` is set for replies to `NewClient` and `Resync`, an update to a client which waits for one may be
+        skipped, the reply covers it"""
+
+    def set_filtered(self, client_id: int, is_filtered: bool) -> bool:
+        """`ServerSideView` sends events to a filtered client (see `Subscribe` event) by `send_to` only, so `send` and
+        `send_many` should skip it. Returns False if the client is unknown or the transport can't do it, the client
+        gets every event then"""
+        return False
+
     @abstractmethod
     def tick(self):
-        """This method get called by `ServerSideView` every little piece of time in order to allow
-        `Transport` to handle inbound messages (or other stuff `Transport` should do continuously"""
+        """This method get called by `ServerSideView` after every wakeup of its selector in order to allow
+        `Transport` to do stuff it should do continuously (flush buffers and such)"""
+
+    def timeout(self, now: float) -> float | None:
+        """How long `ServerSideView` may sleep in its selector before the next `tick` is due, None if the transport
+        doesn't need a tick until something happens to its sockets. `now` is `time.monotonic()`"""
+        return None
+
+    def client_count(self) -> int | None:
+        """Number of connected clients for metrics, None if the transport doesn't know it"""
+        return None
 
     @abstractmethod
     def shutdown(self):
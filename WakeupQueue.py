@@ -0,0 +1,48 @@
+import socket
+
+from BoundedQueue import BoundedQueue
+
+
+class WakeupQueue(BoundedQueue):
+    """
+    `Queue` which can be registered in a selector: every put to an empty queue writes a byte to internal socketpair,
+    so a consumer sleeping in `selector.select()` wakes up immediately instead of polling the queue.
+    Consumer should call `drain_wakeup()` and then `get_nowait()` until `Empty` on every wakeup.
+    Overload handling is inherited from `BoundedQueue`, `maxsize` of 0 means unbounded.
+    """
+
+    def __init__(self, maxsize: int = 0, **kwargs):
+        super().__init__(maxsize, **kwargs)
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+
+    def fileno(self) -> int:
+        return self._wakeup_r.fileno()
+
+    def _put(self, item) -> None:
+        # Called under self.mutex. Only transition empty -> non-empty needs a wakeup, consumer drains queue
+        # until Empty anyway
+        was_empty = len(self.queue) == 0
+        super()._put(item)
+        if was_empty:
+            self.wakeup()
+
+    def wakeup(self) -> None:
+        try:
+            self._wakeup_w.send(b'\0')
+
+        except BlockingIOError:  # Socket buffer is full, so consumer will be woken up anyway
+            pass
+
+    def drain_wakeup(self) -> None:
+        try:
+            while self._wakeup_r.recv(4096):
+                pass
+
+        except BlockingIOError:
+            pass
+
+    def close(self) -> None:
+        self._wakeup_r.close()
+        self._wakeup_w.close()
@@ -0,0 +1,406 @@
+import base64
+import hashlib
+import itertools
+import selectors
+import socket
+import struct
+import zlib
+from urllib.parse import urlsplit
+
+from loguru import logger
+
+from NetworkTransport import NetworkTransport
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+_ACCEPT_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+_DEFLATE_TAIL = b'\x00\x00\xff\xff'  # Ends every deflated message, it isn't sent (RFC 7692)
+
+
+def _unmask(payload: bytes, mask: bytes) -> bytes:
+    """XORs payload with repeated 4 bytes mask as one big integer, much faster than bytewise"""
+    length = len(payload)
+    key = (mask * (length // 4 + 1))[:length]
+    return (int.from_bytes(payload, 'little') ^ int.from_bytes(key, 'little')).to_bytes(length, 'little')
+
+
+def encode_frame(opcode: int, payload: bytes, compressed: bool = False) -> bytes:
+    """A final unmasked frame, as server sends them"""
+    first = 0x80 | (0x40 if compressed else 0) | opcode
+    length = len(payload)
+    if length < 126:
+        return struct.pack('!BB', first, length) + payload
+
+    if length < 65536:
+        return struct.pack('!BBH', first, 126, length) + payload
+
+    return struct.pack('!BBQ', first, 127, length) + payload
+
+
+def deflate_message(payload: bytes, window_bits: int, level: int) -> bytes:
+    """Compresses a message on its own, so no context is shared between messages"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -window_bits)
+    data = compressor.compress(payload) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    return data[:-len(_DEFLATE_TAIL)] if data.endswith(_DEFLATE_TAIL) else data
+
+
+class MessageFramer:
+    """
+    Accumulates a stream of bytes from a WebSocket client and splits it to complete messages: unmasked, reassembled
+    from fragments and inflated if permessage-deflate is on. Keeps incomplete frame until next feed
+    """
+
+    max_message_size = 64 * 1024
+
+    def __init__(self, deflate: bool):
+        self._buffer = bytearray()
+        self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS) if deflate else None
+        self._fragments: list[bytes] = list()
+        self._opcode: int | None = None  # Of the message which fragments are being received
+        self._compressed = False
+
+    def feed(self, data: bytes) -> list[tuple[int, bytes]]:
+        """
+        Returns (opcode, payload) of every message and control frame completed by `data`, raises `ValueError` if the
+        client violates the protocol or a message is longer than allowed
+        """
+        buffer = self._buffer
+        buffer += data
+        messages = list()
+        offset = 0
+        while len(buffer) - offset >= 2:
+            first, second = buffer[offset], buffer[offset + 1]
+            if first & 0x30:
+                raise ValueError('Reserved bits are set')
+
+            if not second & 0x80:
+                raise ValueError('Frame from a client is not masked')
+
+            length = second & 0x7F
+            header = 2
+            if length == 126:
+                header = 4
+                if len(buffer) - offset < header:
+                    break
+
+                length, = struct.unpack_from('!H', buffer, offset + 2)
+
+            elif length == 127:
+                header = 10
+                if len(buffer) - offset < header:
+                    break
+
+                length, = struct.unpack_from('!Q', buffer, offset + 2)
+
+            if length > self.max_message_size:
+                raise ValueError(f'Frame is longer than {self.max_message_size} bytes')
+
+            end = offset + header + 4 + length
+            if len(buffer) < end:
+                break
+
+            mask = bytes(buffer[offset + header:offset + header + 4])
+            payload = _unmask(bytes(buffer[offset + header + 4:end]), mask)
+            offset = end
+            message = self._on_frame(bool(first & 0x80), bool(first & 0x40), first & 0x0F, payload)
+            if message is not None:
+                messages.append(message)
+
+        del buffer[:offset]
+        return messages
+
+    def _on_frame(self, fin: bool, rsv1: bool, opcode: int, payload: bytes) -> tuple[int, bytes] | None:
+        if opcode >= OP_CLOSE:
+            if not fin or len(payload) > 125 or rsv1:
+                raise ValueError('Malformed control frame')
+
+            return opcode, payload
+
+        if opcode == OP_CONTINUATION:
+            if self._opcode is None or rsv1:
+                raise ValueError('Unexpected continuation frame')
+
+        elif opcode in (OP_TEXT, OP_BINARY):
+            if self._opcode is not None:
+                raise ValueError('Expected continuation frame')
+
+            if rsv1 and self._decompressor is None:
+                raise ValueError('Compressed frame without permessage-deflate')
+
+            self._opcode = opcode
+            self._compressed = rsv1
+
+        else:
+            raise ValueError(f'Unknown opcode {opcode}')
+
+        self._fragments.append(payload)
+        if sum(len(fragment) for fragment in self._fragments) > self.max_message_size:
+            raise ValueError(f'Message is longer than {self.max_message_size} bytes')
+
+        if not fin:
+            return None
+
+        payload = b''.join(self._fragments)
+        if self._compressed:
+            payload = self._decompressor.decompress(payload + _DEFLATE_TAIL, self.max_message_size)
+            if len(self._decompressor.unconsumed_tail) > 0:
+                raise ValueError(f'Message is longer than {self.max_message_size} bytes')
+
+        message = self._opcode, payload
+        self._fragments = list()
+        self._opcode = None
+        return message
+
+
+class WebSocketTransport(NetworkTransport):
+    """
+    Serves browsers over WebSocket (RFC 6455) on the same selector, with the same events and protocol switching as
+    `NetworkTransport`: json events go as text messages of json lines, binary ones as binary messages.
+    Everything sent to a client within one wakeup of `ServerSideView` goes as one frame on `tick`. permessage-deflate
+    (RFC 7692) is used if a client offers it: every message is compressed on its own, so a broadcast gets compressed
+    once for all clients instead of once per client's context. Small messages are sent as they are
+    """
+
+    port = 54685
+    max_handshake_size = 8 * 1024
+    compress_min_size = 128  # Bytes, smaller messages aren't worth compressing
+    compress_level = 6
+    # Origins of pages which may connect, a browser sends Origin with every WebSocket handshake, so a page of any other
+    # site open in the user's browser can't control the mixer. An origin without port allows any port of the host.
+    # Clients which aren't browsers send no Origin and are let in. None to allow any origin
+    allowed_origins: tuple[str, ...] | None = (
+        'http://localhost', 'https://localhost', 'http://127.0.0.1', 'https://127.0.0.1', 'http://[::1]',
+        'https://[::1]', 'null',  # Pages opened from files
+    )
+
+    def __init__(self, *args, **kwargs):
+        self._handshakes: dict[socket.socket, bytearray] = dict()  # Connections which haven't finished handshake
+        self._message_framers: dict[socket.socket, MessageFramer] = dict()
+        self._deflate_bits: dict[socket.socket, int] = dict()  # Window bits, only for connections with deflate
+        self._outgoing: dict[socket.socket, list[tuple[int, bytes]]] = dict()  # (opcode, data) sent within a wakeup
+        super().__init__(*args, **kwargs)
+
+    def _accept(self, sock: socket.socket, mask: int):
+        if not self._running:
+            logger.debug('WS: New connection during shutdown, not accepting')
+            return
+
+        conn, addr = sock.accept()
+        logger.debug(f'WS: Accepted {addr}')
+        conn.setblocking(False)
+        self._handshakes[conn] = bytearray()
+        self._selector.register(conn, selectors.EVENT_READ, self._on_handshake_receive)
+
+    def _on_handshake_receive(self, conn: socket.socket, mask: int):
+        try:
+            data = conn.recv(self.recv_size)
+
+        except ConnectionError:
+            data = b''
+
+        request = self._handshakes[conn]
+        request += data
+        end = request.find(b'\r\n\r\n')
+        if end == -1 and len(data) != 0 and len(request) <= self.max_handshake_size:
+            return  # Incomplete yet
+
+        self._selector.unregister(conn)
+        del self._handshakes[conn]
+        if end == -1:
+            logger.debug('WS: Handshake is incomplete or too long, closing')
+            conn.close()
+            return
+
+        response, window_bits = self._handshake(bytes(request[:end]))
+        try:
+            conn.sendall(response)
+
+        except OSError:
+            window_bits = False
+
+        if window_bits is False:
+            conn.close()
+            return
+
+        self._add_connection(conn)
+        self._message_framers[conn] = MessageFramer(window_bits is not None)
+        if window_bits is not None:
+            self._deflate_bits[conn] = window_bits
+
+        logger.debug(f'WS: {conn.getpeername()} connected, permessage-deflate {window_bits is not None}')
+        rest = bytes(request[end + 4:])
+        if len(rest) != 0:
+            self._on_data(conn, rest)
+
+    def _handshake(self, request: bytes) -> tuple[bytes, int | None | bool]:
+        """Returns response to the opening handshake and window bits of permessage-deflate, None if it is off, False
+        if the request is rejected"""
+        request_line, *header_lines = request.decode('latin-1').split('\r\n')
+        headers: dict[str, str] = dict()
+        for line in header_lines:
+            name, _, value = line.partition(':')
+            name = name.strip().lower()
+            headers[name] = f'{headers[name]}, {value.strip()}' if name in headers else value.strip()
+
+        connection_tokens = {token.strip().lower() for token in headers.get('connection', '').split(',')}
+        key = headers.get('sec-websocket-key')
+        if (
+                not request_line.startswith('GET ')
+                or headers.get('upgrade', '').lower() != 'websocket'
+                or 'upgrade' not in connection_tokens
+                or headers.get('sec-websocket-version') != '13'
+                or key is None
+        ):
+            logger.debug(f'WS: Not a WebSocket handshake: {request_line!r}')
+            return b'HTTP/1.1 400 Bad Request\r\nSec-WebSocket-Version: 13\r\nContent-Length: 0\r\n\r\n', False
+
+        origin = headers.get('origin')
+        if not self._is_allowed_origin(origin):
+            logger.debug('WS: Rejecting handshake from origin {!r}', origin)
+            return b'HTTP/1.1 403 Forbidden\r\nContent-Length: 0\r\n\r\n', False
+
+        accept = base64.b64encode(hashlib.sha1(key.encode() + _ACCEPT_GUID).digest())
+        response = (
+            b'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+            b'Sec-WebSocket-Accept: ' + accept + b'\r\n'
+        )
+        window_bits, extension = self._negotiate_deflate(headers.get('sec-websocket-extensions', ''))
+        if extension is not None:
+            response += b'Sec-WebSocket-Extensions: ' + extension.encode() + b'\r\n'
+
+        return response + b'\r\n', window_bits
+
+    def _is_allowed_origin(self, origin: str | None) -> bool:
+        if origin is None or self.allowed_origins is None:
+            return True
+
+        origin = origin.lower()
+        if origin in self.allowed_origins:
+            return True
+
+        try:
+            port = urlsplit(origin).port
+
+        except ValueError:
+            return False
+
+        return port is not None and origin.removesuffix(f':{port}') in self.allowed_origins
+
+    @staticmethod
+    def _negotiate_deflate(offers: str) -> tuple[int | None, str | None]:
+        """Accepts the first permessage-deflate offer which parameters can be met, returns window bits of server's
+        compression and the extension response header"""
+        for offer in offers.split(','):
+            name, *params = [part.strip() for part in offer.split(';')]
+            if name != 'permessage-deflate':
+                continue
+
+            window_bits = 15
+            response = 'permessage-deflate; server_no_context_takeover'  # Every message is compressed on its own
+            for param in params:
+                param_name, _, value = param.partition('=')
+                param_name, value = param_name.strip(), value.strip().strip('"')
+                if param_name == 'server_max_window_bits':
+                    if not value.isdigit() or not 9 <= int(value) <= 15:  # zlib can't do raw deflate with 8
+                        break
+
+                    window_bits = int(value)
+                    response += f'; server_max_window_bits={window_bits}'
+
+                elif param_name not in ('client_max_window_bits', 'server_no_context_takeover',
+                                        'client_no_context_takeover'):
+                    break  # Client's context is inflated as it is, so client's parameters need no response
+
+            else:
+                return window_bits, response
+
+        return None, None
+
+    def _on_data(self, conn: socket.socket, data: bytes):
+        try:
+            messages = self._message_framers[conn].feed(data)
+
+        except (ValueError, zlib.error):
+            logger.opt(exception=True).warning(f'WS: Closing connection to {conn.getpeername()}')
+            self._send_control(conn, OP_CLOSE, struct.pack('!H', 1002))
+            self._close_conn(conn)
+            return
+
+        for opcode, payload in messages:
+            if opcode == OP_TEXT:
+                self._feed(conn, payload + b'\n')  # A message is complete, its last line may lack new line
+
+            elif opcode == OP_BINARY:
+                self._feed(conn, payload)
+
+            elif opcode == OP_PING:
+                self._send_control(conn, OP_PONG, payload)
+
+            elif opcode == OP_CLOSE:
+                self._send_control(conn, OP_CLOSE, payload[:2])
+                self._close_conn(conn)
+
+            if conn not in self._client_ids:  # Closed by the message
+                return
+
+    def _send_control(self, conn: socket.socket, opcode: int, payload: bytes):
+        NetworkTransport._sendall(self, conn, encode_frame(opcode, payload))
+
+    def _sendall(self, conn: socket.socket, data: bytes):
+        """Data gets framed and written by `tick`, so everything sent to a client within a wakeup goes as one frame"""
+        opcode = OP_BINARY if conn in self._binary_buffers else OP_TEXT
+        outgoing = self._outgoing.get(conn)
+        if outgoing is None:
+            self._outgoing[conn] = [(opcode, data)]
+
+        else:
+            outgoing.append((opcode, data))
+
+    def tick(self):
+        super().tick()
+        if len(self._outgoing) == 0:
+            return
+
+        outgoing = self._outgoing
+        self._outgoing = dict()
+        frames: dict[tuple[int, int | None, bytes], bytes] = dict()  # The same payload is framed once for all clients
+        for conn, chunks in outgoing.items():
+            window_bits = self._deflate_bits.get(conn)
+            for opcode, group in itertools.groupby(chunks, key=lambda chunk: chunk[0]):
+                data = [data for _, data in group]
+                payload = data[0] if len(data) == 1 else b''.join(data)
+                key = (opcode, window_bits, payload)
+                frame = frames.get(key)
+                if frame is None:
+                    frame = frames[key] = self._encode_message(opcode, payload, window_bits)
+
+                NetworkTransport._sendall(self, conn, frame)
+
+    def _encode_message(self, opcode: int, payload: bytes, window_bits: int | None) -> bytes:
+        if window_bits is None or len(payload) < self.compress_min_size:
+            return encode_frame(opcode, payload)
+
+        return encode_frame(opcode, deflate_message(payload, window_bits, self.compress_level), compressed=True)
+
+    def _close_conn(self, conn: socket.socket):
+        self._message_framers.pop(conn, None)
+        self._deflate_bits.pop(conn, None)
+        self._outgoing.pop(conn, None)
+        super()._close_conn(conn)
+
+    def shutdown(self):
+        self.tick()  # Flush what is sent already
+        for conn in tuple(self._client_ids.keys()):
+            self._send_control(conn, OP_CLOSE, struct.pack('!H', 1001))  # Going away
+
+        for conn in tuple(self._handshakes.keys()):
+            self._selector.unregister(conn)
+            conn.close()
+
+        self._handshakes.clear()
+        super().shutdown()
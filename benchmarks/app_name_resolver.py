@@ -0,0 +1,86 @@
+"""
+Measures how long session-created callback path spends on getting app name: synchronous version resource read
+(simulated with a sleep) against `AppNameResolver` with a cold and a warm (loaded from disk) cache.
+Many sessions share the same executable, as browser tabs do.
+Run from the repository root: python -m benchmarks.app_name_resolver
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from AppNameResolver import AppNameResolver
+
+DESCRIBE_COST = 0.02  # Seconds, reading version resource of a big executable with cold disk cache
+
+
+class SimulatedProcess:
+    def __init__(self, pid: int, exe: str):
+        self.pid = pid
+        self._exe = exe
+
+    def name(self) -> str:
+        return os.path.basename(self._exe)
+
+    def exe(self) -> str:
+        return self._exe
+
+
+def slow_describe(exe: str) -> str:
+    time.sleep(DESCRIBE_COST)
+    return f'Description of {os.path.basename(exe)}'
+
+
+def run(resolver_factory, processes: list[SimulatedProcess]) -> tuple[list[float], int]:
+    resolved = list()
+
+    def on_resolved(pid, process, name):
+        resolved.append(pid)
+
+    resolver = resolver_factory(on_resolved)
+    latencies = list()
+    for process in processes:
+        started = time.perf_counter()
+        resolver.resolve(process.pid, process)
+        latencies.append(time.perf_counter() - started)
+
+    resolver._pool.shutdown(wait=True)  # noqa, let workers finish
+    return latencies, len(resolved)
+
+
+def report(title: str, latencies: list[float], follow_ups: int):
+    print(
+        f'{title:<24} per session: mean {statistics.mean(latencies) * 1e6:9.1f} us, '
+        f'max {max(latencies) * 1e6:9.1f} us, total {sum(latencies) * 1e3:7.1f} ms, SetName follow-ups: {follow_ups}'
+    )
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        # Executables have to exist, the cache is keyed by their mtime
+        executables = list()
+        for i in range(10):
+            path = os.path.join(directory, f'app{i}.exe')
+            open(path, 'wb').close()
+            executables.append(path)
+
+        processes = [SimulatedProcess(pid, executables[pid % len(executables)]) for pid in range(200)]
+        cache_path = os.path.join(directory, 'app_names_cache.json')
+
+        latencies = list()
+        for process in processes:
+            started = time.perf_counter()
+            slow_describe(process.exe())
+            latencies.append(time.perf_counter() - started)
+
+        print(f'{len(processes)} sessions of {len(executables)} executables, describe costs {DESCRIBE_COST * 1e3} ms')
+        report('synchronous', latencies, 0)
+
+        factory = lambda on_resolved: AppNameResolver(on_resolved, cache_path, slow_describe)  # noqa: E731
+        report('resolver, cold cache', *run(factory, processes))
+        report('resolver, warm cache', *run(factory, processes))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
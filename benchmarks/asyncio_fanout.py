@@ -0,0 +1,85 @@
+"""
+Measures fan-out of events by `AsyncioTransport` to many local clients while one of them never reads.
+Run from the repository root: python -m benchmarks.asyncio_fanout
+"""
+import selectors
+import socket
+import time
+
+import Events
+from AsyncioTransport import AsyncioTransport
+
+
+def main(clients: int = 300, events: int = 20000, sessions: int = 50, burst: int = 500):
+    transport = AsyncioTransport(lambda event: None, selectors.DefaultSelector())
+
+    stalled = socket.socket()
+    stalled.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)  # Before connecting, as it sets the TCP window
+    stalled.connect((AsyncioTransport.host, AsyncioTransport.port))
+    readers = [socket.create_connection((AsyncioTransport.host, AsyncioTransport.port)) for _ in range(clients - 1)]
+    selector = selectors.DefaultSelector()
+    for conn in readers:
+        conn.setblocking(False)
+        selector.register(conn, selectors.EVENT_READ)
+
+    time.sleep(0.5)  # Let the transport accept everyone
+    stalled_client = next(
+        client for client in transport._clients.values() if client.peername == stalled.getsockname()  # noqa
+    )
+    # Kernel buffers of the connection take megabytes, fill them, so its buffer in the transport overflows in fan-out
+    filler = [Events.SetName(-1, 'x' * 1000)] * 64
+    deadline = time.monotonic() + 10
+    while stalled_client.writer.transport.get_write_buffer_size() == 0:
+        if time.monotonic() > deadline:
+            raise TimeoutError('Kernel buffers of the stalled connection are not full')
+
+        transport.send_to(stalled_client.client_id, filler)
+        time.sleep(0.001)
+
+    msgs = [Events.VolumeChanged(i % sessions, i % 101) for i in range(events)]
+    msgs.append(Events.SetName(-1, 'done'))  # Coalescing always keeps the latest event, so it must arrive
+    terminator = Events.encode_event(msgs[-1])
+    sent_bytes = sum(len(Events.encode_event(msg)) for msg in msgs)
+    tails = {conn: b'' for conn in readers}
+    received_bytes = 0
+    incomplete = len(readers)
+
+    started = time.perf_counter()
+    for i in range(0, len(msgs), burst):
+        for msg in msgs[i:i + burst]:
+            transport.send(msg)
+
+        time.sleep(0.001)
+
+    while incomplete > 0:
+        for key, mask in selector.select(timeout=5):
+            conn = key.fileobj
+            data = conn.recv(1 << 20)  # noqa
+            received_bytes += len(data)
+            tails[conn] = (tails[conn] + data)[-len(terminator):]
+            if tails[conn] == terminator:
+                selector.unregister(conn)
+                incomplete -= 1
+
+    elapsed = time.perf_counter() - started
+    if AsyncioTransport.overflow_policy == 'disconnect':
+        assert stalled_client.client_id not in transport._clients, 'The stalled client is still connected'  # noqa
+
+    else:
+        assert len(stalled_client.pending) > 0, "The stalled client's buffer hasn't overflowed"
+
+    print(f'clients: {clients} (1 stalled), events: {events}')
+    print(f'fan-out time: {elapsed * 1000:.1f} ms')
+    print(f'delivered bytes/s (total): {received_bytes / elapsed / 1e6:.1f} MB/s')
+    print(f'delivered / sent bytes per reader: {received_bytes / len(readers) / sent_bytes * 100:.1f} %')
+    print(f'coalesced events pending for stalled client: {len(stalled_client.pending)} (sessions: {sessions})')
+
+    for conn in readers:
+        conn.close()
+
+    stalled.close()
+    transport.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Measures how long it takes to change volume of many sessions from a client: one `SetVolume` per session awaited one
+by one (as a client without batches applies a preset), the same commands pipelined, a single `SetVolumes` batch and
+`SetAllVolume`. Time is from sending the first command until the client has received `VolumeChanged` of every session,
+sends are how many writes to the client it took.
+`SimulatedBackend` -> `AudioController` -> `ServerSideView` -> `NetworkTransport` -> a local TCP client.
+Run from the repository root: python -m benchmarks.batch_commands
+"""
+import json
+import socket
+import statistics
+import sys
+import threading
+import time
+
+from loguru import logger
+
+from AudioController import AudioController
+from Metrics import metrics
+from NetworkTransport import NetworkTransport
+from SimulatedBackend import SimulatedBackend
+
+
+class BenchmarkAudioController(AudioController):
+    state_table_path = None  # Not to overwrite the state table of a server running on this host
+
+
+class Client:
+    """Keeps the latest volume of every session from received events"""
+
+    def __init__(self):
+        self.sock = socket.create_connection(('localhost', 54683))
+        self.sock.sendall(b'{"event": "NewClient", "PID": -1}\n')  # Full state right away, not after resync window
+        self.volumes: dict[int, int] = dict()
+        self._condition = threading.Condition()
+        self.thread = threading.Thread(target=self._read, daemon=True)
+        self.thread.start()
+
+    def _read(self):
+        with self.sock.makefile('rb') as file:
+            for line in file:
+                event = json.loads(line)
+                if event['event'] == 'VolumeChanged':
+                    with self._condition:
+                        self.volumes[event['PID']] = event['new_volume']
+                        self._condition.notify_all()
+
+    def send(self, *events: dict):
+        self.sock.sendall(b''.join(json.dumps(event).encode() + b'\n' for event in events))
+
+    def wait_volumes(self, volumes: dict[int, int], timeout: float = 10):
+        with self._condition:
+            if not self._condition.wait_for(lambda: all(self.volumes.get(pid) == v for pid, v in volumes.items()),
+                                            timeout):
+                raise TimeoutError('Not all volumes have arrived')
+
+    def close(self):
+        self.sock.close()
+        self.thread.join(1)
+
+
+def one_by_one(client: Client, volumes: dict[int, int]):
+    for pid, volume in volumes.items():
+        client.send({'event': 'SetVolume', 'PID': pid, 'volume': volume})
+        client.wait_volumes({pid: volume})
+
+
+def pipelined(client: Client, volumes: dict[int, int]):
+    client.send(*({'event': 'SetVolume', 'PID': pid, 'volume': volume} for pid, volume in volumes.items()))
+    client.wait_volumes(volumes)
+
+
+def batch(client: Client, volumes: dict[int, int]):
+    client.send({'event': 'SetVolumes', 'PID': -1, 'volumes': [[pid, volume] for pid, volume in volumes.items()]})
+    client.wait_volumes(volumes)
+
+
+def set_all(client: Client, volumes: dict[int, int]):
+    client.send({'event': 'SetAllVolume', 'PID': -1, 'volume': next(iter(volumes.values()))})
+    client.wait_volumes(volumes)
+
+
+def main(sessions: int = 50, rounds: int = 50):
+    logger.remove()  # Debug logging of every event would dominate
+    logger.add(sys.stderr, level='WARNING')
+
+    backend = SimulatedBackend(sessions)
+    controller = BenchmarkAudioController(NetworkTransport, backend=backend)
+    main_thread = threading.Thread(target=controller.start_blocking, daemon=True)
+    main_thread.start()
+
+    client = Client()
+    pids = [session.ProcessId for session in backend.get_sessions()]
+    client.wait_volumes({pid: 100 for pid in pids})
+    sends = metrics.client_sends.labels('0')
+
+    print(f'sessions: {sessions}, rounds: {rounds}')
+    for i, way in enumerate((one_by_one, pipelined, batch, set_all)):
+        times = list()
+        sends_before = sends.value
+        for j in range(rounds):
+            volume = (i * rounds + j) % 101
+            volumes = {pid: volume for pid in pids}
+            started = time.perf_counter()
+            way(client, volumes)
+            times.append(time.perf_counter() - started)
+            time.sleep(0.02)  # Let coalescing windows of `ServerSideView` close, as between user's actions
+
+        print(f'{way.__name__:>10}: mean {statistics.mean(times) * 1e3:7.2f} ms, '
+              f'p50 {statistics.median(times) * 1e3:7.2f} ms, sends per round {(sends.value - sends_before) / rounds:.1f}')
+
+    controller.running = False
+    main_thread.join(2)
+    controller.pre_shutdown()
+    client.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Measures how fast `AudioController` main loop handles client commands interleaved with session state changes.
+Sessions are provided by `SimulatedBackend`, so no COM calls are performed. `ServerSideView` runs with a fake
+transport.
+Run from the repository root: python -m benchmarks.controller_commands
+"""
+import statistics
+import threading
+import time
+from typing import Callable
+
+import Events
+from AudioController import AudioController, SessionStateChange
+from SimulatedBackend import SimulatedBackend, SimulatedSession
+from benchmarks.view_latency import FakeTransport
+
+
+class TimingBackend(SimulatedBackend):
+    def __init__(self, sessions: int, on_set_volume: Callable[[], None]):
+        super().__init__(sessions)
+        self._on_set_volume = on_set_volume
+
+    def set_volume(self, session: SimulatedSession, volume: int):
+        super().set_volume(session, volume)
+        self._on_set_volume()
+
+
+def main(sessions: int = 50, commands: int = 20000, latency_samples: int = 1000, state_change_every: int = 10):
+    # Queues big enough for the whole flood, so no command gets coalesced, overload is measured by queue_overload
+    controller_cls = type(
+        'BenchmarkAudioController', (AudioController,), {'queue_size': 2 * commands, 'state_table_path': None}
+    )
+
+    done_at: list[float] = list()
+    done = threading.Event()
+    expected_done = commands
+
+    def on_set_volume():
+        done_at.append(time.perf_counter())
+        if len(done_at) >= expected_done:
+            done.set()
+
+    backend = TimingBackend(sessions, on_set_volume)
+    controller = controller_cls(FakeTransport, backend=backend)
+    keys = {session.ProcessId: (session.device_id, session.InstanceIdentifier) for session in backend.get_sessions()}
+    main_thread = threading.Thread(target=controller.start_blocking, daemon=True)
+    main_thread.start()
+
+    # Throughput: a flood of commands interleaved with state changes
+    started = time.perf_counter()
+    for i in range(commands):
+        pid = i % sessions + 1
+        if i % state_change_every == 0:
+            controller.inbound_q.put(SessionStateChange(keys[pid], 1))
+
+        controller.inbound_q.put(Events.SetVolume(pid, i % 101))
+
+    done.wait()
+    elapsed = time.perf_counter() - started
+
+    # Latency: one command at a time, so it doesn't include queueing behind other commands
+    latencies = list()
+    for i in range(latency_samples):
+        done.clear()
+        expected_done = len(done_at) + 1
+        put_at = time.perf_counter()
+        controller.inbound_q.put(Events.SetVolume(i % sessions + 1, i % 101))
+        done.wait()
+        latencies.append(done_at[-1] - put_at)
+        time.sleep(0.0005)
+
+    # State change latency: from callback to the event reaching the transport
+    transport: FakeTransport = controller.view.transports[0]  # noqa
+    state_latencies = list()
+    for i in range(latency_samples):
+        transport.sent.clear()
+        put_at = time.perf_counter()
+        # Flipped every round over sessions, as `ServerSideView` doesn't send changes which don't change anything
+        controller.inbound_q.put(SessionStateChange(keys[i % sessions + 1], (i // sessions) % 2))
+        transport.sent.wait()
+        state_latencies.append(transport.sent_at[-1] - put_at)
+        time.sleep(0.0005)
+
+    controller.running = False
+    main_thread.join(2)
+    controller.pre_shutdown()
+
+    latencies.sort()
+    state_latencies.sort()
+    print(f'sessions: {sessions}, commands: {commands}')
+    print(f'commands/s: {commands / elapsed:.0f}')
+    print(f'command latency mean: {statistics.mean(latencies) * 1e6:.1f} us')
+    print(f'command latency p99: {latencies[int(len(latencies) * 0.99)] * 1e6:.1f} us')
+    print(f'state change latency mean: {statistics.mean(state_latencies) * 1e6:.1f} us')
+    print(f'state change latency p99: {state_latencies[int(len(state_latencies) * 0.99)] * 1e6:.1f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""
+Compares serialization of server to client events: generic json.dumps of a dict of fields (what
+`NetworkTransport.send` did with `dataclasses.asdict`) against `Events.encode_event`.
+Run from the repository root: python -m benchmarks.event_encoding
+"""
+import json
+import timeit
+from dataclasses import fields
+
+import Events
+
+
+def encode_generic(event: Events.ServerToClientEvent) -> bytes:
+    return json.dumps({f.name: getattr(event, f.name) for f in fields(event) if not f.name.startswith('_')}).encode() + b'\n'
+
+
+def main(number: int = 200000):
+    cases = {
+        'VolumeChanged': lambda: Events.VolumeChanged(1234, 42),
+        'SetName': lambda: Events.SetName(1234, 'Mozilla Firefox'),
+    }
+    for name, factory in cases.items():
+        events = [factory() for _ in range(number)]
+        assert encode_generic(events[0]) == Events.encode_event(factory())
+
+        it = iter(events)
+        generic = timeit.timeit(lambda: encode_generic(next(it)), number=number)
+        it = iter(events)
+        compiled = timeit.timeit(lambda: Events.encode_event(next(it)), number=number)
+        cached = timeit.timeit(lambda: Events.encode_event(events[0]), number=number)
+
+        print(f'{name}: generic {generic / number * 1e9:.0f} ns, compiled {compiled / number * 1e9:.0f} ns '
+              f'({generic / compiled:.1f}x), cached {cached / number * 1e9:.0f} ns ({generic / cached:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
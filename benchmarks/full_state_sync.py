@@ -0,0 +1,56 @@
+"""
+Measures what `ServerSideView` does when a client connects with many sessions: how many transport calls and how
+long it takes to send full state. The transport is fake, so only the view side is measured.
+Run from the repository root: python -m benchmarks.full_state_sync
+"""
+import time
+from queue import Queue
+
+import Events
+from ServerSideView import ServerSideView
+from WakeupQueue import WakeupQueue
+from benchmarks.view_latency import FakeTransport
+
+
+class RecordingTransport(FakeTransport):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.send_to_calls = 0
+        self.last_sent_to_bytes = 0
+
+    def send_to(self, client_id: int, msgs: list[Events.ServerToClientEvent], is_state: bool = False) -> bool:
+        self.send_to_calls += 1
+        self.last_sent_to_bytes = len(b''.join([Events.encode_event(msg) for msg in msgs]))
+        return True
+
+
+def main(sessions_counts: tuple[int, ...] = (200, 1000, 10000)):
+    for sessions in sessions_counts:
+        view = ServerSideView(WakeupQueue(), Queue(), RecordingTransport, coalesce_window=0)
+        transport: RecordingTransport = view.transports[0]  # noqa
+        for pid in range(sessions):
+            for event in (
+                    Events.NewSession(pid),
+                    Events.VolumeChanged(pid, 50),
+                    Events.SetName(pid, f'app {pid}.exe'),
+                    Events.MuteStateChanged(pid, False),
+                    Events.StateChanged(pid, True)
+            ):
+                view._update_state(event)  # noqa
+
+        broadcasts_before = len(transport.sent_at)
+        started = time.perf_counter()
+        view._send_full_state(0)  # noqa
+        first = time.perf_counter() - started
+
+        started = time.perf_counter()
+        view._send_full_state(1)  # noqa
+        cached = time.perf_counter() - started
+
+        print(f'sessions: {sessions}: broadcasts {len(transport.sent_at) - broadcasts_before}, '
+              f'send_to calls {transport.send_to_calls}, {transport.last_sent_to_bytes} bytes each, '
+              f'first {first * 1000:.2f} ms, next with unchanged state {cached * 1000:.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
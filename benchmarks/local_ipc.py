@@ -0,0 +1,137 @@
+"""
+Measures what a local tool polling mixer state pays per poll over TCP on localhost and over a Unix domain socket:
+round trip of a `NewClient` request until `Synced` of the full state it gets, in json and binary formats, for all
+sessions and for one app the tool is subscribed to, where the transport's share of a poll is the most of it.
+`SimulatedBackend` -> `AudioController` -> `ServerSideView` -> `NetworkTransport` and `LocalTransport` -> a local
+client in another process, which sends a request only after it has got the previous response.
+Run from the repository root: python -m benchmarks.local_ipc
+"""
+import multiprocessing
+import socket
+import statistics
+import sys
+import threading
+import time
+
+from loguru import logger
+
+import Events
+from AudioController import AudioController
+from LocalTransport import LocalTransport
+from NetworkTransport import NetworkTransport
+from SimulatedBackend import SimulatedBackend
+
+
+class BenchmarkAudioController(AudioController):
+    state_table_path = None  # Not to overwrite the state table of a server running on this host
+
+
+def connect(transport: str) -> socket.socket:
+    if transport == 'tcp':
+        sock = socket.create_connection(('localhost', NetworkTransport.port))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # As an interactive client would
+        return sock
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(LocalTransport.path)
+    return sock
+
+
+class Poller:
+    """Requests full state and reads until its `Synced`"""
+
+    def __init__(self, transport: str, wire_format: str, pids: list[int]):
+        self.sock = connect(transport)
+        if len(pids) > 0:
+            self.sock.sendall(f'{{"event": "Subscribe", "PID": -1, "pids": {pids}}}\n'.encode())
+
+        self.binary = wire_format == 'binary'
+        if self.binary:
+            self.sock.sendall(b'{"event": "SetProtocol", "PID": -1, "protocol": "binary"}\n')
+            self.request = Events.encode_event_binary(Events.NewClient(-1))
+
+        else:
+            self.request = b'{"event": "NewClient", "PID": -1}\n'
+
+        self.buffer = bytearray()
+
+    def poll(self) -> int:
+        """Returns count of events received"""
+        self.sock.sendall(self.request)
+        received = 0
+        while True:
+            self.buffer += self.sock.recv(256 * 1024)
+            if self.binary:
+                consumed = 0
+                for event, consumed in Events.decode_events_binary(self.buffer, Events.ServerToClientEvent):
+                    received += 1
+                    if isinstance(event, Events.Synced):
+                        del self.buffer[:consumed]
+                        return received
+
+                del self.buffer[:consumed]
+
+            else:
+                end = self.buffer.rfind(b'\n')
+                if end == -1:
+                    continue
+
+                lines = self.buffer[:end].split(b'\n')
+                del self.buffer[:end + 1]
+                received += len(lines)
+                if b'"Synced"' in lines[-1]:
+                    return received
+
+    def close(self):
+        self.sock.close()
+
+
+def run(transport: str, wire_format: str, pids: list[int], polls: int) -> dict[str, float]:
+    poller = Poller(transport, wire_format, pids)
+    for _ in range(polls // 10):  # Warm up
+        poller.poll()
+
+    latencies = list()
+    events = 0
+    for _ in range(polls):
+        started = time.perf_counter()
+        events = poller.poll()
+        latencies.append(time.perf_counter() - started)
+
+    poller.close()
+    latencies.sort()
+    return {
+        'events': events,
+        'mean_us': statistics.fmean(latencies) * 1e6,
+        'p50_us': latencies[len(latencies) // 2] * 1e6,
+        'p99_us': latencies[int(len(latencies) * 0.99)] * 1e6,
+    }
+
+
+def main(sessions: int = 20, polls: int = 2000):
+    logger.remove()  # Debug logging of every event would dominate
+    logger.add(sys.stderr, level='WARNING')
+
+    backend = SimulatedBackend(sessions)
+    controller = BenchmarkAudioController((NetworkTransport, LocalTransport), backend=backend)
+    main_thread = threading.Thread(target=controller.start_blocking, daemon=True)
+    main_thread.start()
+
+    print(f'sessions: {sessions}, polls: {polls}')
+    for label, pids in (('all sessions', []), ('one app', [backend.get_sessions()[0].ProcessId])):
+        for wire_format in ('json', 'binary'):
+            for transport in ('tcp', 'local'):
+                with multiprocessing.Pool(1) as pool:  # The client doesn't share GIL with the server
+                    result = pool.apply(run, (transport, wire_format, pids, polls))
+
+                print(f'{label:>12}, {transport:>5} {wire_format:>6}: {result["events"]:3} events per poll, '
+                      f'poll mean {result["mean_us"]:6.1f} us, p50 {result["p50_us"]:6.1f} us, '
+                      f'p99 {result["p99_us"]:6.1f} us')
+
+    controller.running = False
+    main_thread.join(2)
+    controller.pre_shutdown()
+
+
+if __name__ == '__main__':
+    main()
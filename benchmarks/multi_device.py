@@ -0,0 +1,101 @@
+"""
+Measures discovery of sessions of several output devices: the first discovery, and re-discovery after a device was
+added and after one was removed, incremental as `AudioController` does it and, for comparison, as a full rescan which
+re-registers every device and session. Counts backend registrations and events sent to clients.
+Run from the repository root: python -m benchmarks.multi_device
+"""
+import queue
+import sys
+import time
+
+from loguru import logger
+
+from AudioBackendABC import SessionKey
+from AudioController import AudioController
+from SimulatedBackend import SimulatedBackend, SimulatedDevice, SimulatedSession
+from benchmarks.view_latency import FakeTransport
+
+
+class CountingBackend(SimulatedBackend):
+    def __init__(self, sessions: int, devices: int):
+        super().__init__(sessions, devices)
+        self.registrations = 0
+
+    def register_device(self, device: SimulatedDevice, listener: AudioController):
+        self.registrations += 1
+        super().register_device(device, listener)
+
+    def register(self, key: SessionKey, session: SimulatedSession, listener: AudioController):
+        self.registrations += 1
+        super().register(key, session, listener)
+
+
+class BenchmarkAudioController(AudioController):
+    metrics_port = None
+    state_table_path = None
+    queue_size = 0  # Nobody reads outbound_q, events are counted and dropped
+
+
+class FullRescanAudioController(BenchmarkAudioController):
+    """Forgets everything and discovers from scratch every time"""
+
+    def perform_discover(self):
+        for device_id in tuple(self._devices.keys()):
+            self._remove_device(device_id)
+
+        super().perform_discover()
+
+
+def drain(q: queue.Queue) -> int:
+    count = 0
+    while True:
+        try:
+            q.get_nowait()
+
+        except queue.Empty:
+            return count
+
+        count += 1
+
+
+def discover(controller: AudioController, backend: CountingBackend) -> tuple[float, int, int]:
+    """Returns milliseconds, registrations and events of one discovery"""
+    drain(controller.outbound_q)
+    registrations_before = backend.registrations
+    started = time.perf_counter()
+    controller.perform_discover()
+    elapsed = time.perf_counter() - started
+    return elapsed * 1e3, backend.registrations - registrations_before, drain(controller.outbound_q)
+
+
+def run(controller_cls: type[AudioController], sessions: int, devices: int) -> dict[str, tuple[float, int, int]]:
+    backend = CountingBackend(sessions, devices)
+    controller = controller_cls(FakeTransport, backend=backend)
+    results = {'first': discover(controller, backend)}
+
+    device = backend.add_device()
+    for _ in range(sessions // devices):
+        backend.add_session(device)
+
+    results['device added'] = discover(controller, backend)
+    backend.remove_device(device)
+    drain(controller.inbound_q)  # Disconnect notifications of its sessions
+    results['device removed'] = discover(controller, backend)
+    results['nothing changed'] = discover(controller, backend)
+
+    controller.app_name_resolver.shutdown()
+    return results
+
+
+def main(sessions: int = 2000, devices: int = 4):
+    logger.remove()  # Full rescan forgets running sessions, warnings about every of them would dominate
+    logger.add(sys.stderr, level='ERROR')
+
+    print(f'sessions: {sessions}, devices: {devices}')
+    for label, controller_cls in (('full rescan', FullRescanAudioController), ('incremental', BenchmarkAudioController)):
+        for case, (ms, registrations, events) in run(controller_cls, sessions, devices).items():
+            print(f'{label:>11} {case:>15}: {ms:8.2f} ms, {registrations:5} registrations, {events:6} events')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+One `ServerSideView` serving TCP json, TCP binary and WebSocket clients at once: counts how many times events and
+updates get serialized per wire format while the same storm of volume changes goes to all of them, how many times
+the view wakes up while idle, and checks every client's volumes against the backend's.
+`SimulatedBackend` -> `AudioController` -> `ServerSideView` -> `NetworkTransport` and `WebSocketTransport`.
+Run from the repository root: python -m benchmarks.multi_transport
+"""
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+
+from loguru import logger
+
+import Events
+from AudioController import AudioController
+from NetworkTransport import NetworkTransport
+from SimulatedBackend import SimulatedBackend
+from WebSocketTransport import WebSocketTransport
+from benchmarks.simulated_load import wait_quiet
+from benchmarks.subscriptions import Client
+from benchmarks.websocket_load import ClientsThread, WebSocketClient
+
+serializations = Counter()
+
+
+class BenchmarkAudioController(AudioController):
+    state_table_path = None  # Not to overwrite the state table of a server running on this host
+
+
+def counting(compile_encoder, wire_format: str):
+    """Wraps encoder's compiler of `Events`, so every serialization of an event is counted"""
+    def compile_counting(cls):
+        encode = compile_encoder(cls)
+
+        def encode_counting(event):
+            serializations[wire_format] += 1
+            return encode(event)
+
+        return encode_counting
+
+    return compile_counting
+
+
+def count_joins(encoded):
+    def encoded_counting(batch: Events.EventBatch, encode):
+        if encode not in batch._encoded:  # noqa
+            serializations['json updates' if encode is Events.encode_event else 'binary updates'] += 1
+
+        return encoded(batch, encode)
+
+    return encoded_counting
+
+
+class BinaryClient:
+    """Switches to binary format and keeps volumes of processes"""
+
+    def __init__(self):
+        self.sock = socket.create_connection(('localhost', NetworkTransport.port))
+        self.sock.sendall(b'{"event": "SetProtocol", "PID": -1, "protocol": "binary"}\n')  # State after resync window
+        self.volumes: dict[int, int] = dict()
+        self.synced = threading.Event()
+        self.last_received_at = time.perf_counter()
+        self.thread = threading.Thread(target=self._read, daemon=True)
+        self.thread.start()
+
+    def _read(self):
+        buffer = bytearray()
+        while len(data := self.sock.recv(256 * 1024)) > 0:
+            buffer += data
+            consumed = 0
+            for event, consumed in Events.decode_events_binary(buffer, Events.ServerToClientEvent):
+                if isinstance(event, Events.Synced):
+                    self.synced.set()
+
+                elif isinstance(event, Events.VolumeChanged):
+                    self.volumes[event.PID] = event.new_volume
+
+                elif isinstance(event, Events.SessionClosed):
+                    self.volumes.pop(event.PID, None)
+
+            del buffer[:consumed]
+            self.last_received_at = time.perf_counter()
+
+    def close(self):
+        self.sock.close()
+        self.thread.join(1)
+
+
+def main(sessions: int = 150, clients_count: int = 20, changes: int = 20000, idle: float = 1.0):
+    logger.remove()  # Debug logging of every event would dominate
+    logger.add(sys.stderr, level='WARNING')
+
+    Events._compile_encoder = counting(Events._compile_encoder, 'json')  # noqa
+    Events._compile_binary_encoder = counting(Events._compile_binary_encoder, 'binary')  # noqa
+    Events.EventBatch.encoded = count_joins(Events.EventBatch.encoded)
+
+    backend = SimulatedBackend(sessions)
+    controller = BenchmarkAudioController((NetworkTransport, WebSocketTransport), backend=backend)
+    view = controller.view
+    send = view._send  # noqa
+    sent = Counter()
+
+    def send_counting(events: list[Events.ServerToClientEvent]):
+        sent['updates'] += 1
+        sent['events'] += len(events) + 1  # With `Synced`
+        send(events)
+
+    view._send = send_counting
+    select_timeout = view._select_timeout  # noqa
+
+    def select_timeout_counting() -> float | None:
+        sent['wakeups'] += 1
+        return select_timeout()
+
+    view._select_timeout = select_timeout_counting
+    main_thread = threading.Thread(target=controller.start_blocking, daemon=True)
+    main_thread.start()
+
+    clients = {
+        'tcp json': [Client(None) for _ in range(clients_count)],
+        'tcp binary': [BinaryClient() for _ in range(clients_count)],
+        'websocket': [WebSocketClient(deflate=True) for _ in range(clients_count)],
+    }
+    websocket_thread = ClientsThread(clients['websocket'])
+    websocket_thread.start()
+    every_client = [client for group in clients.values() for client in group]
+    for client in every_client:
+        client.synced.wait(10)
+
+    wait_quiet(every_client)
+    serializations.clear()
+    sent.clear()
+    sessions_list = backend.get_sessions()
+    for i in range(changes):
+        session = sessions_list[i % len(sessions_list)]
+        backend.change_volume(session, (session.volume + 1) % 101)
+
+    wait_quiet(every_client)
+    expected = {session.ProcessId: session.volume for session in sessions_list}
+    print(f'transports: NetworkTransport, WebSocketTransport; {clients_count} clients of every kind, '
+          f'{sent["updates"]} updates of {sent["events"]} events')
+    print(f'serialized per event: json {serializations["json"] / sent["events"]:.2f}, '
+          f'binary {serializations["binary"] / sent["events"]:.2f}; '
+          f'joined per update: json {serializations["json updates"] / sent["updates"]:.2f}, '
+          f'binary {serializations["binary updates"] / sent["updates"]:.2f}')
+    for label, group in clients.items():
+        consistent = sum(client.volumes == expected for client in group)
+        print(f'{label:>10}: {consistent} of {len(group)} clients consistent')
+
+    sent.clear()
+    time.sleep(idle)
+    print(f'idle: {sent["wakeups"]} wakeups in {idle:.1f} s')
+
+    websocket_thread.running = False
+    websocket_thread.join(2)
+    for client in every_client:
+        client.close()
+
+    controller.running = False
+    main_thread.join(2)
+    controller.pre_shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Measures how many client messages per second `NetworkTransport` receives, frames and decodes.
+A local client pushes `VolumeIncrement` lines in chunks which split lines at arbitrary points.
+Run from the repository root: python -m benchmarks.network_ingest
+"""
+import selectors
+import socket
+import threading
+import time
+
+import Events
+from NetworkTransport import NetworkTransport
+
+
+def main(messages: int = 200000, chunk_size: int = 1400):
+    selector = selectors.DefaultSelector()
+    received: list[Events.ClientToServerEvent] = list()
+    all_received = threading.Event()
+
+    def rcv_callback(event: Events.ClientToServerEvent):
+        if not isinstance(event, Events.NewClient):
+            received.append(event)
+            if len(received) == messages:
+                all_received.set()
+
+    transport = NetworkTransport(rcv_callback, selector)
+
+    def loop():
+        while not all_received.is_set():
+            for key, mask in selector.select(timeout=0.1):
+                key.data(key.fileobj, mask)
+
+    loop_thread = threading.Thread(target=loop, daemon=True)
+    loop_thread.start()
+
+    payload = b''.join(
+        b'{"event": "VolumeIncrement", "PID": %d, "increment": %d}\n' % (i % 100, i % 11 - 5) for i in range(messages)
+    )
+    client = socket.create_connection(('localhost', 54683))
+
+    started = time.perf_counter()
+    for i in range(0, len(payload), chunk_size):  # Chunk size doesn't match line boundaries
+        client.sendall(payload[i:i + chunk_size])
+
+    all_received.wait()
+    elapsed = time.perf_counter() - started
+
+    loop_thread.join()
+    client.close()
+    transport.shutdown()
+
+    corrupted = sum(
+        1 for i, event in enumerate(received) if event.PID != i % 100 or event.increment != i % 11 - 5  # noqa
+    )
+    print(f'messages: {messages}, bytes: {len(payload)}')
+    print(f'messages/s: {messages / elapsed:.0f}')
+    print(f'MB/s: {len(payload) / elapsed / 1e6:.1f}')
+    print(f'corrupted: {corrupted}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+"""
+End-to-end benchmark of `SimulatedBackend` -> `AudioController` -> `ServerSideView` -> `NetworkTransport` -> local TCP
+clients. Measures event fan-out throughput, SetVolume -> VolumeChanged round trip, full state sync time of a new
+client versus sessions count and memory per session and per client.
+Results are printed as JSON, so runs on different commits can be compared:
+    python -m benchmarks.pipeline --output before.json
+    python -m benchmarks.pipeline --compare before.json
+Run from the repository root.
+"""
+import argparse
+import json
+import socket
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+
+from loguru import logger
+
+from AudioController import AudioController
+from NetworkTransport import NetworkTransport
+from SimulatedBackend import SimulatedBackend
+
+EVENTS_PER_SESSION = 6  # Full state: NewSession, SessionAdded, VolumeChanged, SetName, MuteStateChanged, StateChanged
+DEVICE_EVENTS = 3  # DeviceAdded, EndpointVolumeChanged, EndpointMuteChanged of the only simulated device
+
+
+class BenchmarkAudioController(AudioController):
+    state_table_path = None  # Not to overwrite the state table of a server running on this host
+
+
+class Client:
+    """Counts received events in a thread, can wait for a count or for a specific `VolumeChanged`"""
+
+    def __init__(self):
+        self.sock = socket.create_connection(('localhost', 54683))
+        self.sock.sendall(b'{"event": "NewClient", "PID": -1}\n')  # Full state right away, not after resync window
+        self.events = 0
+        self.last_received_at = time.perf_counter()
+        self._condition = threading.Condition()
+        self._last_volume: tuple[int, int] | None = None
+        self.thread = threading.Thread(target=self._read, daemon=True)
+        self.thread.start()
+
+    def _read(self):
+        with self.sock.makefile('rb') as file:
+            for line in file:
+                event = json.loads(line)
+                if event['event'] == 'Synced':  # Ends every update, not an event of a session
+                    continue
+
+                with self._condition:
+                    self.events += 1
+                    self.last_received_at = time.perf_counter()
+                    if event['event'] == 'VolumeChanged':
+                        self._last_volume = (event['PID'], event['new_volume'])
+
+                    self._condition.notify_all()
+
+    def send(self, event: dict):
+        self.sock.sendall(json.dumps(event).encode() + b'\n')
+
+    def wait_events(self, count: int, timeout: float = 30) -> float:
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.events >= count, timeout):
+                raise TimeoutError(f'Received {self.events} of {count} events')
+
+            return self.last_received_at
+
+    def wait_volume(self, pid: int, volume: int, timeout: float = 5) -> float:
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._last_volume == (pid, volume), timeout):
+                raise TimeoutError(f'No VolumeChanged({pid}, {volume})')
+
+            return time.perf_counter()
+
+    def close(self):
+        self.sock.close()
+        self.thread.join(1)
+
+
+def settle(controller: AudioController):
+    """Waits until the pipeline has handled everything"""
+    while not (controller.outbound_q.empty() and controller.inbound_q.empty()):
+        time.sleep(0.01)
+
+    time.sleep(0.1)
+
+
+def wait_quiet(clients: list[Client], quiet: float = 0.3) -> float:
+    """Waits until clients stop receiving, returns when the last event was received"""
+    while True:
+        time.sleep(quiet / 5)
+        last = max(client.last_received_at for client in clients)
+        if time.perf_counter() - last > quiet:
+            return last
+
+
+def traced_bytes(snapshot: tracemalloc.Snapshot, exclude: str, all_frames: bool) -> int:
+    """Memory allocated outside of the stand-in parts (simulated sessions, benchmark's clients)"""
+    return sum(
+        stat.size for stat in snapshot.filter_traces([tracemalloc.Filter(False, exclude, all_frames=all_frames)])
+        .statistics('filename')
+    )
+
+
+def measure_fanout(backend: SimulatedBackend, clients: list[Client], events: int) -> dict:
+    sessions = backend.get_sessions()
+    before = sum(client.events for client in clients)
+    started = time.perf_counter()
+    for i in range(events):
+        session = sessions[i % len(sessions)]
+        backend.change_volume(session, (session.volume + 1) % 101)
+
+    finished = wait_quiet(clients)
+    delivered = sum(client.events for client in clients) - before
+    return {
+        'events': events,
+        'clients': len(clients),
+        'delivered_per_client': delivered / len(clients),
+        'events_per_second_per_client': delivered / len(clients) / (finished - started),
+        'deliveries_per_second': delivered / (finished - started),
+    }
+
+
+def measure_rtt(backend: SimulatedBackend, client: Client, samples: int) -> dict:
+    sessions = backend.get_sessions()
+    latencies = list()
+    for i in range(samples):
+        session = sessions[i % len(sessions)]
+        volume = (session.volume + 1) % 101
+        started = time.perf_counter()
+        client.send({'event': 'SetVolume', 'PID': session.ProcessId, 'volume': volume})
+        latencies.append(client.wait_volume(session.ProcessId, volume) - started)
+
+    latencies.sort()
+    return {
+        'samples': samples,
+        'mean_ms': statistics.mean(latencies) * 1e3,
+        'p50_ms': latencies[len(latencies) // 2] * 1e3,
+        'p99_ms': latencies[int(len(latencies) * 0.99)] * 1e3,
+    }
+
+
+def measure_sync(backend: SimulatedBackend, controller: AudioController, counts: list[int]) -> list[dict]:
+    results = list()
+    for count in counts:
+        while len(backend.get_sessions()) < count:
+            backend.add_session()
+
+        settle(controller)
+        started = time.perf_counter()
+        client = Client()
+        received_at = client.wait_events(count * EVENTS_PER_SESSION + DEVICE_EVENTS)
+        client.close()
+        results.append({'sessions': count, 'ms': (received_at - started) * 1e3})
+
+    return results
+
+
+def run(sessions: int, clients_count: int, fanout_events: int, rtt_samples: int, sync_counts: list[int]) -> dict:
+    backend = SimulatedBackend(sessions)
+    controller = BenchmarkAudioController(NetworkTransport, coalesce_window=0, backend=backend)  # Every event goes out
+    main_thread = threading.Thread(target=controller.start_blocking, daemon=True)
+    main_thread.start()
+    settle(controller)
+
+    tracemalloc.start(25)
+    before = tracemalloc.take_snapshot()
+    clients = [Client() for _ in range(clients_count)]
+    for client in clients:
+        client.wait_events(sessions * EVENTS_PER_SESSION + DEVICE_EVENTS)
+
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    bytes_per_client = (
+        traced_bytes(after, '*benchmarks*', True) - traced_bytes(before, '*benchmarks*', True)
+    ) / clients_count
+
+    results = {
+        'config': {
+            'sessions': sessions,
+            'clients': clients_count,
+            'coalesce_window': 0,
+            'python': sys.version.split()[0],
+        },
+        'fanout': measure_fanout(backend, clients, fanout_events),
+        'rtt': measure_rtt(backend, clients[0], rtt_samples),
+    }
+    for client in clients:
+        client.close()
+
+    results['full_state_sync'] = measure_sync(backend, controller, sync_counts)
+
+    added = 1000
+    tracemalloc.start(25)
+    before = tracemalloc.take_snapshot()
+    for _ in range(added):
+        backend.add_session()
+
+    settle(controller)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    bytes_per_session = (
+        traced_bytes(after, '*SimulatedBackend.py', False) - traced_bytes(before, '*SimulatedBackend.py', False)
+    ) / added
+    results['memory'] = {'bytes_per_session': bytes_per_session, 'bytes_per_client': bytes_per_client}
+
+    time.sleep(0.1)  # Let the server see clients' disconnection, so the port doesn't stay in TIME_WAIT
+    controller.running = False
+    main_thread.join(2)
+    controller.pre_shutdown()
+    return results
+
+
+def compare(old, new, path: str = '') -> list[str]:
+    """Relative change of every number present in both results which has changed"""
+    if isinstance(old, dict) and isinstance(new, dict):
+        return [line for key in old.keys() & new.keys() for line in compare(old[key], new[key], f'{path}.{key}')]
+
+    if isinstance(old, list) and isinstance(new, list):
+        return [line for i, (o, n) in enumerate(zip(old, new)) for line in compare(o, n, f'{path}[{i}]')]
+
+    if isinstance(old, (int, float)) and isinstance(new, (int, float)) and old not in (0, new):
+        return [f'{path[1:]}: {old:.6g} -> {new:.6g} ({(new - old) / old * 100:+.1f}%)']
+
+    return list()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=100)
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--fanout-events', type=int, default=20000)
+    parser.add_argument('--rtt-samples', type=int, default=1000)
+    parser.add_argument('--sync-sessions', type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--output', help='Write results to the file instead of stdout')
+    parser.add_argument('--compare', help='Results of a previous run to print relative changes against')
+    args = parser.parse_args()
+
+    logger.remove()  # Debug logging of every event would dominate
+    logger.add(sys.stderr, level='WARNING')
+
+    results = run(args.sessions, args.clients, args.fanout_events, args.rtt_samples, sorted(args.sync_sessions))
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.compare is not None:
+        with open(args.compare) as file:
+            print('\n'.join(sorted(compare(json.load(file), results))), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Floods `AudioController.outbound_q` with session churn (every session gets created, changes volume many times and
+gets closed) while `ServerSideView` is stalled, i.e. on a blocked send, and lets it catch up after the flood.
+Shows how big the queue gets, what gets dropped and how long producers (pycaw callbacks) wait with every policy.
+Run from the repository root: python -m benchmarks.queue_overload
+"""
+import threading
+import time
+import tracemalloc
+from queue import Queue
+
+import Events
+from AudioController import outbound_overload_key
+from WakeupQueue import WakeupQueue
+
+SESSIONS = 500
+VOLUME_CHANGES = 20  # Per session
+QUEUE_SIZE = 1024
+BLOCK_TIMEOUT = 0.001
+
+
+def flood(q: Queue) -> tuple[float, int, int]:
+    """Returns max put time, items consumed and sessions the consumer saw closed"""
+    consumed = list()
+    flood_done = threading.Event()
+
+    def consume():
+        flood_done.wait()
+        while True:
+            msg = q.get()
+            if isinstance(msg, Events.NewClient):  # End of the flood, never dropped
+                return
+
+            consumed.append(msg)
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+
+    max_put = 0.0
+    for pid in range(SESSIONS):
+        for msg in (
+                Events.NewSession(pid),
+                *(Events.VolumeChanged(pid, volume) for volume in range(VOLUME_CHANGES)),
+                Events.SessionClosed(pid)
+        ):
+            started = time.perf_counter()
+            q.put(msg)
+            max_put = max(max_put, time.perf_counter() - started)
+
+    flood_done.set()
+    q.put(Events.NewClient(-1))
+    consumer.join()
+    closed = sum(1 for msg in consumed if isinstance(msg, Events.SessionClosed))
+    return max_put, len(consumed), closed
+
+
+def main():
+    produced = SESSIONS * (VOLUME_CHANGES + 2)
+    print(
+        f'{SESSIONS} sessions, {produced} events, consumer stalled during the flood, '
+        f'queue size {QUEUE_SIZE}, block timeout {BLOCK_TIMEOUT * 1e3} ms'
+    )
+    cases = [('unbounded', lambda: WakeupQueue())] + [
+        (policy, lambda policy=policy: WakeupQueue(
+            QUEUE_SIZE, policy=policy, block_timeout=BLOCK_TIMEOUT, overload_key=outbound_overload_key, name=policy
+        ))
+        for policy in ('drop_oldest', 'coalesce', 'block')
+    ]
+    for title, factory in cases:
+        q = factory()
+        tracemalloc.start()
+        max_put, consumed, closed = flood(q)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        q.close()
+        print(
+            f'{title:<12} high water {q.high_water:6}, peak memory {peak / 2 ** 20:6.1f} MiB, '
+            f'consumed {consumed:6}, dropped {q.dropped:6}, coalesced {q.coalesced:6}, '
+            f'sessions closed {closed:5}, max put {max_put * 1e3:6.2f} ms'
+        )
+
+
+if __name__ == '__main__':
+    main()
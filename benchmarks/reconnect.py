@@ -0,0 +1,111 @@
+"""
+Measures reconnect of a client which has missed a few changes while disconnected: bytes it receives and time until it
+is up to date, getting full state again versus asking for the missed events by `Resync`, for different sessions count.
+Checks that the state a client builds is the same either way.
+`SimulatedBackend` -> `AudioController` -> `ServerSideView` -> `NetworkTransport` -> a local TCP client.
+Run from the repository root: python -m benchmarks.reconnect
+"""
+import json
+import socket
+import sys
+import threading
+import time
+
+from loguru import logger
+
+from AudioController import AudioController
+from NetworkTransport import NetworkTransport
+from SimulatedBackend import SimulatedBackend
+
+
+class BenchmarkAudioController(AudioController):
+    state_table_path = None  # Not to overwrite the state table of a server running on this host
+
+
+class Client:
+    """Connects, asks for full state or missed events and reads until `Synced`, keeps volumes of sessions"""
+
+    def __init__(self, volumes: dict[int, int] | None = None):
+        self.volumes: dict[int, int] = dict() if volumes is None else dict(volumes)
+        self.seq: int | None = None
+        self.epoch: int | None = None
+        self.received_bytes = 0
+
+    def sync(self, resync: bool) -> float:
+        """Returns seconds from connect until the client is up to date"""
+        started = time.perf_counter()
+        with socket.create_connection(('localhost', 54683)) as sock, sock.makefile('rb') as file:
+            if resync:
+                request = {'event': 'Resync', 'PID': -1, 'last_seq': self.seq, 'epoch': self.epoch}
+
+            else:
+                request = {'event': 'NewClient', 'PID': -1}
+
+            sock.sendall(json.dumps(request).encode() + b'\n')
+            for line in file:
+                self.received_bytes += len(line)
+                event = json.loads(line)
+                if event['event'] == 'Synced':
+                    self.seq, self.epoch = event['seq'], event['epoch']
+                    return time.perf_counter() - started
+
+                if event['event'] == 'VolumeChanged':
+                    self.volumes[event['PID']] = event['new_volume']
+
+                elif event['event'] == 'SessionClosed':
+                    self.volumes.pop(event['PID'], None)
+
+        raise ConnectionError('Disconnected before Synced')
+
+
+def wait_quiet(controller: AudioController, quiet: float = 0.2):
+    """Waits until the view stops sending, names of new sessions get resolved and sent a bit later than they appear"""
+    while True:
+        seq = controller.view._seq  # noqa
+        time.sleep(quiet)
+        if controller.view._seq == seq:  # noqa
+            return
+
+
+def main(counts: tuple[int, ...] = (100, 1000, 5000), missed: int = 10):
+    logger.remove()  # Debug logging of every event would dominate
+    logger.add(sys.stderr, level='WARNING')
+
+    backend = SimulatedBackend()
+    controller = BenchmarkAudioController(NetworkTransport, backend=backend)
+    main_thread = threading.Thread(target=controller.start_blocking, daemon=True)
+    main_thread.start()
+
+    print(f'missed changes: {missed}')
+    for count in counts:
+        while len(backend.get_sessions()) < count:
+            backend.add_session()
+
+        wait_quiet(controller)
+        client = Client()
+        client.sync(resync=False)
+
+        # Disconnected meanwhile some sessions change
+        sessions = backend.get_sessions()
+        for i in range(missed):
+            session = sessions[i * len(sessions) // missed]
+            backend.change_volume(session, (session.volume + 37) % 101)
+
+        wait_quiet(controller)
+        for resync in (False, True):
+            reconnected = Client(client.volumes)
+            reconnected.seq, reconnected.epoch = client.seq, client.epoch
+            elapsed = reconnected.sync(resync)
+            expected = {session.ProcessId: session.volume for session in backend.get_sessions()}
+            label = 'resync' if resync else 'full state'
+            consistent = 'consistent' if reconnected.volumes == expected else 'INCONSISTENT'
+            print(f'{count:>5} sessions, {label:>10}: {reconnected.received_bytes:8} bytes, {elapsed * 1e3:7.2f} ms, '
+                  f'{consistent}')
+
+    controller.running = False
+    main_thread.join(2)
+    controller.pre_shutdown()
+
+
+if __name__ == '__main__':
+    main()
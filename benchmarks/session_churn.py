@@ -0,0 +1,80 @@
+"""
+Measures churn of extra sessions of long-living processes, as browser tabs and games open and close them: backend
+registrations and events sent to clients per churned session, and how many processes clients still see afterwards.
+Compares `AudioController`, which keeps every session of a process, with one which evicts the known session of a
+process when another one arrives, as it was done before.
+Run from the repository root: python -m benchmarks.session_churn
+"""
+import sys
+import threading
+
+from loguru import logger
+
+from AudioController import AudioController
+from SimulatedBackend import SimulatedSession
+from benchmarks.multi_device import CountingBackend
+from benchmarks.pipeline import settle
+from benchmarks.view_latency import FakeTransport
+
+
+class BenchmarkAudioController(AudioController):
+    metrics_port = None
+    state_table_path = None
+
+
+class EvictingAudioController(BenchmarkAudioController):
+    """Keeps one session per process, the latest one"""
+
+    def _add_session(self, device_id: str, new_session: SimulatedSession):
+        key = (device_id, new_session.InstanceIdentifier)
+        if key not in self._sessions:
+            for other in tuple(self._keys_by_pid.get(new_session.ProcessId, ())):
+                self._generic_disconnect(other)
+
+        super()._add_session(device_id, new_session)
+
+
+def run(controller_cls: type[AudioController], processes: int, rounds: int) -> tuple[float, float, int]:
+    """Returns registrations and events per churned session and processes known to clients in the end"""
+    backend = CountingBackend(processes, 1)
+    controller = controller_cls(FakeTransport, backend=backend)
+    transport: FakeTransport = controller.view.transports[0]  # noqa
+    main_thread = threading.Thread(target=controller.start_blocking, daemon=True)
+    main_thread.start()
+    settle(controller)
+
+    base_sessions = backend.get_sessions()
+    registrations_before = backend.registrations
+    events_before = len(transport.sent_at)
+    for _ in range(rounds):
+        tabs = [backend.add_session(process=session.Process) for session in base_sessions]
+        settle(controller)
+        for tab in tabs:
+            backend.expire_session(tab)
+
+        settle(controller)
+
+    churned = processes * rounds
+    registrations = (backend.registrations - registrations_before) / churned
+    events = (len(transport.sent_at) - events_before) / churned
+    known = len(controller.view._state)  # noqa
+
+    controller.running = False
+    main_thread.join(2)
+    controller.pre_shutdown()
+    return registrations, events, known
+
+
+def main(processes: int = 200, rounds: int = 5):
+    logger.remove()  # Evicting controller warns about every evicted session
+    logger.add(sys.stderr, level='ERROR')
+
+    print(f'processes: {processes}, rounds: {rounds}')
+    for label, controller_cls in (('evicting', EvictingAudioController), ('keeping', BenchmarkAudioController)):
+        registrations, events, known = run(controller_cls, processes, rounds)
+        print(f'{label:>8}: {registrations:.2f} registrations, {events:.2f} events sent per churned session, '
+              f'{known} of {processes} processes known to clients in the end')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Compares how `ServerSideView` keeps state of sessions, `SessionState` records against the dict of the latest events
+per process it kept before (reimplemented here as `DictOfDictsView`), at 10k sessions: memory per session, cost of
+`_update_state` for changes and for echoes of changes, and cost of full state after a few sessions have changed.
+Only the view is measured, the transport is fake.
+Run from the repository root: python -m benchmarks.session_state
+"""
+import gc
+import time
+import tracemalloc
+from queue import Queue
+
+import Events
+from ServerSideView import ServerSideView
+from WakeupQueue import WakeupQueue
+from benchmarks.view_latency import FakeTransport
+
+
+class DictOfDictsView(ServerSideView):
+    """`_state` as PID : {event class : the latest event}, as it was"""
+
+    def _update_state(self, event: Events.ServerToClientEvent) -> bool:
+        if isinstance(event, self.device_events):
+            return self._update_device_state(event)
+
+        if not isinstance(event, Events.NewSession) and event.PID not in self._state:
+            return False
+
+        if isinstance(event, Events.NewSession):
+            self._state[event.PID] = {Events.NewSession: event}
+
+        elif isinstance(event, Events.SessionClosed):
+            del self._state[event.PID]
+
+        elif isinstance(event, Events.SessionAdded):
+            self._state[event.PID][Events.SessionAdded, event.session_id] = event
+
+        elif isinstance(event, Events.SessionRemoved):
+            if self._state[event.PID].pop((Events.SessionAdded, event.session_id), None) is None:
+                return False
+
+        else:
+            session = self._state[event.PID]
+            if session.get(type(event)) == event:
+                return False
+
+            session[type(event)] = event
+
+        self._snapshot = None
+        return True
+
+    def _get_snapshot(self) -> list[Events.ServerToClientEvent]:
+        if self._snapshot is None:
+            self._snapshot = [event for device in self._devices.values() for event in device.values()]
+            self._snapshot.extend(event for session in self._state.values() for event in session.values())
+
+        return self._snapshot
+
+
+def populate(view: ServerSideView, sessions: int):
+    for pid in range(1, sessions + 1):
+        for event in (
+                Events.NewSession(pid),
+                Events.SessionAdded(pid, pid, 'device'),
+                Events.SetName(pid, f'app {pid}.exe'),
+                Events.VolumeChanged(pid, 50),
+                Events.MuteStateChanged(pid, False),
+                Events.StateChanged(pid, True)
+        ):
+            view._update_state(event)  # noqa
+
+
+def full_state(view: ServerSideView) -> int:
+    """What sending full state costs the view: the snapshot and its serialization"""
+    return sum(len(Events.encode_event(event)) for event in view._get_snapshot())  # noqa
+
+
+def measure(view_cls: type[ServerSideView], sessions: int, rounds: int, changed: int) -> dict[str, float]:
+    view = view_cls(WakeupQueue(), Queue(), FakeTransport, coalesce_window=0)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    populate(view, sessions)
+    gc.collect()
+    state_bytes = tracemalloc.get_traced_memory()[0] - before
+    full_state(view)  # Events of full state get built and serialized once
+    view._snapshot = None  # noqa, only what sessions keep is counted
+    gc.collect()
+    served_bytes = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    # Events are created beforehand, so only `_update_state` is timed
+    changes = [Events.VolumeChanged(pid, n % 100) for n in range(rounds) for pid in range(1, sessions + 1)]
+    started = time.perf_counter()
+    for event in changes:
+        view._update_state(event)  # noqa
+
+    change_ns = (time.perf_counter() - started) / len(changes) * 1e9
+    echoes = [Events.VolumeChanged(pid, (rounds - 1) % 100) for pid in range(1, sessions + 1)] * rounds
+    started = time.perf_counter()
+    for event in echoes:
+        view._update_state(event)  # noqa
+
+    echo_ns = (time.perf_counter() - started) / len(echoes) * 1e9
+
+    full_state(view)
+    for pid in range(1, changed + 1):
+        view._update_state(Events.VolumeChanged(pid, 100))  # noqa
+
+    started = time.perf_counter()
+    full_state(view)
+    full_state_ms = (time.perf_counter() - started) * 1e3
+    return {
+        'state_bytes': state_bytes / sessions,
+        'served_bytes': served_bytes / sessions,
+        'change_ns': change_ns,
+        'echo_ns': echo_ns,
+        'full_state_ms': full_state_ms,
+    }
+
+
+def main(sessions: int = 10000, rounds: int = 20, changed: int = 100):
+    print(f'sessions: {sessions}, {rounds} volume changes and {rounds} echoes per session, '
+          f'full state after {changed} sessions have changed')
+    for label, view_cls in (('dict of dicts', DictOfDictsView), ('SessionState', ServerSideView)):
+        result = measure(view_cls, sessions, rounds, changed)
+        print(f'{label:>13}: {result["state_bytes"]:4.0f} bytes per session, {result["served_bytes"]:4.0f} with '
+              f'full state built, update {result["change_ns"]:3.0f} ns, echo {result["echo_ns"]:3.0f} ns, '
+              f'full state {result["full_state_ms"]:5.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
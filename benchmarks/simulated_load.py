@@ -0,0 +1,119 @@
+"""
+Load test of the whole pipeline: `SimulatedBackend` -> `AudioController` -> `ServerSideView` -> `NetworkTransport`
+-> TCP clients. Thousands of sessions get a storm of volume, mute and state changes and churn from several threads,
+after it every client's view of sessions is compared with the backend's state.
+Run from the repository root: python -m benchmarks.simulated_load
+"""
+import json
+import socket
+import sys
+import threading
+import time
+
+from loguru import logger
+
+from AudioController import AudioController
+from NetworkTransport import NetworkTransport
+from SimulatedBackend import SimulatedBackend
+
+
+class BenchmarkAudioController(AudioController):
+    state_table_path = None  # Not to overwrite the state table of a server running on this host
+
+
+class Client:
+    """Keeps sessions state built from received events"""
+
+    def __init__(self):
+        self.sock = socket.create_connection(('localhost', 54683))
+        self.sock.sendall(b'{"event": "NewClient", "PID": -1}\n')  # Full state right away, not after resync window
+        self.sessions: dict[int, dict] = dict()
+        self.events = 0
+        self.last_received_at = time.perf_counter()
+        self.thread = threading.Thread(target=self._read, daemon=True)
+        self.thread.start()
+
+    def _read(self):
+        with self.sock.makefile('rb') as file:
+            for line in file:
+                event = json.loads(line)
+                if event['event'] == 'Synced':  # Ends every update, not an event of a session
+                    continue
+
+                self.events += 1
+                self.last_received_at = time.perf_counter()
+                pid = event['PID']
+                if event['event'] == 'NewSession':
+                    self.sessions[pid] = dict()
+
+                elif event['event'] == 'SessionClosed':
+                    self.sessions.pop(pid, None)
+
+                elif pid in self.sessions:
+                    self.sessions[pid].update(event)
+
+    def close(self):
+        self.sock.close()
+        self.thread.join(1)
+
+
+def wait_quiet(clients: list[Client], quiet: float = 0.5) -> float:
+    """Waits until clients stop receiving, returns when the last event was received"""
+    while True:
+        time.sleep(quiet / 5)
+        last = max(client.last_received_at for client in clients)
+        if time.perf_counter() - last > quiet:
+            return last
+
+
+def inconsistent(client: Client, backend: SimulatedBackend) -> int:
+    expected = {session.ProcessId: session for session in backend.get_sessions()}
+    mismatched = len(expected.keys() ^ client.sessions.keys())
+    for pid in expected.keys() & client.sessions.keys():
+        state = client.sessions[pid]
+        if state.get('new_volume') != expected[pid].volume or state.get('is_muted') != expected[pid].is_muted:
+            mismatched += 1
+
+    return mismatched
+
+
+def main(sessions: int = 2000, clients_count: int = 20, threads: int = 4, events_per_thread: int = 25000):
+    logger.remove()  # Debug logging of every event would dominate
+    logger.add(sys.stderr, level='WARNING')
+
+    backend = SimulatedBackend(sessions)
+    controller = BenchmarkAudioController(NetworkTransport, backend=backend)
+    main_thread = threading.Thread(target=controller.start_blocking, daemon=True)
+    main_thread.start()
+
+    started = time.perf_counter()
+    clients = [Client() for _ in range(clients_count)]
+    synced_at = wait_quiet(clients)
+    print(f'sessions: {sessions}, clients: {clients_count}, initial sync: {(synced_at - started) * 1e3:.0f} ms')
+
+    events_before = sum(client.events for client in clients)
+    started = time.perf_counter()
+    backend.storm(threads, events_per_thread)
+    stormed_at = time.perf_counter()
+    delivered_at = wait_quiet(clients)
+
+    notifications = threads * events_per_thread
+    received = sum(client.events for client in clients) - events_before
+    print(f'storm: {notifications} notifications from {threads} threads in {stormed_at - started:.2f} s, '
+          f'{notifications / (stormed_at - started):.0f}/s')
+    print(f'delivered to every client {(delivered_at - started):.2f} s after storm start, '
+          f'{received / clients_count:.0f} events per client')
+    print(f'outbound_q high water {controller.outbound_q.high_water}, dropped {controller.outbound_q.dropped}, '
+          f'coalesced {controller.outbound_q.coalesced}')
+    print(f'inconsistent sessions per client: {max(inconsistent(client, backend) for client in clients)} '
+          f'of {len(backend.get_sessions())}')
+
+    controller.running = False
+    main_thread.join(2)
+    controller.pre_shutdown()
+    for client in clients:
+        client.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""
+Concurrency stress test of `SharedStateTable`: a writer changes volumes, mute and activity state and names of
+processes and closes and reopens them (so slots get reused) as fast as it can, while reader processes read the table
+all along and check every record they get: a torn read would show as a name of another process or of the wrong
+length. Reports what an update costs the writer, what a read costs a reader and how often readers had to retry.
+Then the table kept by `AudioController` is checked against `SimulatedBackend` after a storm of changes.
+`SharedStateTable` -> reader processes; `SimulatedBackend` -> `AudioController` -> `ServerSideView` ->
+`SharedStateTable` -> `SharedStateReader`.
+Run from the repository root: python -m benchmarks.state_table_stress
+"""
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+from loguru import logger
+
+import Events
+import SharedStateTable
+from AudioController import AudioController
+from SimulatedBackend import SimulatedBackend
+
+
+def make_name(pid: int, n: int) -> str:
+    """Names are of different length and of multibyte characters, so they get truncated by the table too"""
+    name = f'{pid}-{n}-' + 'ä' * (n % 40)
+    return name.encode()[:SharedStateTable.NAME_SIZE].decode(errors='ignore')
+
+
+def check(record: SharedStateTable.SessionRecord) -> bool:
+    if not (-1 <= record.volume <= 100 and record.is_muted in (-1, 0, 1) and record.is_active in (-1, 0, 1)):
+        return False
+
+    if record.name == '':
+        return True
+
+    pid, n, _ = record.name.split('-', 2)
+    return int(pid) == record.pid and record.name == make_name(record.pid, int(n))
+
+
+def read_until(path: str, stop_at: float, results: multiprocessing.Queue):
+    reader = SharedStateTable.SharedStateReader(path)
+    reads = records = torn = 0
+    started = time.perf_counter()
+    while time.perf_counter() < stop_at:
+        for record in reader.sessions():
+            records += 1
+            if not check(record):
+                torn += 1
+
+        reads += 1
+
+    elapsed = time.perf_counter() - started
+    polls = 100000
+    poll_started = time.perf_counter()
+    for _ in range(polls):
+        reader.updates  # noqa
+
+    poll_ns = (time.perf_counter() - poll_started) / polls * 1e9
+    results.put({
+        'reads': reads, 'records': records, 'torn': torn, 'retries': reader.retries, 'seconds': elapsed,
+        'poll_ns': poll_ns,
+    })
+    reader.close()
+
+
+def write_round(table: SharedStateTable.SharedStateTable, pids: list[int], n: int) -> int:
+    """Changes every process, some get closed and reopened, returns count of updates"""
+    updates = 0
+    for pid in pids:
+        if n % 50 == pid % 50:  # The process gets closed and another one takes its slot
+            table.update(Events.SessionClosed(pid))
+            pid_reused = pid + len(pids) * n
+            table.update(Events.NewSession(pid_reused))
+            table.update(Events.SessionClosed(pid_reused))
+            table.update(Events.NewSession(pid))
+            updates += 4
+
+        table.update(Events.VolumeChanged(pid, n % 101))
+        table.update(Events.MuteStateChanged(pid, n % 2 == 0))
+        table.update(Events.StateChanged(pid, n % 3 == 0))
+        table.update(Events.SetName(pid, make_name(pid, n)))
+        updates += 4
+
+    return updates
+
+
+def stress(path: str, sessions: int, readers: int, seconds: float):
+    table = SharedStateTable.SharedStateTable(path, capacity=sessions)
+    pids = list(range(1, sessions + 1))
+    for pid in pids:
+        table.update(Events.NewSession(pid))
+
+    # Alone, what an update and a read cost without other processes competing for the CPU
+    started = time.perf_counter()
+    updates = sum(write_round(table, pids, n) for n in range(1, 201))
+    solo_update_ns = (time.perf_counter() - started) / updates * 1e9
+    reader = SharedStateTable.SharedStateReader(path)
+    started = time.perf_counter()
+    records = sum(len(reader.sessions()) for _ in range(200))
+    solo_record_ns = (time.perf_counter() - started) / records * 1e9
+    reader.close()
+    print(f'alone: {solo_update_ns:.0f} ns per update, {solo_record_ns:.0f} ns per record read')
+
+    results = multiprocessing.Queue()
+    stop_at = time.perf_counter() + seconds
+    processes = [
+        multiprocessing.Process(target=read_until, args=(path, stop_at, results), daemon=True) for _ in range(readers)
+    ]
+    for process in processes:
+        process.start()
+
+    updates = 0
+    n = 200
+    started = time.perf_counter()
+    while time.perf_counter() < stop_at:
+        n += 1
+        updates += write_round(table, pids, n)
+
+    update_ns = (time.perf_counter() - started) / updates * 1e9
+    reports = [results.get(timeout=10) for _ in processes]
+    for process in processes:
+        process.join(2)
+
+    table.close()
+    os.unlink(path)
+    reads = sum(report['reads'] for report in reports)
+    records = sum(report['records'] for report in reports)
+    print(f'stress: {sessions} slots, {readers} reader processes on {os.cpu_count()} cpus, {seconds:.0f} s, '
+          f'{updates} updates, {update_ns:.0f} ns per update')
+    print(f'readers: {reads} reads of the table, {records} records, '
+          f'{sum(report["seconds"] for report in reports) / records * 1e9:.0f} ns per record, '
+          f'{sum(report["retries"] for report in reports)} retries, {sum(report["torn"] for report in reports)} torn, '
+          f'{sum(report["poll_ns"] for report in reports) / len(reports):.0f} ns per poll of the update counter')
+
+
+def controller_storm(path: str, sessions: int, changes: int):
+    controller_cls = type('StateTableAudioController', (AudioController,), {'state_table_path': path})
+    backend = SimulatedBackend(sessions)
+    controller = controller_cls(backend=backend)
+    main_thread = threading.Thread(target=controller.start_blocking, daemon=True)
+    main_thread.start()
+    time.sleep(0.5)
+
+    reader = SharedStateTable.SharedStateReader(path)
+    backend_sessions = backend.get_sessions()
+    for i in range(changes):
+        session = backend_sessions[i % len(backend_sessions)]
+        if i % 7 == 0:
+            backend.change_mute(session, not session.is_muted)
+
+        else:
+            backend.change_volume(session, (session.volume + 1) % 101)
+
+    updates = reader.updates
+    while True:  # Until the table stops changing
+        time.sleep(0.2)
+        if reader.updates == updates:
+            break
+
+        updates = reader.updates
+
+    expected = {session.ProcessId: (session.volume, session.is_muted) for session in backend_sessions}
+    records = reader.sessions()
+    got = {record.pid: (record.volume, bool(record.is_muted)) for record in records}
+    reads = 10000
+    pid = backend_sessions[0].ProcessId
+    started = time.perf_counter()
+    for _ in range(reads):
+        reader.session(pid)
+
+    read_ns = (time.perf_counter() - started) / reads * 1e9
+    print(f'controller: {sessions} sessions, {changes} changes, table matches backend: {got == expected}, '
+          f'{sum(record.name != "" for record in records)} names, {read_ns:.0f} ns per read of a process')
+
+    reader.close()
+    controller.running = False
+    main_thread.join(2)
+    controller.pre_shutdown()
+    os.unlink(path)
+
+
+def main(sessions: int = 150, readers: int = 3, seconds: float = 5, changes: int = 20000):
+    logger.remove()  # Debug logging of every event would dominate
+    logger.add(sys.stderr, level='WARNING')
+
+    directory = os.path.dirname(SharedStateTable.default_path)
+    stress(os.path.join(directory, f'audiocontrol-stress-{os.getpid()}.state'), sessions, readers, seconds)
+    controller_storm(os.path.join(directory, f'audiocontrol-storm-{os.getpid()}.state'), sessions, changes)
+
+
+if __name__ == '__main__':
+    main()
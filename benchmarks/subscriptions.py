@@ -0,0 +1,144 @@
+"""
+Measures what clients watching a few applications pay for changes of all sessions, as a hardware fader panel bound to
+three apps does: bytes and events every client receives and CPU time it spends decoding them, without a subscription
+and subscribed by `Subscribe` to three PIDs or three app name patterns. Checks that every client ends up with
+the backend's volumes of the processes it watches.
+`SimulatedBackend` -> `AudioController` -> `ServerSideView` -> `NetworkTransport` -> local TCP clients.
+Run from the repository root: python -m benchmarks.subscriptions
+"""
+import json
+import socket
+import sys
+import threading
+import time
+from fnmatch import fnmatchcase
+
+from loguru import logger
+
+from AudioController import AudioController
+from NetworkTransport import NetworkTransport
+from SimulatedBackend import SimulatedBackend
+from benchmarks.simulated_load import wait_quiet
+
+
+class BenchmarkAudioController(AudioController):
+    state_table_path = None  # Not to overwrite the state table of a server running on this host
+
+
+class Client:
+    """Subscribes if asked, then reads and decodes everything it gets, keeps volumes of processes"""
+
+    def __init__(self, subscription: dict | None):
+        self.sock = socket.create_connection(('localhost', 54683))
+        request = b''
+        if subscription is not None:
+            request += json.dumps({'event': 'Subscribe', 'PID': -1, **subscription}).encode() + b'\n'
+
+        self.sock.sendall(request + b'{"event": "NewClient", "PID": -1}\n')
+        self.volumes: dict[int, int] = dict()
+        self.received_bytes = 0
+        self.events = 0
+        self.cpu = 0.0  # Seconds the reading thread has spent
+        self.synced = threading.Event()
+        self.last_received_at = time.perf_counter()
+        self.thread = threading.Thread(target=self._read, daemon=True)
+        self.thread.start()
+
+    def _read(self):
+        started = time.thread_time()
+        with self.sock.makefile('rb') as file:
+            for line in file:
+                self.received_bytes += len(line)
+                event = json.loads(line)
+                if event['event'] == 'Synced':
+                    self.synced.set()
+
+                elif event['event'] == 'VolumeChanged':
+                    self.volumes[event['PID']] = event['new_volume']
+
+                elif event['event'] == 'SessionClosed':
+                    self.volumes.pop(event['PID'], None)
+
+                self.events += 1
+                self.last_received_at = time.perf_counter()
+                self.cpu = time.thread_time() - started
+
+    def close(self):
+        self.sock.close()
+        self.thread.join(1)
+
+
+def run(backend: SimulatedBackend, subscription: dict | None, clients_count: int, changes: int) -> dict[str, float]:
+    clients = [Client(subscription) for _ in range(clients_count)]
+    for client in clients:
+        client.synced.wait(10)
+
+    wait_quiet(clients)
+    before = [(client.received_bytes, client.events, client.cpu) for client in clients]
+    sessions = backend.get_sessions()
+    started = time.process_time()
+    for i in range(changes):
+        session = sessions[i % len(sessions)]
+        backend.change_volume(session, (session.volume + 1) % 101)
+
+    wait_quiet(clients)
+    process_cpu = time.process_time() - started
+
+    expected = {session.ProcessId: session.volume for session in sessions}
+    if subscription is not None and len(subscription.get('pids', ())) > 0:
+        expected = {pid: volume for pid, volume in expected.items() if pid in subscription['pids']}
+
+    elif subscription is not None and len(subscription.get('names', ())) > 0:
+        expected = {
+            session.ProcessId: session.volume for session in sessions
+            if any(fnmatchcase(backend.describe_executable(session.Process.exe()).lower(), pattern.lower())
+                   for pattern in subscription['names'])
+        }
+
+    consistent = sum(client.volumes == expected for client in clients)
+    deltas = [
+        (client.received_bytes - received_bytes, client.events - events, client.cpu - cpu)
+        for client, (received_bytes, events, cpu) in zip(clients, before)
+    ]
+    for client in clients:
+        client.close()
+
+    return {
+        'bytes': sum(delta[0] for delta in deltas) / len(clients),
+        'events': sum(delta[1] for delta in deltas) / len(clients),
+        'cpu_ms': sum(delta[2] for delta in deltas) / len(clients) * 1e3,
+        'process_cpu': process_cpu,
+        'consistent': consistent,
+        'clients': len(clients),
+    }
+
+
+def main(sessions: int = 150, clients_count: int = 20, changes: int = 20000):
+    logger.remove()  # Debug logging of every event would dominate
+    logger.add(sys.stderr, level='WARNING')
+
+    backend = SimulatedBackend(sessions)
+    controller = BenchmarkAudioController(NetworkTransport, backend=backend)
+    main_thread = threading.Thread(target=controller.start_blocking, daemon=True)
+    main_thread.start()
+
+    watched = backend.get_sessions()[:3]
+    subscriptions = {
+        'everything': None,
+        '3 pids': {'pids': [session.ProcessId for session in watched]},
+        '3 names': {'names': [f'*{session.Process.name()}' for session in watched]},
+    }
+    print(f'sessions: {sessions}, clients: {clients_count}, volume changes: {changes}')
+    for label, subscription in subscriptions.items():
+        result = run(backend, subscription, clients_count, changes)
+        print(f'{label:>10}: {result["bytes"]:9.0f} bytes, {result["events"]:6.0f} events, '
+              f'{result["cpu_ms"]:7.1f} ms decoding per client, process cpu {result["process_cpu"]:.2f} s, '
+              f'{result["consistent"]} of {result["clients"]} clients consistent')
+
+    controller.running = False
+    main_thread.join(2)
+    controller.pre_shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Measures queue-to-transport latency of `ServerSideView` and its CPU usage while idle.
+`ServerSideView` is driven through a fake transport which only records when `send` was called.
+Run from the repository root: python -m benchmarks.view_latency
+"""
+import selectors
+import statistics
+import threading
+import time
+from queue import Queue
+from typing import Callable
+
+import Events
+from ServerSideView import ServerSideView
+from TransportABC import TransportABC
+from WakeupQueue import WakeupQueue
+
+
+class FakeTransport(TransportABC):
+    def __init__(self, rcv_callback: Callable[[Events.ClientToServerEvent], None], selector: selectors.BaseSelector):
+        self.sent_at: list[float] = list()
+        self.sent = threading.Event()
+
+    def send(self, msg: Events.ServerToClientEvent):
+        self.sent_at.append(time.perf_counter())
+        self.sent.set()
+
+    def send_many(self, msgs: list[Events.ServerToClientEvent]):
+        for msg in msgs:
+            if not isinstance(msg, Events.Synced):  # Ends every update, not an event of a session
+                self.send(msg)
+
+    def send_to(self, client_id: int, msgs: list[Events.ServerToClientEvent], is_state: bool = False) -> bool:
+        return False
+
+    def tick(self):
+        pass
+
+    def shutdown(self):
+        pass
+
+
+def main(samples: int = 2000, idle_seconds: float = 1.0):
+    outbound_q = WakeupQueue()
+    view = ServerSideView(outbound_q, Queue(), FakeTransport, coalesce_window=0)  # Every event of PID 1 goes out
+    transport: FakeTransport = view.transports[0]  # noqa
+    view.start()
+
+    outbound_q.put(Events.NewSession(1))
+    transport.sent.wait()
+
+    latencies = list()
+    for i in range(samples):
+        transport.sent.clear()
+        put_at = time.perf_counter()
+        outbound_q.put(Events.VolumeChanged(1, i % 101))
+        transport.sent.wait()
+        latencies.append(transport.sent_at[-1] - put_at)
+        time.sleep(0.0005)  # let the view go back to sleep in select()
+
+    cpu_before = time.process_time()
+    time.sleep(idle_seconds)
+    idle_cpu = (time.process_time() - cpu_before) / idle_seconds
+
+    view.stop()
+    view.join(1)
+
+    latencies.sort()
+    print(f'samples: {samples}')
+    print(f'latency mean: {statistics.mean(latencies) * 1e6:.1f} us')
+    print(f'latency p50: {latencies[len(latencies) // 2] * 1e6:.1f} us')
+    print(f'latency p99: {latencies[int(len(latencies) * 0.99)] * 1e6:.1f} us')
+    print(f'idle cpu: {idle_cpu * 100:.2f} %')
+
+
+if __name__ == '__main__':
+    main()
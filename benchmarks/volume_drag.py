@@ -0,0 +1,60 @@
+"""
+Simulates dragging a volume slider from 0 to 100: `AudioController` puts a `VolumeChanged` per distinct value
+to `ServerSideView` and we count what the transport gets to send with different coalescing windows.
+Run from the repository root: python -m benchmarks.volume_drag
+"""
+import time
+from queue import Queue
+
+import Events
+from ServerSideView import ServerSideView
+from WakeupQueue import WakeupQueue
+from benchmarks.view_latency import FakeTransport
+
+
+class CountingTransport(FakeTransport):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sent_bytes = 0
+        self.last: Events.ServerToClientEvent | None = None
+
+    def send(self, msg: Events.ServerToClientEvent):
+        self.sent_bytes += len(Events.encode_event(msg))
+        self.last = msg
+        super().send(msg)
+
+
+def drag(window: float, duration: float, steps: int = 101) -> tuple[int, int, int]:
+    outbound_q = WakeupQueue()
+    view = ServerSideView(outbound_q, Queue(), CountingTransport, coalesce_window=window)
+    transport: CountingTransport = view.transports[0]  # noqa
+    view.start()
+
+    outbound_q.put(Events.NewSession(1))
+    transport.sent.wait()
+    sent_before = len(transport.sent_at)
+    bytes_before = transport.sent_bytes
+
+    started = time.perf_counter()
+    for step in range(steps):
+        outbound_q.put(Events.VolumeChanged(1, step))
+        time.sleep(max(0.0, started + duration * (step + 1) / steps - time.perf_counter()))
+
+    time.sleep(window * 2 + 0.01)  # Let the last window to flush
+    view.stop()
+    view.join(1)
+
+    assert transport.last == Events.VolumeChanged(1, steps - 1), transport.last
+    return steps, len(transport.sent_at) - sent_before, transport.sent_bytes - bytes_before
+
+
+def main():
+    for duration in (0.05, 0.2, 0.5):
+        for window in (0, 0.005, 0.015):
+            events, sent, sent_bytes = drag(window, duration)
+            print(f'drag {duration * 1000:.0f} ms, window {window * 1000:.0f} ms: '
+                  f'{events} events -> {sent} sends, {sent_bytes} bytes')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Measures `VolumeIncrement` and `MuteToggle` throughput of `AudioController` and backend calls per command, with volume
+and mute state served from its cache and, for comparison, read from the backend every time as before the cache.
+Backend calls are made as slow as COM calls to the mixer with a busy wait. Also measures a reconciliation pass.
+Run from the repository root: python -m benchmarks.volume_increments
+"""
+import sys
+import threading
+import time
+
+from loguru import logger
+
+import Events
+from AudioController import AudioController
+from SimulatedBackend import SimulatedBackend, SimulatedSession
+from benchmarks.view_latency import FakeTransport
+
+
+class SlowBackend(SimulatedBackend):
+    """
+    Counts volume and mute calls, each one takes `call_time` seconds. Setting volume of the last session sets `done`,
+    so a command to it marks the end of a flood
+    """
+
+    def __init__(self, sessions: int, call_time: float):
+        super().__init__(sessions + 1)
+        self.call_time = call_time
+        self.calls = 0
+        self.marker_pid = self.get_sessions()[-1].ProcessId
+        self.done = threading.Event()
+
+    def _call(self):
+        self.calls += 1
+        deadline = time.perf_counter() + self.call_time
+        while time.perf_counter() < deadline:
+            pass
+
+    def get_volume(self, session: SimulatedSession) -> int:
+        self._call()
+        return super().get_volume(session)
+
+    def set_volume(self, session: SimulatedSession, volume: int):
+        self._call()
+        super().set_volume(session, volume)
+        if session.ProcessId == self.marker_pid:
+            self.done.set()
+
+    def is_muted(self, session: SimulatedSession) -> bool:
+        self._call()
+        return super().is_muted(session)
+
+    def set_mute(self, session: SimulatedSession, is_muted: bool):
+        self._call()
+        super().set_mute(session, is_muted)
+
+
+class BenchmarkAudioController(AudioController):
+    metrics_port = None
+    state_table_path = None
+    queue_size = 0  # The whole flood is queued, overload is measured by queue_overload
+
+
+class UncachedAudioController(BenchmarkAudioController):
+    """Reads state from the backend on every command"""
+
+    def increment_volume(self, pid: int, increment: int):
+        self.set_volume(pid, increment + self.backend.get_volume(self._sessions[self._keys_by_pid[pid][0]]))
+
+    def toggle_mute(self, pid: int):
+        self.set_mute(pid, not self.backend.is_muted(self._sessions[self._keys_by_pid[pid][0]]))
+
+
+def run(controller_cls: type[AudioController], sessions: int, commands: int, call_time: float):
+    backend = SlowBackend(sessions, call_time)
+    controller = controller_cls(FakeTransport, backend=backend)
+    main_thread = threading.Thread(target=controller.start_blocking, daemon=True)
+    main_thread.start()
+
+    results = dict()
+    for name, make in (
+            ('increments', lambda i: Events.VolumeIncrement(i % sessions + 1, 1 if i // sessions % 2 else -1)),
+            ('toggles', lambda i: Events.MuteToggle(i % sessions + 1)),
+    ):
+        backend.done.clear()
+        calls_before = backend.calls
+        started = time.perf_counter()
+        for i in range(commands):
+            controller.inbound_q.put(make(i))
+
+        controller.inbound_q.put(Events.SetVolume(backend.marker_pid, len(results)))
+        backend.done.wait()
+        elapsed = time.perf_counter() - started
+        results[name] = (commands / elapsed, (backend.calls - calls_before - 1) / commands)
+
+    calls_before = backend.calls
+    started = time.perf_counter()
+    controller.reconcile()
+    results['reconcile'] = ((time.perf_counter() - started) * 1e3, backend.calls - calls_before)
+
+    controller.running = False
+    main_thread.join(2)
+    controller.pre_shutdown()
+    return results
+
+
+def main(sessions: int = 50, commands: int = 20000, call_time: float = 20e-6):
+    logger.remove()  # Debug logging of every command would dominate
+    logger.add(sys.stderr, level='WARNING')
+
+    print(f'sessions: {sessions}, commands: {commands}, backend call: {call_time * 1e6:.0f} us')
+    for controller_cls in (UncachedAudioController, BenchmarkAudioController):
+        results = run(controller_cls, sessions, commands, call_time)
+        label = 'cached' if controller_cls is BenchmarkAudioController else 'uncached'
+        for name in ('increments', 'toggles'):
+            per_second, calls = results[name]
+            print(f'{label:>8} {name:>10}: {per_second:8.0f}/s, {calls:.2f} backend calls per command')
+
+    reconcile_ms, calls = results['reconcile']
+    print(f'reconcile pass: {reconcile_ms:.2f} ms, {calls} backend calls')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Compares a fade streamed by a client as `VolumeIncrement` events with a single server-side `VolumeRamp`: messages
+each way and how far from the requested duration the fade ends, then runs concurrent ramps of many sessions.
+`SimulatedBackend` -> `AudioController` -> `ServerSideView` -> `NetworkTransport` -> a local TCP client.
+Run from the repository root: python -m benchmarks.volume_ramp
+"""
+import json
+import socket
+import sys
+import threading
+import time
+
+from loguru import logger
+
+from AudioController import AudioController
+from NetworkTransport import NetworkTransport
+from SimulatedBackend import SimulatedBackend
+
+
+class BenchmarkAudioController(AudioController):
+    state_table_path = None  # Not to overwrite the state table of a server running on this host
+
+
+class Client:
+    """Keeps the latest volume of every session and counts received `VolumeChanged` events"""
+
+    def __init__(self):
+        self.sock = socket.create_connection(('localhost', 54683))
+        self.sock.sendall(b'{"event": "NewClient", "PID": -1}\n')  # Full state right away, not after resync window
+        self.volumes: dict[int, int] = dict()
+        self.volume_events = 0
+        self.sent = 0
+        self._condition = threading.Condition()
+        self.thread = threading.Thread(target=self._read, daemon=True)
+        self.thread.start()
+
+    def _read(self):
+        with self.sock.makefile('rb') as file:
+            for line in file:
+                event = json.loads(line)
+                if event['event'] == 'VolumeChanged':
+                    with self._condition:
+                        self.volumes[event['PID']] = event['new_volume']
+                        self.volume_events += 1
+                        self._condition.notify_all()
+
+    def send(self, event: dict):
+        self.sock.sendall(json.dumps(event).encode() + b'\n')
+        self.sent += 1
+
+    def wait_volumes(self, volumes: dict[int, int], timeout: float = 10) -> float:
+        with self._condition:
+            if not self._condition.wait_for(lambda: all(self.volumes.get(pid) == v for pid, v in volumes.items()),
+                                            timeout):
+                raise TimeoutError('Not all volumes have arrived')
+
+        return time.perf_counter()
+
+    def reset_counters(self):
+        with self._condition:
+            self.volume_events = 0
+            self.sent = 0
+
+    def close(self):
+        self.sock.close()
+        self.thread.join(1)
+
+
+def client_side_fade(client: Client, pid: int, duration: float, step: int = 2, interval: float = 0.02) -> float:
+    """Fades from 100 to 0 as a client without ramps does, returns when the client has seen volume 0"""
+    started = time.perf_counter()
+    for i in range(100 // step):
+        client.send({'event': 'VolumeIncrement', 'PID': pid, 'increment': -step})
+        time.sleep(max(0.0, started + (i + 1) * duration / (100 // step) - time.perf_counter()))
+
+    return client.wait_volumes({pid: 0}) - started
+
+
+def server_side_fade(client: Client, pids: list[int], duration: float) -> float:
+    started = time.perf_counter()
+    for pid in pids:
+        client.send({'event': 'VolumeRamp', 'PID': pid, 'volume': 0, 'duration': int(duration * 1000)})
+
+    return client.wait_volumes({pid: 0 for pid in pids}) - started
+
+
+def reset(backend: SimulatedBackend, client: Client, pids: list[int]):
+    for session in backend.get_sessions():
+        backend.change_volume(session, 100)
+
+    client.wait_volumes({pid: 100 for pid in pids})
+    time.sleep(0.05)
+    client.reset_counters()
+
+
+def main(sessions: int = 1000, duration: float = 1.0):
+    logger.remove()  # Debug logging of every event would dominate
+    logger.add(sys.stderr, level='WARNING')
+
+    backend = SimulatedBackend(sessions)
+    controller = BenchmarkAudioController(NetworkTransport, backend=backend)
+    main_thread = threading.Thread(target=controller.start_blocking, daemon=True)
+    main_thread.start()
+
+    client = Client()
+    pids = [session.ProcessId for session in backend.get_sessions()]
+    reset(backend, client, pids)
+
+    elapsed = client_side_fade(client, pids[0], duration)
+    print(f'client-side fade of {duration:.1f} s: {client.sent} messages sent, {client.volume_events} received, '
+          f'ended after {elapsed:.3f} s')
+
+    reset(backend, client, pids)
+    elapsed = server_side_fade(client, pids[:1], duration)
+    print(f'server-side ramp of {duration:.1f} s: {client.sent} messages sent, {client.volume_events} received, '
+          f'ended after {elapsed:.3f} s')
+
+    reset(backend, client, pids)
+    cpu_before = time.process_time()
+    elapsed = server_side_fade(client, pids, duration)
+    cpu = time.process_time() - cpu_before
+    print(f'{len(pids)} concurrent ramps of {duration:.1f} s: {client.sent} messages sent, {client.volume_events} '
+          f'received, ended after {elapsed:.3f} s, process cpu {cpu:.2f} s')
+
+    controller.running = False
+    main_thread.join(2)
+    controller.pre_shutdown()
+    client.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+"""
+Load test of `WebSocketTransport` with a few hundred browser-like clients: handshakes, full state to every client,
+then a storm of volume changes. Measures bytes and frames on the wire per client and time until every client has got
+everything, with and without permessage-deflate, and checks every client's volumes against the backend's.
+`SimulatedBackend` -> `AudioController` -> `ServerSideView` -> `WebSocketTransport` -> local WebSocket clients, all
+clients are driven by one thread.
+Run from the repository root: python -m benchmarks.websocket_load
+"""
+import base64
+import json
+import os
+import selectors
+import socket
+import struct
+import sys
+import threading
+import time
+import zlib
+
+from loguru import logger
+
+from AudioController import AudioController
+from SimulatedBackend import SimulatedBackend
+from WebSocketTransport import WebSocketTransport, OP_TEXT, OP_CLOSE
+from benchmarks.simulated_load import wait_quiet
+
+
+class BenchmarkAudioController(AudioController):
+    state_table_path = None  # Not to overwrite the state table of a server running on this host
+
+
+class WebSocketClient:
+    """Handshakes, asks for full state and keeps volumes of processes from received messages"""
+
+    def __init__(self, deflate: bool):
+        self.sock = socket.create_connection(('localhost', WebSocketTransport.port))
+        key = base64.b64encode(os.urandom(16))
+        extensions = b'Sec-WebSocket-Extensions: permessage-deflate; client_max_window_bits\r\n' if deflate else b''
+        self.sock.sendall(
+            b'GET / HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+            b'Sec-WebSocket-Key: ' + key + b'\r\nSec-WebSocket-Version: 13\r\n' + extensions + b'\r\n'
+        )
+        self.sock.setblocking(False)
+        self._buffer = bytearray()
+        self._handshake_done = False
+        self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        self.deflate = False  # Accepted by server
+        self.volumes: dict[int, int] = dict()
+        self.received_bytes = 0
+        self.frames = 0
+        self.events = 0
+        self.synced = threading.Event()
+        self.last_received_at = time.perf_counter()
+
+    def send_text(self, text: bytes):
+        mask = os.urandom(4)
+        header = struct.pack('!BB', 0x80 | OP_TEXT, 0x80 | len(text)) if len(text) < 126 else \
+            struct.pack('!BBH', 0x80 | OP_TEXT, 0x80 | 126, len(text))
+        masked = bytes(byte ^ mask[i % 4] for i, byte in enumerate(text))
+        self.sock.setblocking(True)
+        self.sock.sendall(header + mask + masked)
+        self.sock.setblocking(False)
+
+    def on_readable(self) -> bool:
+        """Returns False when the connection is closed"""
+        try:
+            data = self.sock.recv(256 * 1024)
+
+        except BlockingIOError:
+            return True
+
+        except ConnectionError:
+            return False
+
+        if len(data) == 0:
+            return False
+
+        self.received_bytes += len(data)
+        self._buffer += data
+        if not self._handshake_done:
+            end = self._buffer.find(b'\r\n\r\n')
+            if end == -1:
+                return True
+
+            response = bytes(self._buffer[:end])
+            assert response.startswith(b'HTTP/1.1 101'), response
+            self.deflate = b'permessage-deflate' in response
+            del self._buffer[:end + 4]
+            self._handshake_done = True
+            self.send_text(b'{"event": "NewClient", "PID": -1}')
+
+        self._parse_frames()
+        return True
+
+    def _parse_frames(self):
+        buffer = self._buffer
+        offset = 0
+        while len(buffer) - offset >= 2:
+            first, length = buffer[offset], buffer[offset + 1] & 0x7F
+            header = 2
+            if length == 126:
+                header = 4
+                if len(buffer) - offset < header:
+                    break
+
+                length, = struct.unpack_from('!H', buffer, offset + 2)
+
+            elif length == 127:
+                header = 10
+                if len(buffer) - offset < header:
+                    break
+
+                length, = struct.unpack_from('!Q', buffer, offset + 2)
+
+            if len(buffer) - offset < header + length:
+                break
+
+            payload = bytes(buffer[offset + header:offset + header + length])
+            offset += header + length
+            self.frames += 1
+            if first & 0x0F == OP_TEXT:
+                if first & 0x40:
+                    payload = self._decompressor.decompress(payload + b'\x00\x00\xff\xff')
+
+                self._on_message(payload)
+
+        del buffer[:offset]
+
+    def _on_message(self, payload: bytes):
+        for line in payload.splitlines():
+            event = json.loads(line)
+            if event['event'] == 'Synced':
+                self.synced.set()
+                continue
+
+            self.events += 1
+            if event['event'] == 'VolumeChanged':
+                self.volumes[event['PID']] = event['new_volume']
+
+            elif event['event'] == 'SessionClosed':
+                self.volumes.pop(event['PID'], None)
+
+        self.last_received_at = time.perf_counter()
+
+    def close(self):
+        try:
+            self.sock.setblocking(True)
+            self.sock.sendall(struct.pack('!BB', 0x80 | OP_CLOSE, 0x80 | 2) + b'\x00' * 4 + struct.pack('!H', 1000))
+
+        except OSError:
+            pass
+
+        self.sock.close()
+
+
+class ClientsThread(threading.Thread):
+    """Reads all clients' sockets with one selector"""
+
+    daemon = True
+
+    def __init__(self, clients: list[WebSocketClient]):
+        super().__init__()
+        self.clients = clients
+        self.running = True
+
+    def run(self):
+        selector = selectors.DefaultSelector()
+        for client in self.clients:
+            selector.register(client.sock, selectors.EVENT_READ, client)
+
+        while self.running:
+            for key, _ in selector.select(0.1):
+                if not key.data.on_readable():
+                    selector.unregister(key.fileobj)
+
+        selector.close()
+
+
+def run(backend: SimulatedBackend, clients_count: int, deflate: bool, changes: int) -> dict[str, float]:
+    started = time.perf_counter()
+    clients = [WebSocketClient(deflate) for _ in range(clients_count)]
+    thread = ClientsThread(clients)
+    thread.start()
+    for client in clients:
+        client.synced.wait(30)
+
+    state_seconds = time.perf_counter() - started
+    wait_quiet(clients)
+    before = [(client.received_bytes, client.frames, client.events) for client in clients]
+    sessions = backend.get_sessions()
+    started = time.perf_counter()
+    for i in range(changes):
+        session = sessions[i % len(sessions)]
+        backend.change_volume(session, (session.volume + 1) % 101)
+
+    storm_seconds = wait_quiet(clients) - started
+    expected = {session.ProcessId: session.volume for session in sessions}
+    consistent = sum(client.volumes == expected for client in clients)
+    deltas = [
+        (client.received_bytes - received_bytes, client.frames - frames, client.events - events)
+        for client, (received_bytes, frames, events) in zip(clients, before)
+    ]
+    thread.running = False
+    thread.join(2)
+    for client in clients:
+        client.close()
+
+    return {
+        'deflate': sum(client.deflate for client in clients),
+        'state_seconds': state_seconds,
+        'storm_seconds': storm_seconds,
+        'bytes': sum(delta[0] for delta in deltas) / len(clients),
+        'frames': sum(delta[1] for delta in deltas) / len(clients),
+        'events': sum(delta[2] for delta in deltas) / len(clients),
+        'consistent': consistent,
+    }
+
+
+def main(sessions: int = 150, clients_count: int = 300, changes: int = 20000):
+    logger.remove()  # Debug logging of every event would dominate
+    logger.add(sys.stderr, level='WARNING')
+
+    backend = SimulatedBackend(sessions)
+    controller = BenchmarkAudioController(WebSocketTransport, backend=backend)
+    main_thread = threading.Thread(target=controller.start_blocking, daemon=True)
+    main_thread.start()
+
+    print(f'sessions: {sessions}, clients: {clients_count}, volume changes: {changes}')
+    for deflate in (False, True):
+        result = run(backend, clients_count, deflate, changes)
+        print(f'deflate {"on " if deflate else "off"} ({result["deflate"]} clients): '
+              f'connected and got state in {result["state_seconds"]:.2f} s, '
+              f'storm delivered in {result["storm_seconds"]:.2f} s, per client {result["bytes"]:.0f} bytes, '
+              f'{result["frames"]:.0f} frames, {result["events"]:.0f} events, '
+              f'{result["consistent"]} of {clients_count} clients consistent')
+
+    controller.running = False
+    main_thread.join(2)
+    controller.pre_shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""
+Compares json and binary wire formats: bytes per event and encode/decode throughput.
+Encoding is measured on fresh events, so the per-event cache isn't hit.
+Run from the repository root: python -m benchmarks.wire_formats
+"""
+import time
+
+import Events
+
+
+def measure(label: str, func, count: int) -> None:
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    print(f'  {label}: {count / elapsed / 1e6:.2f} M events/s')
+
+
+def main(count: int = 200000):
+    server_events = {
+        'VolumeChanged': lambda i: Events.VolumeChanged(i, i % 101),
+        'MuteStateChanged': lambda i: Events.MuteStateChanged(i, i % 2 == 0),
+        'SetName': lambda i: Events.SetName(i, 'Mozilla Firefox'),
+    }
+    for name, factory in server_events.items():
+        sample = factory(12345)
+        print(f'{name}: json {len(Events.encode_event(sample))} B, binary {len(Events.encode_event_binary(sample))} B')
+        events = [factory(i) for i in range(count)]
+        measure('json encode', lambda: [Events.encode_event(event) for event in events], count)
+        events = [factory(i) for i in range(count)]
+        measure('binary encode', lambda: [Events.encode_event_binary(event) for event in events], count)
+
+    commands = [Events.VolumeIncrement(i, i % 11 - 5) for i in range(count)]
+    json_lines = [Events.encode_event(command).rstrip(b'\n') for command in commands]  # noqa
+    binary = b''.join(Events.encode_event_binary(command) for command in commands)  # noqa
+    print(f'VolumeIncrement: json {len(json_lines[0]) + 1} B, binary {len(binary) // count} B')
+    measure('json decode', lambda: Events.decode_client_events(json_lines), count)
+    measure('binary decode', lambda: list(Events.decode_events_binary(binary)), count)
+
+
+if __name__ == '__main__':
+    main()
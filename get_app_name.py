@@ -1,9 +1,6 @@
 import ctypes
 from ctypes import wintypes as w
 import array
-from functools import lru_cache
-from psutil import Process
-import traceback
 
 
 ver = ctypes.WinDLL('version')
@@ -46,13 +43,3 @@ def get_file_description(filepath: str) -> str:
         raise RuntimeError('VerQueryValueW failed to find file version')
 
     return ctypes.wstring_at(buf.value, length.value - 1)
-
-
-@lru_cache
-def get_app_name(app_process: Process) -> str:
-    try:
-        return get_file_description(app_process.exe())
-
-    except Exception:
-        traceback.print_exc()
-        return app_process.name()
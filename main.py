@@ -23,25 +23,23 @@ class InterceptHandler(logging.Handler):
 
 logging.basicConfig(handlers=[InterceptHandler()])
 
-from pycaw.pycaw import AudioUtilities
 import AudioController
+from NetworkTransport import NetworkTransport
+from WebSocketTransport import WebSocketTransport
+from LocalTransport import LocalTransport
 
 
-mgr = AudioUtilities.GetAudioSessionManager()
+transports = [NetworkTransport, WebSocketTransport]
+if LocalTransport.available:
+    transports.append(LocalTransport)
 
-audio_controller = AudioController.AudioController()
+audio_controller = AudioController.AudioController(transports)
 
 signal.signal(signal.SIGTERM, audio_controller.shutdown_callback)
 signal.signal(signal.SIGINT, audio_controller.shutdown_callback)
 
-callback = AudioController.SessionCreateCallback(audio_controller)
-
-mgr.RegisterSessionNotification(callback)
-mgr.GetSessionEnumerator()
-
 audio_controller.start_blocking()
 
-mgr.UnregisterSessionNotification(callback)
 audio_controller.pre_shutdown()
 
 logger.trace(f'Shutdown completed')